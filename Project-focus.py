@@ -2,17 +2,49 @@ import sys
 import ctypes
 import os
 import json
+import csv
+import uuid
+import bisect
+import hashlib
+import io
+import re
 import pygame
 import cv2
+import numpy as np
 from PIL import Image as PILImage
+try:
+    import mutagen  # теги и длительность треков; без него библиотека знает только размер и mtime
+except ImportError:
+    mutagen = None
+try:
+    import soundfile  # чтение OGG кусками для потоковых шумов; без него шум декодируется в память целиком
+except ImportError:
+    soundfile = None
+import threading
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
 import math
-from PyQt5.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint, QMimeData
-from PyQt5.QtGui import QPixmap, QIcon, QFont, QImage, QDrag, QPainter, QColor
+import time
+import wave
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from PyQt5 import sip
+from PyQt5.QtCore import (
+    Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint, QMimeData,
+    QObject, QRunnable, QThreadPool, QElapsedTimer, QDateTime, QFileSystemWatcher, pyqtSignal,
+    QAbstractTableModel, QAbstractListModel, QModelIndex, QEvent
+)
+from PyQt5.QtGui import (
+    QPixmap, QIcon, QFont, QImage, QImageReader, QDrag, QPainter, QPen, QColor, QTextCursor, QTextFormat
+)
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
     QFrame, QScrollArea, QTextEdit, QLineEdit, QSlider, QGridLayout,
     QShortcut, QSpinBox, QMessageBox, QListWidget, QListWidgetItem,
-    QAbstractItemView, QSizePolicy, QDialog, QColorDialog
+    QAbstractItemView, QSizePolicy, QDialog, QColorDialog, QProgressDialog, QFileDialog,
+    QComboBox, QInputDialog, QMenu, QDateTimeEdit, QTableView, QListView, QHeaderView, QStyledItemDelegate, QStyle
 )
 
 # --- Настройки ---
@@ -36,6 +68,54 @@ KANBAN_FILE = os.path.join(DATA_DIR, "kanban.json")
 LANGUAGE_FILE = os.path.join(DATA_DIR, "language.json")
 BACKGROUND_FILE = os.path.join(DATA_DIR, "background.json")
 KANBAN_COLUMNS_FILE = os.path.join(DATA_DIR, "kanban_columns.json")
+FILE_PATHS_FILE = os.path.join(DATA_DIR, "file_paths.json")
+TASKS_JOURNAL_FILE = os.path.join(DATA_DIR, "tasks.journal")
+THUMBNAILS_DIR = os.path.join(DATA_DIR, "thumbnails")
+ARCHIVE_FILE = os.path.join(DATA_DIR, "tasks.archive")
+ARCHIVE_SETTINGS_FILE = os.path.join(DATA_DIR, "archive.json")
+ARCHIVE_AFTER_DAYS = 14
+ARCHIVE_PAGE_SIZE = 50
+ARCHIVE_CHECK_INTERVAL_MS = 60 * 60 * 1000
+EVENTS_FILE = os.path.join(DATA_DIR, "task_events.bin")
+EVENTS_TASKS_FILE = os.path.join(DATA_DIR, "task_events_ids.txt")
+EVENTS_COLUMNS_FILE = os.path.join(DATA_DIR, "task_events_columns.json")
+BOARDS_FILE = os.path.join(DATA_DIR, "boards.json")
+BOARDS_DIR = os.path.join(DATA_DIR, "boards")
+DEFAULT_BOARD_ID = "default"  # основная доска живёт прямо в data/
+ANALYTICS_DAYS = 30
+REMINDER_TICK_MS = 1000
+REMINDER_TOAST_MS = 6000
+REMINDER_OFFSETS = [0, 15 * 60, 60 * 60, 24 * 60 * 60]  # за сколько секунд до срока напоминать
+LIBRARY_FILE = os.path.join(DATA_DIR, "library.json")
+LIBRARY_SETTINGS_FILE = os.path.join(DATA_DIR, "library_settings.json")
+AUDIO_SETTINGS_FILE = os.path.join(DATA_DIR, "audio.json")
+LIBRARY_FILTER_DELAY_MS = 150
+LIBRARY_WARM_UP_DELAY_MS = 2000
+DEFAULT_PLAYLIST_NAME = "Main"
+NOISE_NAMES = ["tv", "fire", "wind", "rain", "pink", "brown", "white"]
+NOISE_UNLOAD_DELAY_MS = 60000             # выключенный шум освобождает память через минуту
+NOISE_STREAM_MIN_BYTES = 512 * 1024       # файлы меньше играют целиком из памяти
+NOISE_CHUNK_SECONDS = 2
+NOISE_BUFFER_CHUNKS = 3
+NOISE_SAVE_DELAY_MS = 1000
+AMBIENT_CHANNEL = 0                       # все шумы сведены в один поток на этом канале
+TIMER_END_CHANNEL = 1
+AMBIENT_BLOCK_SECONDS = 0.2
+AMBIENT_FEED_INTERVAL_MS = 60
+AMBIENT_RAMP_SECONDS = 0.02               # рампа, когда громкость меняется посреди уже переданного звука
+LOUDNESS_TARGET_LUFS = -16.0              # pygame умеет только приглушать: тише цели трек играет как есть
+LOUDNESS_MIN_GAIN = 0.25
+GAPLESS_GAIN_TOLERANCE = 0.9              # следующий трек встаёт в очередь pygame, если его множитель громкости не ниже текущего × 0.9 (≈ −1 дБ)
+LOUDNESS_START_DELAY_MS = 10000
+VISUALIZER_FPS = 30
+VISUALIZER_MIN_FPS = 8
+VISUALIZER_CPU_BUDGET = 0.03              # доля одного ядра; при перерасходе визуализатор снижает fps
+MUSIC_EXTENSIONS = ('.ogg', '.mp3', '.wav')
+TASK_MIME_TYPE = "application/x-focus-task-id"
+KANBAN_COLUMN_WIDTH = 240
+KANBAN_COLUMN_SPACING = 15
+BATCH_PROGRESS_THRESHOLD = 50
+BATCH_PROGRESS_INTERVAL_MS = 100
 
 # Создаем файлы, если их нет
 for file_path in [TASKS_FILE, NOTES_FILE, NOISES_FILE, PLAYLIST_FILE, PLAYER_STATE_FILE, KANBAN_FILE]:
@@ -59,8 +139,7 @@ if not os.path.exists(KANBAN_COLUMNS_FILE):
         json.dump(default_columns, f, indent=2)
 
 # --- Звук ---
-pygame.mixer.init()
-pygame.init()
+# Микшер запускает AudioSystem при первом обращении к звуку
 SOUND_PATHS = {
     "tv": "sounds/tv.ogg",
     "fire": "sounds/fire.ogg",
@@ -68,16 +147,6 @@ SOUND_PATHS = {
     "rain": "sounds/rain.ogg",
     "timer_end": "sounds/timer_end.ogg"
 }
-sounds = {}
-channels = {}
-for name, path in SOUND_PATHS.items():
-    if os.path.exists(path):
-        try:
-            sounds[name] = pygame.mixer.Sound(path)
-            channels[name] = pygame.mixer.Channel(list(SOUND_PATHS.keys()).index(name))
-            print(f"✅ Sound loaded: {name}")
-        except Exception as e:
-            print(f"❌ Failed to load sound {name}: {e}")
 
 # --- Видео ---
 VIDEO_PATH = None
@@ -96,10 +165,33 @@ class FloatingFocusApp(QWidget):
         self.setAcceptDrops(True)
         self.drag_pos = None
         self.notes_data = []
-        self.track_list = []
-        self.current_index = 0
+        self.playlists = []                  # именованные плейлисты
+        self.playlist = Playlist(DEFAULT_PLAYLIST_NAME)  # текущий плейлист
+        self.play_queue = deque()            # «играть следующим» — раньше продолжения плейлиста
+        self.current_track = None
+        self.playlist_cursor = None          # трек плейлиста, от которого продолжается воспроизведение
+        self.queued_track = None             # трек, уже стоящий в очереди pygame за текущим
+        self.pending_track = None            # (путь, позиция) — ждёт предзагрузки, чтобы начать играть
+        self.track_preloader = TrackPreloader(self)
+        self.track_preloader.ready.connect(self.on_track_preloaded)
         self.is_playing = False
-        self.noises_volumes = {"tv": 0, "fire": 0, "wind": 0, "rain": 0}
+        self.noises_volumes = {name: 0 for name in NOISE_NAMES}
+        self.audio = AudioSystem(AUDIO_SETTINGS_FILE)
+        # События звука: очередь SDL опрашивается, только пока что-то играет
+        self.audio_events = AudioEvents(self)
+        self.audio_events.music_finished.connect(self.handle_music_end)
+        self.ambient_mixer = AmbientMixer(AMBIENT_CHANNEL, self.audio.probe, self)
+        for name in NOISE_NAMES:
+            # Запись, если она есть, иначе процедурный генератор того же шума
+            path = SOUND_PATHS.get(name)
+            if path and os.path.exists(path):
+                self.ambient_mixer.add_layer(name, NoiseLayer(path))
+            elif name in NoiseGenerator.KINDS:
+                self.ambient_mixer.add_layer(name, NoiseGenerator(name))
+        self.noise_save_timer = QTimer()
+        self.noise_save_timer.setSingleShot(True)
+        self.noise_save_timer.setInterval(NOISE_SAVE_DELAY_MS)
+        self.noise_save_timer.timeout.connect(self.save_noise_volumes)
         self.work_time = 25 * 60
         self.break_time = 5 * 60
         self.current_time = self.work_time
@@ -109,6 +201,35 @@ class FloatingFocusApp(QWidget):
         self.background_files = []
         self.background_index = 0
         self.current_track_position = 0.0
+        self.visualizer_enabled = False
+        self.thumbnails = ThumbnailService(THUMBNAILS_DIR)
+        self.library = MusicLibrary(LIBRARY_FILE, self.load_library_roots())
+        self.library.changed.connect(self.on_library_changed)
+        self.library.renamed.connect(self.on_library_renamed)
+        self.loudness = LoudnessAnalyzer(self)
+        self.loudness.analyzed.connect(self.on_loudness_analyzed)
+        self._batch_depth = 0
+        self._columns_before = None  # конфигурация колонок до текущей транзакции
+        self.history = UndoHistory()
+        self.boards = self.load_board_index()
+        self.board_dir = self.board_directory(self.boards["current"])
+        self.archive = TaskArchive(self.board_file(ARCHIVE_FILE))
+        self.archive_after_days = self.load_archive_settings()
+        self.archive_timer = QTimer()
+        self.archive_timer.timeout.connect(self.archive_done_tasks)
+        # --- Напоминания: одно колесо таймеров и один тик в секунду, пока есть что ждать ---
+        self.reminders = TimerWheel(time.time())
+        self.reminder_timer = QTimer()
+        self.reminder_timer.timeout.connect(self.fire_reminders)
+        # --- Поиск ---
+        self.notes_index = SearchIndex()
+        self.search_query = ""
+        self.search_hits = {}
+        self.kanban_cards = {}  # id задачи -> карточка на доске
+        self.todo_rows = {}     # id задачи -> строка to-do списка
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.run_search)
         # --- Загрузка данных ---
         self.load_data()
         # --- UI ---
@@ -117,6 +238,7 @@ class FloatingFocusApp(QWidget):
         self.current_language = "ru"
         self.load_translations()
         self.load_data()
+        self.load_task_events()
         self.load_icons()
         self.init_ui()
         # --- Инициализация таймера для видеофона ---
@@ -127,14 +249,10 @@ class FloatingFocusApp(QWidget):
         # --- Запуск шумов ---
         self.start_permanent_noises()
         # --- Воспроизведение последнего трека ---
-        if hasattr(self, 'last_played_track') and self.last_played_track:
-            if self.last_played_track in self.track_list:
-                self.current_index = self.track_list.index(self.last_played_track)
-                self.update_track_label()
-            else:
-                self.current_index = 0
-        else:
-            self.current_index = 0
+        if getattr(self, 'last_played_track', None) in self.playlist:
+            self.current_track = self.playlist_cursor = self.last_played_track
+            self.update_track_label()
+            self.highlight_current_track()
         self.update_timer_display()
         self.radial_menu_open = False
         self.radial_buttons = []
@@ -143,21 +261,43 @@ class FloatingFocusApp(QWidget):
         self.setup_kanban_panel()
         self.setup_noises_panel()
         self.refresh_kanban_board()
+        self.archive_done_tasks()
+        self.archive_timer.start(ARCHIVE_CHECK_INTERVAL_MS)
+        self.rebuild_reminders()
         # --- ИНИЦИАЛИЗАЦИЯ РАДИАЛЬНОГО МЕНЮ НАСТРОЕК ---
         self.setup_settings_radial_menu()
         self.set_language(self.current_language)
         # --- Глобальный хоткей для паузы/воспроизведения на пробел ---
         self.shortcut_play_pause = QShortcut(" ", self)
         self.shortcut_play_pause.activated.connect(self.play_pause)
-        self.pygame_timer = QTimer()
-        self.pygame_timer.timeout.connect(self.check_pygame_events)
-        self.pygame_timer.start(100)
+        # --- Отмена и повтор изменений задач ---
+        self.shortcut_undo = QShortcut("Ctrl+Z", self)
+        self.shortcut_undo.activated.connect(self.undo)
+        self.shortcut_redo = QShortcut("Ctrl+Y", self)
+        self.shortcut_redo.activated.connect(self.redo)
+        self.shortcut_redo_alt = QShortcut("Ctrl+Shift+Z", self)
+        self.shortcut_redo_alt.activated.connect(self.redo)
 
-    def check_pygame_events(self):
-        """Проверяет события pygame (например, окончание трека) и обрабатывает их."""
-        for event in pygame.event.get():
-            if event.type == pygame.USEREVENT + 1:  # Событие окончания музыки
-                self.handle_music_end()
+    def ensure_audio(self):
+        """Запускает микшер при первом обращении к звуку; False — звук недоступен."""
+        if self.audio.started:
+            return True
+        if not self.audio.start():
+            return False
+        self.audio_events.start()
+        if "timer_end" in self.audio.channels:
+            self.audio_events.watch_channel(self.audio.channels["timer_end"])
+        self.apply_music_volume()
+        return True
+
+    def play_sound(self, name):
+        self.audio.probe.mark(name)
+        if not self.ensure_audio() or name not in self.audio.sounds:
+            self.audio.probe.pending.pop(name, None)
+            return
+        self.audio.channels[name].play(self.audio.sounds[name])
+        self.audio.probe.heard(name, time.monotonic())
+        self.audio_events.activate()
 
     def load_translations(self):
         """Загружает все файлы локализации из папки `locales`."""
@@ -175,11 +315,9 @@ class FloatingFocusApp(QWidget):
 
     def start_permanent_noises(self):
         """Запускает шумы, если громкость > 0"""
-        for name in self.noises_volumes:
-            if self.noises_volumes[name] > 0 and name in sounds:
-                vol = self.noises_volumes[name] / 100
-                channels[name].play(sounds[name], loops=-1)
-                sounds[name].set_volume(vol)
+        for name in self.ambient_mixer.layers:
+            if self.noises_volumes.get(name, 0) > 0 and self.ensure_audio():
+                self.ambient_mixer.set_volume(name, self.noises_volumes[name] / 100)
 
     def load_icons(self):
         icon_map = {
@@ -428,8 +566,7 @@ class FloatingFocusApp(QWidget):
             self.timer.stop()
             self.timer_running = False
             self.play_btn.setIcon(QIcon(self.ICONS["play"]))
-            if "timer_end" in sounds:
-                channels["timer_end"].play(sounds["timer_end"])
+            self.play_sound("timer_end")
             self.current_time = self.break_time
             self.update_timer_display()
 
@@ -474,6 +611,19 @@ class FloatingFocusApp(QWidget):
         self.track_label = QLabel("🎵 Player")
         self.track_label.setStyleSheet("color: white;")
         layout.addWidget(self.track_label)
+        tr = self.translations.get(self.current_language, {})
+        self.spectrum_widget = SpectrumWidget(lambda: SpectrumSource(self.spectrum_music_position, self.ambient_mixer.recent_block))
+        self.spectrum_widget.cpu_text = tr.get("visualizer_cpu", "Visualizer CPU: {load:.1f}%")
+        self.spectrum_widget.setVisible(self.visualizer_enabled)
+        layout.addWidget(self.spectrum_widget)
+        self.visualizer_btn = QPushButton("📊")
+        self.visualizer_btn.setCheckable(True)
+        self.visualizer_btn.setChecked(self.visualizer_enabled)
+        self.visualizer_btn.setFixedSize(28, 28)
+        self.visualizer_btn.setToolTip(tr.get("visualizer_tooltip", "Spectrum visualizer"))
+        self.visualizer_btn.setStyleSheet("background: rgba(255,255,255,0); color: white; border-radius: 12px;")
+        self.visualizer_btn.toggled.connect(self.set_visualizer_enabled)
+        layout.addWidget(self.visualizer_btn)
         vol_label = QLabel()
         pixmap = self.ICONS.get("volume")
         if pixmap:
@@ -488,8 +638,7 @@ class FloatingFocusApp(QWidget):
         self.music_volume.setRange(0, 100)
         self.music_volume.setValue(50)
         self.music_volume.setFixedWidth(100)
-        self.music_volume.valueChanged.connect(lambda v: pygame.mixer.music.set_volume(v / 100))
-        pygame.mixer.music.set_volume(0.7)
+        self.music_volume.valueChanged.connect(self.apply_music_volume)
         self.music_volume.setStyleSheet("""
             QSlider {
                 height: 30px;
@@ -510,68 +659,183 @@ class FloatingFocusApp(QWidget):
             }
         """)
         layout.addWidget(self.music_volume)
-        pygame.mixer.music.set_endevent(pygame.USEREVENT + 1)
 
     def play_pause(self):
-        if not self.track_list:
+        if not self.ensure_audio():
             return
-        path = self.track_list[self.current_index]
+        path = self.current_track
+        if path is None:
+            if not len(self.playlist):
+                return
+            path = self.current_track = self.playlist_cursor = self.playlist.path_at(0)
         if not os.path.exists(path):
             return
         if self.is_playing:
-            self.current_track_position = pygame.mixer.music.get_pos() / 1000.0
+            self.current_track_position = self.music_position()
             pygame.mixer.music.pause()
             self.is_playing = False
             self.play_btn_player.setIcon(QIcon(self.ICONS["play"]))
-        else:
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.play(start=self.current_track_position)
-            else:
-                try:
-                    pygame.mixer.music.load(path)
-                    pygame.mixer.music.play(start=self.current_track_position)
-                except Exception as e:
-                    print(f"Ошибка воспроизведения: {e}")
-                    return
+        elif pygame.mixer.music.get_busy():
+            pygame.mixer.music.play(start=self.current_track_position)
+            self.audio_events.activate()
             self.is_playing = True
             self.play_btn_player.setIcon(QIcon(self.ICONS["pause"]))
+        else:
+            self.play_track(path, self.current_track_position)
+            return
         self.update_track_label()
+        self.highlight_current_track()
+
+    def music_position(self):
+        """Позиция в текущем треке, с: старт последнего play() плюс время, прошедшее с него."""
+        return self.current_track_position + max(0, pygame.mixer.music.get_pos()) / 1000.0
+
+    def spectrum_music_position(self):
+        # Вызывается из потока визуализатора — только чтение атрибутов
+        path = self.current_track
+        if not self.is_playing or path is None:
+            return None
+        return path, self.music_position()
+
+    def set_visualizer_enabled(self, enabled):
+        self.visualizer_enabled = enabled
+        self.spectrum_widget.setVisible(enabled)
+        self.save_playlists()
 
     def update_track_label(self):
-        if self.track_list:
-            name = os.path.basename(self.track_list[self.current_index])
-            name = os.path.splitext(name)[0].replace('_', ' ')
+        if self.current_track:
+            name = self.track_display_name(self.current_track)
             self.track_label.setText(name[:30] + "..." if len(name) > 30 else name)
 
-    def prev_track(self):
-        if not self.track_list:
+    def playlist_step(self, step):
+        """Соседний трек плейлиста относительно того, что играл последним (по кругу)."""
+        if not len(self.playlist):
+            return None
+        if self.playlist_cursor in self.playlist:
+            index = (self.playlist.position(self.playlist_cursor) + step) % len(self.playlist)
+        else:
+            index = 0
+        return self.playlist.path_at(index)
+
+    def play_track(self, path, start=0.0):
+        """Запускает трек; если файл ещё не в памяти, читает его в фоне и стартует по готовности."""
+        if not self.ensure_audio():
             return
-        self.current_index = (self.current_index - 1) % len(self.track_list)
+        if self.track_preloader.is_ready(path):
+            self.start_track(path, start)
+        else:
+            self.pending_track = (path, start)
+            self.track_preloader.request(path)
+
+    def start_track(self, path, start=0.0):
+        self.pending_track = None
+        # Поправка громкости трека должна действовать с первого кадра, до play()
+        previous, self.current_track = self.current_track, path
+        self.apply_music_volume()
         try:
-            pygame.mixer.music.load(self.track_list[self.current_index])
-            pygame.mixer.music.play()
-            self.is_playing = True
-            self.play_btn_player.setIcon(QIcon(self.ICONS["pause"]))
-            self.update_track_label()
-            self.current_track_position = 0.0
+            pygame.mixer.music.load(self.track_preloader.source(path), os.path.basename(path))
+            pygame.mixer.music.play(start=start)
         except Exception as e:
-            print(e)
+            print(f"Ошибка воспроизведения: {e}")
+            self.current_track = previous
+            self.apply_music_volume()
+            return
+        self.audio_events.activate()
+        # load() сбрасывает очередь pygame
+        self.queued_track = None
+        self.is_playing = True
+        self.play_btn_player.setIcon(QIcon(self.ICONS["pause"]))
+        self.set_current_track(path, start)
+        self.prepare_next_track()
 
-    def next_track(self):
-        if not self.track_list:
+    def set_current_track(self, path, start=0.0):
+        self.current_track = path
+        self.apply_music_volume()
+        if path in self.playlist:
+            self.playlist_cursor = path
+        self.current_track_position = start
+        self.update_track_label()
+        self.highlight_current_track()
+
+    def upcoming_track(self):
+        """Трек, который заиграет после текущего: сначала очередь «играть следующим», потом плейлист."""
+        if self.play_queue:
+            return self.play_queue[0]
+        return self.playlist_step(1)
+
+    def prepare_next_track(self):
+        """Заранее читает следующий трек и ставит его в очередь pygame — переход будет без паузы."""
+        if not self.is_playing or self.pending_track is not None:
+            return
+        path = self.upcoming_track()
+        if path is None or path == self.queued_track:
+            return
+        if "loudness" not in self.library.tracks.get(path, {"loudness": None}):
+            self.loudness.request(path, urgent=True)
+        if self.track_preloader.is_ready(path):
+            self.queue_next_track(path)
+        else:
+            self.track_preloader.request(path)
+
+    def gapless_allowed(self, path):
+        """Громкость музыки в pygame одна на всё и меняется только из опроса событий, уже после стыка.
+        Поэтому в очередь pygame встаёт только трек, которому не нужна громкость заметно ниже текущей,
+        и только когда его громкость уже измерена; иначе переход идёт обычной загрузкой с громкостью до play()."""
+        if "loudness" not in self.library.tracks.get(path, {"loudness": None}):
+            return False
+        return self.track_gain(path) >= self.track_gain(self.current_track) * GAPLESS_GAIN_TOLERANCE
+
+    def queue_next_track(self, path):
+        if not self.gapless_allowed(path):
             return
-        self.current_index = (self.current_index + 1) % len(self.track_list)
         try:
-            pygame.mixer.music.load(self.track_list[self.current_index])
-            pygame.mixer.music.play()
-            self.is_playing = True
-            self.play_btn_player.setIcon(QIcon(self.ICONS["pause"]))
-            self.update_track_label()
-        except Exception as e:
-            print(e)
+            pygame.mixer.music.queue(self.track_preloader.source(path), os.path.basename(path))
+        except (AttributeError, TypeError, pygame.error) as e:
+            # Старый pygame без очереди или без файловых объектов — переход обычной загрузкой
+            print(f"❌ Music queue error: {e}")
+            return
+        self.queued_track = path
+
+    def on_track_preloaded(self, path):
+        if self.pending_track is not None and self.pending_track[0] == path:
+            self.start_track(*self.pending_track)
+        elif self.is_playing and path == self.upcoming_track() and path != self.queued_track:
+            self.queue_next_track(path)
+
+    def prev_track(self):
+        path = self.playlist_step(-1)
+        if path is not None:
+            self.play_track(path)
+
+    def next_track(self):
+        path = self.take_upcoming_track()
+        if path is not None:
+            self.play_track(path)
+
+    def take_upcoming_track(self):
+        if not self.play_queue:
+            return self.playlist_step(1)
+        path = self.play_queue.popleft()
+        self.playlist_model.refresh_path(path)
+        self.save_playlists()
+        return path
 
     def handle_music_end(self):
-        if self.is_playing and self.track_list:
+        queued, self.queued_track = self.queued_track, None
+        if queued is not None and pygame.mixer.music.get_busy():
+            # pygame уже сам переключился на трек из своей очереди
+            if queued == self.upcoming_track():
+                self.take_upcoming_track()
+                self.set_current_track(queued)
+                self.prepare_next_track()
+                return
+            if not len(self.playlist) and not self.play_queue:
+                # Следующего трека больше нет; stop() пришлёт ещё одно событие — оно уже ничего не сделает
+                self.is_playing = False
+                self.play_btn_player.setIcon(QIcon(self.ICONS["play"]))
+                pygame.mixer.music.stop()
+                return
+        if self.is_playing and (len(self.playlist) or self.play_queue):
             self.next_track()
 
     def setup_noises_button(self):
@@ -647,8 +911,18 @@ class FloatingFocusApp(QWidget):
     def save_notes(self):
         text = self.notes_text.toPlainText()
         self.notes_data = [{"content": line} for line in text.split('\n') if line.strip()]
+        self.update_notes_index()
         self.save_data()
 
+    def update_notes_index(self):
+        """Переиндексирует только изменившиеся строки заметок."""
+        for i, note in enumerate(self.notes_data):
+            self.notes_index.update(i, note.get("content", ""))
+        for i in range(len(self.notes_data), len(self.notes_index)):
+            self.notes_index.discard(i)
+        if self.search_query:
+            self.highlight_note_hits()
+
     def toggle_notes_panel(self):
         if self.notes_panel.isVisible():
             self.notes_panel.hide()
@@ -676,39 +950,73 @@ class FloatingFocusApp(QWidget):
         title = QLabel("         Текущий плейлист")
         title.setStyleSheet("color: white; font-weight: bold;")
         layout.addWidget(title)
-        # === НОВЫЙ: QListWidget вместо вертикального лейаута ===
-        self.playlist_list = QListWidget()
-        self.playlist_list.setStyleSheet("""
-            QListWidget {
+        tr = self.translations.get(self.current_language, {})
+        header = QHBoxLayout()
+        self.playlist_selector = QComboBox()
+        self.playlist_selector.setStyleSheet("""
+            QComboBox {
+                background: rgba(255, 255, 255, 15);
+                color: white;
+                border: 1px solid rgba(255, 255, 255, 40);
+                border-radius: 8px;
+                padding: 4px 8px;
+            }
+        """)
+        self.playlist_selector.activated.connect(self.on_playlist_selected)
+        header.addWidget(self.playlist_selector, 1)
+        delete_playlist_btn = QPushButton("🗑")
+        delete_playlist_btn.setFixedSize(28, 28)
+        delete_playlist_btn.setToolTip(tr.get("playlist_delete_tooltip", "Delete playlist"))
+        delete_playlist_btn.setStyleSheet("background: rgba(255,255,255,0); color: white; border-radius: 12px;")
+        delete_playlist_btn.clicked.connect(self.delete_current_playlist)
+        header.addWidget(delete_playlist_btn)
+        layout.addLayout(header)
+        # Весь плейлист через модель: строки рисуются по мере прокрутки
+        self.playlist_model = PlaylistModel(self.track_display_name, self)
+        self.playlist_model.set_playlist(self.playlist)
+        self.playlist_model.queued = self.play_queue
+        self.playlist_view = QListView()
+        self.playlist_view.setModel(self.playlist_model)
+        self.playlist_model.rowsMoved.connect(lambda *args: self.save_playlists())
+        # Любая правка плейлиста может сменить следующий трек
+        for signal in (self.playlist_model.rowsInserted, self.playlist_model.rowsRemoved,
+                       self.playlist_model.rowsMoved, self.playlist_model.modelReset):
+            signal.connect(lambda *args: self.prepare_next_track())
+        self.playlist_view.setStyleSheet("""
+            QListView {
                 background: rgba(0, 0, 0, 50);
                 color: white;
                 border-radius: 8px;
                 border: 1px solid rgba(100, 100, 150, 100);
                 padding: 5px;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 8px 10px;
                 margin: 2px 0;
                 border-radius: 6px;
                 background: rgba(255, 255, 255, 5);
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background: rgba(20, 200, 195, 30);
                 border: 1px solid rgba(20, 200, 195, 80);
             }
-            QListWidget::item:hover {
+            QListView::item:hover {
                 background: rgba(255, 255, 255, 10);
             }
         """)
-        self.playlist_list.setSelectionMode(QAbstractItemView.SingleSelection)
-        self.playlist_list.setDragDropMode(QAbstractItemView.InternalMove)
-        self.playlist_list.setDefaultDropAction(Qt.MoveAction)
-        self.playlist_list.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
-        self.playlist_list.setMaximumHeight(320)
-        self.playlist_list.setMinimumHeight(180)
-        self.playlist_list.model().rowsMoved.connect(self.on_playlist_reordered)
-        layout.addWidget(self.playlist_list)
-        tr = self.translations.get(self.current_language, {})
+        self.playlist_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.playlist_view.setDragDropMode(QAbstractItemView.InternalMove)
+        self.playlist_view.setDefaultDropAction(Qt.MoveAction)
+        self.playlist_view.setDropIndicatorShown(True)
+        self.playlist_view.setUniformItemSizes(True)
+        self.playlist_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.playlist_view.setMaximumHeight(320)
+        self.playlist_view.setMinimumHeight(180)
+        self.playlist_view.doubleClicked.connect(lambda index: self.play_track(index.data(Qt.UserRole)))
+        self.playlist_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.playlist_view.customContextMenuRequested.connect(self.show_playlist_menu)
+        layout.addWidget(self.playlist_view)
+        self.populate_playlist_selector()
         open_lib_btn = QPushButton(f" {tr.get('library_open_button', 'Открыть библиотеку')}")
         open_lib_btn.setStyleSheet("""
             QPushButton {
@@ -724,7 +1032,7 @@ class FloatingFocusApp(QWidget):
         """)
         open_lib_btn.clicked.connect(self.toggle_library_panel)
         layout.addWidget(open_lib_btn)
-        self.refresh_playlist()
+        self.highlight_current_track()
 
     def toggle_playlist_panel(self):
         if self.playlist_panel.isVisible():
@@ -746,11 +1054,84 @@ class FloatingFocusApp(QWidget):
         self.library_panel.hide()
         layout = QVBoxLayout(self.library_panel)
         layout.setContentsMargins(10, 10, 10, 10)
-        title = QLabel("Библиотека треков")
-        title.setStyleSheet("color: white; font-weight: bold;")
-        layout.addWidget(title)
-        scroll = QScrollArea()
-        scroll.verticalScrollBar().setStyleSheet("""
+        tr = self.translations.get(self.current_language, {})
+        header = QHBoxLayout()
+        self.library_title = QLabel(tr.get("library_title", "Music Library"))
+        self.library_title.setStyleSheet("color: white; font-weight: bold;")
+        header.addWidget(self.library_title)
+        header.addStretch()
+        roots_btn = QPushButton("📁")
+        roots_btn.setFixedSize(28, 28)
+        roots_btn.setToolTip(tr.get("library_roots_tooltip", "Music folders"))
+        roots_btn.setStyleSheet("background: rgba(255,255,255,0); color: white; border-radius: 12px;")
+        roots_btn.clicked.connect(self.edit_library_roots)
+        header.addWidget(roots_btn)
+        layout.addLayout(header)
+        self.library_filter_input = QLineEdit()
+        self.library_filter_input.setPlaceholderText(f"🔍 {tr.get('library_filter_placeholder', 'Filter tracks...')}")
+        self.library_filter_input.setStyleSheet("""
+            QLineEdit {
+                background: rgba(255, 255, 255, 15);
+                color: white;
+                border: 1px solid rgba(255, 255, 255, 40);
+                border-radius: 8px;
+                padding: 6px 10px;
+            }
+        """)
+        self.library_filter_timer = QTimer()
+        self.library_filter_timer.setSingleShot(True)
+        self.library_filter_timer.timeout.connect(lambda: self.library_model.set_filter(self.library_filter_input.text()))
+        self.library_filter_input.textChanged.connect(lambda: self.library_filter_timer.start(LIBRARY_FILTER_DELAY_MS))
+        layout.addWidget(self.library_filter_input)
+        # Таблица рисует только видимые строки — панель открывается сразу и на 100k треков
+        self.library_model = LibraryModel(self.library, self.track_display_name, self)
+        self.library_model.in_playlist = lambda path: path in self.playlist
+        self.library_view = QTableView()
+        self.library_view.setModel(self.library_model)
+        self.library_delegate = LibraryStateDelegate(self.library_view)
+        self.library_delegate.toggled.connect(self.toggle_playlist_entry)
+        self.library_view.setItemDelegateForColumn(LibraryModel.STATE, self.library_delegate)
+        self.library_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.library_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.library_view.setShowGrid(False)
+        self.library_view.setWordWrap(False)
+        self.library_view.setMouseTracking(True)
+        self.library_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.library_view.verticalHeader().hide()
+        self.library_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.library_view.verticalHeader().setDefaultSectionSize(30)
+        header_view = self.library_view.horizontalHeader()
+        header_view.setSectionResizeMode(LibraryModel.STATE, QHeaderView.Fixed)
+        header_view.setSectionResizeMode(LibraryModel.NAME, QHeaderView.Stretch)
+        header_view.setSectionResizeMode(LibraryModel.DURATION, QHeaderView.Fixed)
+        header_view.setSectionResizeMode(LibraryModel.FOLDER, QHeaderView.Fixed)
+        header_view.resizeSection(LibraryModel.STATE, 34)
+        header_view.resizeSection(LibraryModel.DURATION, 60)
+        header_view.resizeSection(LibraryModel.FOLDER, 120)
+        # Индикатор ставим до включения сортировки — модель сортируется один раз
+        header_view.setSortIndicator(LibraryModel.NAME, Qt.AscendingOrder)
+        self.library_view.setSortingEnabled(True)
+        self.library_view.setStyleSheet("""
+            QTableView {
+                background: rgba(0, 0, 0, 50);
+                color: white;
+                border-radius: 8px;
+                border: 1px solid rgba(100, 100, 150, 100);
+            }
+            QTableView::item {
+                padding: 2px 6px;
+            }
+            QTableView::item:hover {
+                background: rgba(255, 255, 255, 10);
+            }
+            QHeaderView::section {
+                background: rgba(255, 255, 255, 10);
+                color: rgba(220, 220, 230, 220);
+                border: none;
+                padding: 4px 6px;
+            }
+        """)
+        self.library_view.verticalScrollBar().setStyleSheet("""
             QScrollBar:vertical {
                 background: rgba(30, 30, 40, 0);
                 width: 16px;
@@ -784,12 +1165,21 @@ class FloatingFocusApp(QWidget):
                 background: none;
             }
         """)
-        self.library_content = QFrame()
-        self.library_layout = QVBoxLayout(self.library_content)
-        scroll.setWidget(self.library_content)
-        scroll.setWidgetResizable(True)
-        layout.addWidget(scroll)
-        self.refresh_library()
+        self.library_view.setMinimumHeight(360)
+        layout.addWidget(self.library_view)
+        self.update_library_headers()
+        self.library.scan()
+        QTimer.singleShot(LIBRARY_WARM_UP_DELAY_MS, self.library_model.warm_up)
+        QTimer.singleShot(LOUDNESS_START_DELAY_MS, self.queue_loudness_analysis)
+
+    def update_library_headers(self):
+        tr = self.translations.get(self.current_language, {})
+        self.library_model.set_headers([
+            "",
+            tr.get("library_column_name", "Name"),
+            tr.get("library_column_duration", "Duration"),
+            tr.get("library_column_folder", "Folder"),
+        ])
 
     def toggle_library_panel(self):
         if self.library_panel.isVisible():
@@ -801,99 +1191,224 @@ class FloatingFocusApp(QWidget):
             if x + 500 > self.width():
                 x = self.width() - 510
             self.library_panel.move(x, y-10)
+            self.library_model.ensure_built()
             self.library_panel.show()
 
-    def refresh_library(self):
-        for i in reversed(range(self.library_layout.count())):
-            item = self.library_layout.itemAt(i)
-            if item:
-                widget = item.widget()
-                if widget:
-                    widget.setParent(None)
-        if not os.path.exists(MUSIC_FOLDER):
-            os.makedirs(MUSIC_FOLDER)
-        files = []
-        for file in os.listdir(MUSIC_FOLDER):
-            if file.lower().endswith(('.ogg', '.mp3', '.wav')):
-                path = os.path.join(MUSIC_FOLDER, file)
-                files.append(path)
-        for path in files:
-            filename = os.path.basename(path)
-            display_name = os.path.splitext(filename)[0].replace('_', ' ')
-            row = QHBoxLayout()
-            lbl = QLabel(display_name)
-            lbl.setStyleSheet("color: white; padding: 2px;")
-            row.addWidget(lbl)
-            row.addStretch()
-            if path not in self.track_list:
-                btn = QPushButton("+")
-                btn.setFixedSize(28, 28)
-                btn.setStyleSheet("background: rgba(255,255,255,0); color: white; border-radius: 12px;")
-                btn.clicked.connect(lambda _, p=path: self.add_to_playlist(p))
-            else:
-                btn = QPushButton("−")
-                btn.setFixedSize(28, 28)
-                btn.setStyleSheet("background: rgba(255,255,255,0); color: white; border-radius: 12px;")
-                btn.clicked.connect(lambda _, p=path: self.remove_from_playlist(p))
-            row.addWidget(btn)
-            frame = QFrame()
-            frame.setLayout(row)
-            self.library_layout.addWidget(frame)
+    def track_display_name(self, path):
+        info = self.library.get(path)
+        if info and info.get("title"):
+            return f"{info['artist']} — {info['title']}" if info.get("artist") else info["title"]
+        return os.path.splitext(os.path.basename(path))[0].replace('_', ' ')
+
+    def update_library_row(self, path):
+        self.library_model.refresh_path(path)
+
+    def on_library_changed(self, updated, removed):
+        self.library_model.apply_changes(updated, removed)
+        for path in updated:
+            if "loudness" not in self.library.tracks.get(path, {}):
+                self.loudness.request(path)
+
+    def queue_loudness_analysis(self):
+        for path, info in self.library.tracks.items():
+            if "loudness" not in info:
+                self.loudness.request(path)
+
+    def on_loudness_analyzed(self, path, loudness):
+        # Громкость играющего трека не меняется на ходу — поправка применится при следующем запуске
+        self.library.set_loudness(path, loudness)
+        if self.is_playing and path == self.upcoming_track() and path != self.queued_track:
+            # Следующий трек ждал замера, чтобы встать в очередь без скачка громкости
+            self.prepare_next_track()
+
+    def track_gain(self, path):
+        """Множитель громкости, выравнивающий трек к LOUDNESS_TARGET_LUFS; без анализа — 1."""
+        loudness = self.library.tracks.get(path, {}).get("loudness")
+        if loudness is None:
+            return 1.0
+        return max(LOUDNESS_MIN_GAIN, min(1.0, 10 ** ((LOUDNESS_TARGET_LUFS - loudness) / 20)))
+
+    def apply_music_volume(self):
+        if not self.audio.started:
+            return
+        pygame.mixer.music.set_volume(self.music_volume.value() / 100 * self.track_gain(self.current_track))
+
+    def on_library_renamed(self, renamed):
+        """Переименованный или перенесённый файл остаётся в плейлистах и очереди под новым путём."""
+        touched = False
+        for playlist in self.playlists:
+            for old_path, new_path in renamed.items():
+                if old_path in playlist:
+                    position = playlist.position(old_path)
+                    playlist.remove(old_path)
+                    if new_path not in playlist:
+                        playlist.insert(new_path, position)
+                    touched = True
+        for i, path in enumerate(self.play_queue):
+            if path in renamed:
+                self.play_queue[i] = renamed[path]
+                touched = True
+        self.current_track = renamed.get(self.current_track, self.current_track)
+        self.playlist_cursor = renamed.get(self.playlist_cursor, self.playlist_cursor)
+        if touched:
+            self.playlist_model.set_playlist(self.playlist)
+            for new_path in renamed.values():
+                self.update_library_row(new_path)
+            self.highlight_current_track()
+            self.save_playlists()
+
+    def load_library_roots(self):
+        try:
+            if os.path.exists(LIBRARY_SETTINGS_FILE):
+                with open(LIBRARY_SETTINGS_FILE, "r", encoding="utf-8") as f:
+                    roots = [root for root in json.load(f).get("roots", []) if isinstance(root, str)]
+                    if roots:
+                        return roots
+        except Exception as e:
+            print(f"❌ Library settings error: {e}")
+        return [MUSIC_FOLDER]
+
+    def save_library_roots(self):
+        try:
+            with open(LIBRARY_SETTINGS_FILE, "w", encoding="utf-8") as f:
+                json.dump({"roots": self.library.roots}, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"❌ Library settings error: {e}")
+
+    def edit_library_roots(self):
+        tr = self.translations.get(self.current_language, {})
+        dialog = QDialog(self)
+        dialog.setWindowTitle(tr.get("library_roots_title", "Music folders"))
+        dialog.resize(420, 300)
+        layout = QVBoxLayout(dialog)
+        roots_list = QListWidget()
+        roots_list.addItems(self.library.roots)
+        layout.addWidget(roots_list)
+        buttons = QHBoxLayout()
+        add_btn = QPushButton(tr.get("library_roots_add", "Add folder…"))
+        remove_btn = QPushButton(tr.get("library_roots_remove", "Remove"))
+        def add_root():
+            folder = QFileDialog.getExistingDirectory(dialog, tr.get("library_roots_add", "Add folder…"))
+            if folder and not roots_list.findItems(folder, Qt.MatchExactly):
+                roots_list.addItem(folder)
+        add_btn.clicked.connect(add_root)
+        remove_btn.clicked.connect(lambda: roots_list.takeItem(roots_list.currentRow()))
+        buttons.addWidget(add_btn)
+        buttons.addWidget(remove_btn)
+        layout.addLayout(buttons)
+        actions = QHBoxLayout()
+        ok_btn = QPushButton(tr.get("kanban_column_ok_button", "OK"))
+        cancel_btn = QPushButton(tr.get("kanban_column_cancel_button", "Отмена"))
+        ok_btn.clicked.connect(dialog.accept)
+        cancel_btn.clicked.connect(dialog.reject)
+        actions.addWidget(ok_btn)
+        actions.addWidget(cancel_btn)
+        layout.addLayout(actions)
+        if dialog.exec_() == QDialog.Accepted:
+            self.set_library_roots([roots_list.item(i).text() for i in range(roots_list.count())])
+
+    def set_library_roots(self, roots):
+        self.library.set_roots(roots or [MUSIC_FOLDER])
+        self.save_library_roots()
+
+    def toggle_playlist_entry(self, path):
+        if path in self.playlist:
+            self.remove_from_playlist(path)
+        else:
+            self.add_to_playlist(path)
 
     def add_to_playlist(self, path):
-        if path not in self.track_list:
-            self.track_list.append(path)
-            self.refresh_library()
-            self.refresh_playlist()
-            self.save_data()
+        if path not in self.playlist:
+            self.playlist_model.insert_path(path)
+            self.update_library_row(path)
+            self.save_playlists()
 
     def remove_from_playlist(self, path):
-        if path in self.track_list:
-            self.track_list.remove(path)
-            self.refresh_library()
-            self.refresh_playlist()
-            self.save_data()
-
-    def refresh_playlist(self):
-        self.playlist_list.clear()
-        # Берём последние 7 треков (новые — в конце списка), но отображаем их в обратном порядке → новые сверху
-        recent_tracks = self.track_list[-7:] if len(self.track_list) > 7 else self.track_list
-        for path in reversed(recent_tracks):  # ← Важно! Отображаем в обратном порядке
-            filename = os.path.basename(path)
-            display_name = os.path.splitext(filename)[0].replace('_', ' ')
-            item = QListWidgetItem(display_name)
-            item.setData(Qt.UserRole, path)
-            self.playlist_list.addItem(item)
-        # Выделяем текущий трек
-        if self.track_list and self.current_index < len(self.track_list):
-            current_path = self.track_list[self.current_index]
-            for i in range(self.playlist_list.count()):
-                item = self.playlist_list.item(i)
-                if item.data(Qt.UserRole) == current_path:
-                    self.playlist_list.setCurrentRow(i)
-                    break
+        if path in self.playlist:
+            if path == self.playlist_cursor:
+                # Следующим всё равно заиграет трек, стоявший после удалённого
+                position = self.playlist.position(path)
+                self.playlist_cursor = self.playlist.path_at(position - 1) if position > 0 else None
+            self.playlist_model.remove_path(path)
+            self.update_library_row(path)
+            self.save_playlists()
 
-    def on_playlist_reordered(self, parent, start, end, destination, row):
-        new_order = []
-        for i in range(self.playlist_list.count()):
-            item = self.playlist_list.item(i)
-            path = item.data(Qt.UserRole)
-            if path:
-                new_order.append(path)
-        filtered_track_list = [p for p in self.track_list if p in new_order]
-        final_order = []
-        for path in new_order:
-            if path not in final_order:
-                final_order.append(path)
-        self.track_list = final_order
-        if hasattr(self, 'current_index') and self.current_index < len(self.track_list):
-            current_path = self.track_list[self.current_index]
-            self.current_index = self.track_list.index(current_path)
-        self.save_data()
+    def enqueue_track(self, path):
+        self.play_queue.append(path)
+        self.playlist_model.refresh_path(path)
+        self.prepare_next_track()
+        self.save_playlists()
+
+    def highlight_current_track(self):
+        previous, self.playlist_model.current = self.playlist_model.current, self.current_track
+        self.playlist_model.refresh_path(previous)
+        if self.current_track in self.playlist:
+            index = self.playlist_model.index(self.playlist.position(self.current_track))
+            self.playlist_model.dataChanged.emit(index, index)
+            self.playlist_view.setCurrentIndex(index)
+
+    def show_playlist_menu(self, pos):
+        index = self.playlist_view.indexAt(pos)
+        if not index.isValid():
+            return
+        path = index.data(Qt.UserRole)
+        tr = self.translations.get(self.current_language, {})
+        menu = QMenu(self)
+        menu.addAction(tr.get("playlist_menu_play", "▶ Play"), lambda: self.play_track(path))
+        menu.addAction(tr.get("playlist_menu_play_next", "⏭ Play next"), lambda: self.enqueue_track(path))
+        menu.addAction(tr.get("playlist_menu_remove", "Remove from playlist"), lambda: self.remove_from_playlist(path))
+        menu.exec_(self.playlist_view.viewport().mapToGlobal(pos))
+
+    def populate_playlist_selector(self):
+        tr = self.translations.get(self.current_language, {})
+        self.playlist_selector.clear()
+        for playlist in self.playlists:
+            self.playlist_selector.addItem(playlist.name, playlist.name)
+        self.playlist_selector.addItem(tr.get("playlist_new", "+ New playlist..."), None)
+        self.playlist_selector.setCurrentIndex(self.playlists.index(self.playlist))
+
+    def on_playlist_selected(self, index):
+        name = self.playlist_selector.itemData(index)
+        if name is None:
+            tr = self.translations.get(self.current_language, {})
+            name, ok = QInputDialog.getText(self, tr.get("playlist_new_title", "New playlist"),
+                                            tr.get("playlist_new_prompt", "Playlist name:"))
+            name = name.strip()
+            if ok and name and all(playlist.name != name for playlist in self.playlists):
+                self.playlists.append(Playlist(name))
+            else:
+                name = self.playlist.name
+        self.switch_playlist(next(playlist for playlist in self.playlists if playlist.name == name))
+        self.populate_playlist_selector()
+
+    def switch_playlist(self, playlist):
+        if playlist is self.playlist:
+            return
+        self.playlist = playlist
+        self.playlist_cursor = self.current_track if self.current_track in playlist else None
+        self.playlist_model.set_playlist(playlist)
+        self.highlight_current_track()
+        # Состояние «+/−» в библиотеке зависит от текущего плейлиста
+        rows = self.library_model.rowCount()
+        if rows:
+            self.library_model.dataChanged.emit(self.library_model.index(0, 0), self.library_model.index(rows - 1, 0))
+        self.save_playlists()
+
+    def delete_current_playlist(self):
+        if len(self.playlists) < 2:
+            return
+        tr = self.translations.get(self.current_language, {})
+        answer = QMessageBox.question(self, tr.get("playlist_delete_tooltip", "Delete playlist"),
+                                      tr.get("playlist_delete_confirm", "Delete playlist \"{name}\"?").format(name=self.playlist.name))
+        if answer != QMessageBox.Yes:
+            return
+        self.playlists.remove(self.playlist)
+        self.switch_playlist(self.playlists[0])
+        self.populate_playlist_selector()
 
     def setup_noises_panel(self):
         self.noises_panel = DraggableFrame(self)
-        self.noises_panel.setFixedSize(360, 300)
+        self.noises_panel.setFixedSize(360, 490)
         self._panel_color = QColor(30, 30, 40, 0)
         self.update_noises_panel_style()
         main_layout = QVBoxLayout(self.noises_panel)
@@ -905,6 +1420,12 @@ class FloatingFocusApp(QWidget):
         title.setFont(QFont("Segoe UI", 14, QFont.Bold))
         title.setStyleSheet("color: rgba(220, 220, 255, 240);")
         header.addWidget(title)
+        audio_settings_btn = QPushButton("⚙")
+        audio_settings_btn.setFixedSize(28, 28)
+        audio_settings_btn.setToolTip(tr.get("audio_settings_title", "Audio settings"))
+        audio_settings_btn.setStyleSheet("background: rgba(255,255,255,0); color: white; border-radius: 14px; font-size: 16px;")
+        audio_settings_btn.clicked.connect(self.open_audio_settings)
+        header.addWidget(audio_settings_btn)
         close_btn = QPushButton("✕")
         close_btn.setFixedSize(28, 28)
         close_btn.setStyleSheet("""
@@ -925,12 +1446,15 @@ class FloatingFocusApp(QWidget):
         header.addWidget(close_btn)
         main_layout.addLayout(header)
         noises_layout = QVBoxLayout()
-        noises_layout.setSpacing(25)
+        noises_layout.setSpacing(15)
         noises_config = [
             ("tv", "📺", "noise_tv"),
             ("fire", "🔥", "noise_fire"),
             ("wind", "🌬️", "noise_wind"),
-            ("rain", "🌧️", "noise_rain")
+            ("rain", "🌧️", "noise_rain"),
+            ("pink", "🌸", "noise_pink"),
+            ("brown", "🟤", "noise_brown"),
+            ("white", "⚪", "noise_white")
         ]
         self.noise_sliders = {}
         for name, emoji, icon_key in noises_config:
@@ -946,6 +1470,7 @@ class FloatingFocusApp(QWidget):
                 icon_label.setStyleSheet("font-size: 22px; color: white;")
             icon_label.setAlignment(Qt.AlignCenter)
             icon_label.setFixedSize(44, 44)
+            icon_label.setToolTip(tr.get(f"noise_label_{name}", name))
             row_layout.addWidget(icon_label, alignment=Qt.AlignVCenter)
             slider = QSlider(Qt.Horizontal)
             slider.setRange(0, 100)
@@ -1014,7 +1539,7 @@ class FloatingFocusApp(QWidget):
                 x = 20
             if y < 20:
                 y = 20
-            self.noises_panel.move(x, y-125)
+            self.noises_panel.move(x, max(20, y - 125))
         else:
             self.noises_panel.move(self.width() - 400, self.height() - 350)
         self.noises_panel.show()
@@ -1023,17 +1548,59 @@ class FloatingFocusApp(QWidget):
     def hide_noises_panel(self):
         self.noises_panel.hide()
 
+    def open_audio_settings(self):
+        tr = self.translations.get(self.current_language, {})
+        dialog = QDialog(self)
+        dialog.setWindowTitle(tr.get("audio_settings_title", "Audio settings"))
+        layout = QGridLayout(dialog)
+        combos = {}
+        rows = [
+            ("frequency", tr.get("audio_frequency_label", "Sample rate, Hz:"), AudioSystem.FREQUENCIES),
+            ("buffer", tr.get("audio_buffer_label", "Buffer, frames:"), AudioSystem.BUFFERS),
+            ("channels", tr.get("audio_channels_label", "Channels:"), AudioSystem.CHANNELS),
+        ]
+        for row, (key, label, values) in enumerate(rows):
+            layout.addWidget(QLabel(label), row, 0)
+            combo = QComboBox()
+            for value in values:
+                combo.addItem(str(value), value)
+            combo.setCurrentIndex(max(0, combo.findData(self.audio.settings[key])))
+            layout.addWidget(combo, row, 1)
+            combos[key] = combo
+        row = len(rows)
+        # Замеры LatencyProbe: от действия до начала блока, в который оно попало, плюс буфер устройства
+        for kind, label in (("noise", tr.get("audio_latency_noise", "Noise volume → sound:")),
+                            ("timer_end", tr.get("audio_latency_timer", "Timer end → chime:"))):
+            summary = self.audio.probe.summary(kind)
+            if summary is None:
+                text = tr.get("audio_latency_none", "not measured yet")
+            else:
+                text = tr.get("audio_latency_value", "last {last} ms, average {average} ms ({count})").format(
+                    last=int(summary[0] * 1000), average=int(summary[1] * 1000), count=summary[2])
+            layout.addWidget(QLabel(label), row, 0)
+            layout.addWidget(QLabel(text), row, 1)
+            row += 1
+        if self.audio.started:
+            note = QLabel(tr.get("audio_restart_note", "New settings apply after restart."))
+            note.setStyleSheet("color: gray;")
+            layout.addWidget(note, row, 0, 1, 2)
+            row += 1
+        ok_btn = QPushButton(tr.get("kanban_column_ok_button", "OK"))
+        cancel_btn = QPushButton(tr.get("kanban_column_cancel_button", "Отмена"))
+        ok_btn.clicked.connect(dialog.accept)
+        cancel_btn.clicked.connect(dialog.reject)
+        layout.addWidget(ok_btn, row, 0)
+        layout.addWidget(cancel_btn, row, 1)
+        if dialog.exec_() == QDialog.Accepted:
+            self.audio.save_settings({key: combo.currentData() for key, combo in combos.items()})
+
     def set_noise_volume(self, name, value):
         vol = value / 100.0
         self.noises_volumes[name] = int(value)
-        if name in sounds:
-            sounds[name].set_volume(vol)
-            if vol > 0:
-                if not channels[name].get_busy():
-                    channels[name].play(sounds[name], loops=-1)
-            else:
-                channels[name].stop()
-        self.save_data()
+        if name in self.ambient_mixer.layers and (vol == 0 or self.ensure_audio()):
+            self.ambient_mixer.set_volume(name, vol)
+        # Ползунок шлёт значение на каждом шаге — на диск пишется только итог
+        self.noise_save_timer.start()
 
     def create_icon_button(self, pixmap, callback):
         btn = QPushButton(self)
@@ -1221,45 +1788,144 @@ class FloatingFocusApp(QWidget):
         text = self.todo_input.text().strip()
         if not text:
             return
-        for col in self.kanban_columns.keys():
-            if text in self.kanban_data.get(col, []):
-                self.kanban_data[col].remove(text)
-        self.tasks_data.append({"text": text, "completed": False})
-        self.kanban_data["progress"].append(text)
+        self.task_store.add(text, column="progress", todo=True)
         self.todo_input.clear()
-        self.refresh_todo_list()
-        self.refresh_kanban_board()
-        self.save_data()
+        self.commit_changes()
 
-    def remove_todo_task(self, index):
-        if 0 <= index < len(self.tasks_data):
-            del self.tasks_data[index]
-            self.refresh_todo_list()
-            self.save_data()
+    def remove_todo_task(self, task_id):
+        if task_id in self.task_store:
+            self.task_store.set_todo(task_id, False)
+            self.commit_changes()
 
-    def toggle_todo_task(self, index, state):
-        if not (0 <= index < len(self.tasks_data)):
+    def toggle_todo_task(self, task_id, state):
+        if task_id not in self.task_store:
             return
-        task = self.tasks_data[index]
-        task_text = task["text"]
-        task["completed"] = state
-        for col in self.kanban_columns.keys():
-            if task_text in self.kanban_data.get(col, []):
-                self.kanban_data[col].remove(task_text)
-        if state:
-            self.kanban_data["done"].append(task_text)
+        self.task_store.set_completed(task_id, state)
+        self.task_store.move(task_id, "done" if state else "progress")
+        self.commit_changes()
+
+    def move_task_to_column(self, task_id, column_key, index=None):
+        """Переносит задачу в колонку и синхронизирует её статус в to-do списке."""
+        store = self.task_store
+        store.move(task_id, column_key, index)
+        if column_key != "done":
+            store.set_done_at(task_id, None)
+        elif store.get(task_id).get("done_at") is None:
+            store.set_done_at(task_id, int(time.time()))
+        if column_key in ["progress", "done"]:
+            store.set_completed(task_id, column_key == "done")
+            store.set_todo(task_id, True)
         else:
-            self.kanban_data["progress"].append(task_text)
-        self.refresh_todo_list()
-        self.refresh_kanban_board()
-        self.save_data()
+            store.set_todo(task_id, False)
+        self.schedule_rank_rebalance()
+
+    def schedule_rank_rebalance(self):
+        if self.task_store.unbalanced and not getattr(self, '_rebalance_scheduled', False):
+            self._rebalance_scheduled = True
+            QTimer.singleShot(2000, self.rebalance_kanban_ranks)
+
+    def rebalance_kanban_ranks(self):
+        """Фоновая перебалансировка: порядок карточек не меняется, только их ключи."""
+        self._rebalance_scheduled = False
+        # Повтор опирается на текущие ключи — перебалансируем после следующего изменения
+        if self.history.redo_stack:
+            return
+        for column_key in list(self.task_store.unbalanced):
+            self.task_store.rebalance(column_key)
+        self.history.amend(self.task_store.take_undo_record())
+        self.save_tasks()
+
+    # --- Отмена/повтор: та же инкрементальная перерисовка, что и у исходной операции ---
+    def undo(self):
+        self.apply_history(self.history.undo_stack, self.history.redo_stack)
+
+    def redo(self):
+        self.apply_history(self.history.redo_stack, self.history.undo_stack)
+
+    def apply_history(self, source, target):
+        if not source:
+            return
+        command = source.pop()
+        inverse = {"tasks": {}, "columns": None}
+        if command["columns"] is not None:
+            inverse["columns"] = self.read_kanban_columns_config()
+            self.write_kanban_columns_config(command["columns"], record=False)
+            self.apply_kanban_columns_config(command["columns"])
+        inverse["tasks"] = self.task_store.restore(command["tasks"])
+        target.append(inverse)
+        self.record_task_transitions(inverse["tasks"])
+        self.sync_reminders(inverse["tasks"])
+        self.commit_changes()
+
+    # --- Пакетные изменения: одна перерисовка и одно сохранение на транзакцию ---
+    def commit_changes(self):
+        """Перерисовывает только затронутые представления и сохраняет задачи; внутри пакета — откладывает."""
+        if self._batch_depth > 0:
+            return
+        store = self.task_store
+        record = store.take_undo_record()
+        if record or self._columns_before is not None:
+            self.history.push({"tasks": record, "columns": self._columns_before})
+            self._columns_before = None
+            self.record_task_transitions(record)
+            self.sync_reminders(record)
+        if self.search_query and (store.todo_changed or store.changed_columns):
+            self.search_hits = store.search.search(self.search_query)
+        if store.todo_changed:
+            store.todo_changed = False
+            self.refresh_todo_list()
+        if store.changed_columns:
+            columns, store.changed_columns = store.changed_columns, set()
+            self.refresh_kanban_board(columns)
+        self.save_tasks()
+
+    @contextmanager
+    def batch_update(self):
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            self.commit_changes()
+
+    def run_batch(self, items, apply_item, total=None, label="", position=None):
+        """Применяет apply_item к каждому элементу одной транзакцией; для больших пакетов показывает прогресс.
+        position — функция текущего прогресса, если он считается не в элементах (например, в байтах файла)."""
+        progress = None
+        if total is not None and total >= BATCH_PROGRESS_THRESHOLD:
+            progress = QProgressDialog(label, None, 0, total, self)
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(300)
+        done = 0
+        clock = QElapsedTimer()
+        clock.start()
+        with self.batch_update():
+            for done, item in enumerate(items, 1):
+                apply_item(item)
+                # Интерфейс обновляем по времени, а не по числу элементов
+                if progress is not None and clock.elapsed() >= BATCH_PROGRESS_INTERVAL_MS:
+                    clock.restart()
+                    progress.setValue(min(position() if position else done, total))
+                    QApplication.processEvents()
+        if progress is not None:
+            progress.setValue(total)
+            progress.deleteLater()
+        return done
+
+    def save_tasks(self):
+        try:
+            self.task_store.flush(self.board_file(TASKS_FILE), self.board_file(TASKS_JOURNAL_FILE))
+        except Exception as e:
+            print(f"❌ Save error: {e}")
 
     def refresh_todo_list(self):
         while self.todo_layout.count():
             item = self.todo_layout.takeAt(0)
             if item.widget():
                 item.widget().deleteLater()
-        for i, task in enumerate(self.tasks_data):
+        self.todo_rows = {}
+        for task in self.task_store.todo_tasks():
+            task_id = task["id"]
             task_widget = QFrame()
             task_widget.setObjectName("taskFrame")
             task_widget.setStyleSheet("""
@@ -1274,7 +1940,13 @@ class FloatingFocusApp(QWidget):
                     background: rgba(255, 255, 255, 20);
                     border: 1px solid rgba(200, 220, 255, 80);
                 }
+                QFrame#taskFrame[searchHit="true"] {
+                    background: rgba(255, 210, 90, 40);
+                    border: 1px solid rgba(255, 210, 90, 220);
+                }
             """)
+            task_widget.setProperty("searchHit", task_id in self.search_hits)
+            self.todo_rows[task_id] = task_widget
             task_layout = QHBoxLayout(task_widget)
             task_layout.setContentsMargins(10, 8, 10, 8)
             checkbox_container = QPushButton()
@@ -1299,7 +1971,7 @@ class FloatingFocusApp(QWidget):
                     border-radius: 6px;
                 }
             """)
-            checkbox_container.clicked.connect(lambda _, idx=i: self.toggle_todo_task(idx, not self.tasks_data[idx]["completed"]))
+            checkbox_container.clicked.connect(lambda _, t=task_id: self.toggle_todo_task(t, not self.task_store.get(t)["completed"]))
             text_label = QLabel(task["text"])
             text_label.setWordWrap(True)
             text_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
@@ -1314,7 +1986,7 @@ class FloatingFocusApp(QWidget):
             """)
             delete_icon = self.ICONS.get("delete_task")
             if delete_icon:
-                delete_btn = self.create_icon_button(delete_icon, lambda _, idx=i: self.remove_todo_task(idx))
+                delete_btn = self.create_icon_button(delete_icon, lambda _, t=task_id: self.remove_todo_task(t))
                 delete_btn.setFixedSize(28, 28)
                 delete_btn.setStyleSheet("""
                     QPushButton {
@@ -1342,10 +2014,14 @@ class FloatingFocusApp(QWidget):
                         border-radius: 8px;
                     }
                 """)
-                delete_btn.clicked.connect(lambda _, idx=i: self.remove_todo_task(idx))
+                delete_btn.clicked.connect(lambda _, t=task_id: self.remove_todo_task(t))
             task_layout.addWidget(checkbox_container)
             task_layout.addWidget(text_label, 1)
+            due_label = self.create_due_label(task)
+            if due_label is not None:
+                task_layout.addWidget(due_label)
             task_layout.addWidget(delete_btn)
+            self.attach_task_menu(task_widget, task_id)
             self.todo_layout.addWidget(task_widget)
 
     def show_todo_panel(self):
@@ -1381,6 +2057,46 @@ class FloatingFocusApp(QWidget):
         title.setFont(QFont("Segoe UI", 16, QFont.Bold))
         title.setStyleSheet("color: rgba(230, 230, 255, 250);")
         header.addWidget(title)
+        self.board_selector = QComboBox()
+        self.board_selector.setStyleSheet("""
+            QComboBox {
+                background: rgba(255, 255, 255, 25);
+                border: 1px solid rgba(120, 150, 255, 100);
+                border-radius: 10px;
+                color: white;
+                padding: 4px 10px;
+                font-size: 13px;
+            }
+            QComboBox QAbstractItemView {
+                background: rgba(30, 30, 40, 230);
+                color: white;
+                selection-background-color: rgba(100, 140, 255, 180);
+            }
+        """)
+        self.populate_board_selector()
+        self.board_selector.activated.connect(self.on_board_selected)
+        header.addWidget(self.board_selector)
+        tr = self.translations.get(self.current_language, {})
+        self.kanban_search_input = QLineEdit()
+        self.kanban_search_input.setPlaceholderText(f"🔍 {tr.get('kanban_search_placeholder', 'Search...')}")
+        self.kanban_search_input.setClearButtonEnabled(True)
+        self.kanban_search_input.setStyleSheet("""
+            QLineEdit {
+                background: rgba(255, 255, 255, 25);
+                border: 1px solid rgba(120, 150, 255, 100);
+                border-radius: 12px;
+                color: white;
+                padding: 4px 10px;
+                font-size: 13px;
+                selection-background-color: rgba(100, 150, 255, 180);
+            }
+            QLineEdit:focus {
+                border: 1px solid rgba(140, 180, 255, 180);
+                background: rgba(255, 255, 255, 35);
+            }
+        """)
+        self.kanban_search_input.textChanged.connect(lambda _: self.search_timer.start(120))
+        header.addWidget(self.kanban_search_input, 1)
         help_icon = self.ICONS.get("help")
         if help_icon:
             help_btn = self.create_icon_button(help_icon, self.show_kanban_help)
@@ -1450,6 +2166,31 @@ class FloatingFocusApp(QWidget):
             """)
             settings_btn.clicked.connect(self.open_kanban_settings)
         header.addWidget(settings_btn)
+        tr = self.translations.get(self.current_language, {})
+        for text, tooltip_key, tooltip, callback in [
+            ("📥", "kanban_import_tooltip", "Import tasks", self.import_tasks_dialog),
+            ("📤", "kanban_export_tooltip", "Export tasks", self.export_tasks_dialog),
+            ("🗄", "kanban_archive_tooltip", "Archive", self.open_archive_view),
+            ("📊", "kanban_analytics_tooltip", "Analytics", self.open_analytics_panel),
+        ]:
+            transfer_btn = QPushButton(text)
+            transfer_btn.setToolTip(tr.get(tooltip_key, tooltip))
+            transfer_btn.setFixedSize(30, 30)
+            transfer_btn.setStyleSheet("""
+                QPushButton {
+                    background: rgba(80, 120, 200, 0);
+                    color: white;
+                    border-radius: 15px;
+                    font-size: 14px;
+                    border: 1px solid rgba(60, 100, 180, 0);
+                }
+                QPushButton:hover {
+                    background: rgba(100, 140, 255, 0);
+                    border: 1px solid rgba(80, 120, 220, 220);
+                }
+            """)
+            transfer_btn.clicked.connect(callback)
+            header.addWidget(transfer_btn)
         close_icon = self.ICONS.get("close_panel")
         if close_icon:
             close_btn = self.create_icon_button(close_icon, self.hide_kanban_panel)
@@ -1485,39 +2226,30 @@ class FloatingFocusApp(QWidget):
             close_btn.clicked.connect(self.hide_kanban_panel)
         header.addWidget(close_btn)
         main_layout.addLayout(header)
-        self.columns_layout = QHBoxLayout()
-        self.columns_layout.setSpacing(15)
-        self.columns_layout.setAlignment(Qt.AlignLeft)
-        main_layout.addLayout(self.columns_layout)
-        self.kanban_columns = {}
+        # Колонки лежат на горизонтальной ленте; рамки создаются только для видимых колонок
+        self.kanban_board_scroll = KanbanBoardScroll(self)
+        self.kanban_strip = QWidget()
+        self.kanban_strip.setStyleSheet("background: transparent;")
+        self.kanban_board_scroll.setWidget(self.kanban_strip)
+        self.kanban_board_scroll.horizontalScrollBar().valueChanged.connect(lambda _: self.layout_kanban_columns())
+        main_layout.addWidget(self.kanban_board_scroll, 1)
+        self.kanban_columns = {}          # ключ -> рамка, только для созданных (видимых) колонок
+        self.kanban_column_configs = []   # конфигурация всех колонок по порядку
+        self.kanban_column_pool = []      # рамки ушедших с экрана колонок для повторного использования
+        self.kanban_scroll_positions = {}  # ключ -> вертикальная прокрутка колонки
         self.create_kanban_columns_from_settings()
         self.kanban_panel.hide()
 
-    def create_kanban_column(self, title, color, key="custom"):
-        frame = QFrame()
-        frame.setStyleSheet(f"""
-            background-color: rgba({color.red()}, {color.green()}, {color.blue()}, 50);
-            border: 1px solid rgba({color.red()}, {color.green()}, {color.blue()}, 150);
-            border-radius: 2px;
-        """)
+    def create_kanban_column(self):
+        """Пустая рамка колонки; под конкретную колонку её настраивает bind_kanban_column."""
+        frame = QFrame(self.kanban_strip)
         layout = QVBoxLayout(frame)
         layout.setContentsMargins(10, 10, 10, 10)
-        tr = self.translations.get(self.current_language, {})
-        column_key_map = {
-            "To Do": "kanban_column_todo",
-            "In Progress": "kanban_column_progress",
-            "Done": "kanban_column_done"
-        }
-        if key in ["todo", "progress", "done"]:
-            translated_title = tr.get(column_key_map.get(title, ""), title)
-        else:
-            translated_title = title
-        label = QLabel(translated_title)
+        label = QLabel()
         label.setFont(QFont("Segoe UI", 12, QFont.Bold))
-        label.setStyleSheet(f"color: rgba({color.red()}, {color.green()}, {color.blue()}, 255);")
         label.setAlignment(Qt.AlignCenter)
         layout.addWidget(label)
-        container = KanbanDropContainer(self, key)
+        container = KanbanDropContainer(self, None)
         container_layout = QVBoxLayout(container)
         container_layout.setAlignment(Qt.AlignTop)
         container_layout.setSpacing(8)
@@ -1528,14 +2260,40 @@ class FloatingFocusApp(QWidget):
         scroll.setStyleSheet("QScrollArea { border: none; background: transparent; }")
         scroll.viewport().setStyleSheet("background: transparent;")
         frame.list_layout = container_layout
-        frame.column_name = key
         frame.container = container
+        frame.scroll = scroll
+        frame.title_label = label
+        frame.pending_scroll = 0
+        scroll.verticalScrollBar().rangeChanged.connect(lambda *_: self.restore_kanban_column_scroll(frame))
         layout.addWidget(scroll)
         add_task_layout = QHBoxLayout()
         add_task_layout.addStretch()
         add_task_btn = QPushButton("+")
         add_task_btn.setFixedSize(30, 30)
-        add_task_btn.setStyleSheet(f"""
+        add_task_btn.clicked.connect(lambda _: self.show_add_task_input(frame.column_key))
+        frame.add_task_btn = add_task_btn
+        add_task_layout.addWidget(add_task_btn)
+        add_task_layout.addStretch()
+        layout.addLayout(add_task_layout)
+        return frame
+
+    def bind_kanban_column(self, frame, config):
+        key = config.get("key", "unknown")
+        title = config.get("title", key.capitalize())
+        color = QColor(*config.get("color", [100, 100, 100]))
+        frame.column_key = key
+        frame.column_name = key
+        frame.column_title = title
+        frame.column_color = color
+        frame.container.column_name = key
+        frame.setStyleSheet(f"""
+            background-color: rgba({color.red()}, {color.green()}, {color.blue()}, 50);
+            border: 1px solid rgba({color.red()}, {color.green()}, {color.blue()}, 150);
+            border-radius: 2px;
+        """)
+        frame.title_label.setText(self.kanban_column_display_title(key, title))
+        frame.title_label.setStyleSheet(f"color: rgba({color.red()}, {color.green()}, {color.blue()}, 255);")
+        frame.add_task_btn.setStyleSheet(f"""
             QPushButton {{
                 background: rgba({color.red()}, {color.green()}, {color.blue()}, 100);
                 color: white;
@@ -1548,167 +2306,249 @@ class FloatingFocusApp(QWidget):
                 background: rgba({color.red()}, {color.green()}, {color.blue()}, 180);
             }}
         """)
-        add_task_btn.clicked.connect(lambda _, col_key=key: self.show_add_task_input(col_key))
-        add_task_layout.addWidget(add_task_btn)
-        add_task_layout.addStretch()
-        layout.addLayout(add_task_layout)
-        return frame
 
-    def create_kanban_columns_from_settings(self):
+    def write_kanban_columns_config(self, columns_config, record=True):
+        if record and self._columns_before is None:
+            self._columns_before = self.read_kanban_columns_config()
+        with open(self.board_file(KANBAN_COLUMNS_FILE), "w", encoding="utf-8") as f:
+            json.dump(columns_config, f, indent=2)
+
+    def read_kanban_columns_config(self):
+        if not os.path.exists(self.board_file(KANBAN_COLUMNS_FILE)):
+            return [dict(col) for col in default_columns]
         try:
-            with open(KANBAN_COLUMNS_FILE, "r", encoding="utf-8") as f:
-                columns_config = json.load(f)
+            with open(self.board_file(KANBAN_COLUMNS_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
         except Exception as e:
             print(f"Ошибка загрузки настроек колонок: {e}")
-            columns_config = [
-                {"key": "todo", "title": "To Do", "color": [70, 130, 180]},
-                {"key": "progress", "title": "In Progress", "color": [255, 165, 0]},
-                {"key": "done", "title": "Done", "color": [50, 205, 50]}
-            ]
-        while self.columns_layout.count():
-            item = self.columns_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
-        self.kanban_columns = {}
-        for col_config in columns_config:
-            key = col_config.get("key", "unknown")
-            title = col_config.get("title", key.capitalize())
-            color_rgb = col_config.get("color", [100, 100, 100])
-            color = QColor(*color_rgb)
-            column_frame = self.create_kanban_column(title, color, key=key)
-            column_frame.column_key = key
-            column_frame.column_title = title
-            column_frame.column_color = color
-            self.kanban_columns[key] = column_frame
-            self.columns_layout.addWidget(column_frame)
+            return [dict(col) for col in default_columns]
+
+    def kanban_column_display_title(self, key, title):
+        tr = self.translations.get(self.current_language, {})
+        column_key_map = {
+            "To Do": "kanban_column_todo",
+            "In Progress": "kanban_column_progress",
+            "Done": "kanban_column_done"
+        }
+        if key in ["todo", "progress", "done"]:
+            return tr.get(column_key_map.get(title, ""), title)
+        return title
+
+    def apply_kanban_columns_config(self, columns_config):
+        """Применяет новую конфигурацию колонок как разницу со старой: переименование меняет
+        только заголовок, смена цвета — стиль одной рамки, порядок — положение рамок;
+        карточки существующих колонок не пересоздаются."""
+        old = {config.get("key"): config for config in self.kanban_column_configs}
+        new_keys = {config.get("key") for config in columns_config}
+        for key in list(self.kanban_columns):
+            if key not in new_keys:
+                self.release_kanban_column(key)
+                self.kanban_scroll_positions.pop(key, None)
+        for config in columns_config:
+            key = config.get("key")
+            frame = self.kanban_columns.get(key)
+            before = old.get(key)
+            if frame is None or before is None:
+                continue
+            if before.get("color") != config.get("color"):
+                self.bind_kanban_column(frame, config)
+            elif before.get("title") != config.get("title"):
+                frame.column_title = config.get("title", key.capitalize())
+                frame.title_label.setText(self.kanban_column_display_title(key, frame.column_title))
+        self.kanban_column_configs = [dict(config) for config in columns_config]
+        self.adjust_kanban_panel_width()
+
+    def create_kanban_columns_from_settings(self):
+        self.kanban_column_configs = self.read_kanban_columns_config()
+        for key in list(self.kanban_columns):
+            self.release_kanban_column(key)
         self.adjust_kanban_panel_width()
 
     def adjust_kanban_panel_width(self):
-        if not hasattr(self, 'columns_layout') or not self.kanban_columns:
-            return
-        base_width = 40
-        column_width = 240
-        spacing = 15
-        num_columns = len(self.kanban_columns)
-        total_width = base_width + (column_width * num_columns) + (spacing * (num_columns - 1))
-        max_width = self.width() - 40
-        final_width = min(total_width, max_width)
-        for frame in self.kanban_columns.values():
-            frame.setFixedWidth(column_width)
-        self.kanban_panel.setFixedWidth(final_width)
+        if not hasattr(self, 'kanban_board_scroll'):
+            return
+        pitch = KANBAN_COLUMN_WIDTH + KANBAN_COLUMN_SPACING
+        num_columns = len(self.kanban_column_configs)
+        total_width = 40 + max(num_columns * pitch - KANBAN_COLUMN_SPACING, 0)
+        self.kanban_panel.setFixedWidth(max(min(total_width, self.width() - 40), 300))
+        self.layout_kanban_columns()
 
-    def refresh_kanban_board(self):
-        for key in self.kanban_columns.keys():
-            frame = self.kanban_columns[key]
-            layout = frame.list_layout
+    def layout_kanban_columns(self):
+        """Создаёт рамки для колонок в видимой области (плюс по одной с краёв), остальные отдаёт в пул."""
+        if not hasattr(self, 'kanban_board_scroll'):
+            return
+        pitch = KANBAN_COLUMN_WIDTH + KANBAN_COLUMN_SPACING
+        viewport = self.kanban_board_scroll.viewport()
+        height = viewport.height()
+        self.kanban_strip.setFixedSize(max(len(self.kanban_column_configs) * pitch - KANBAN_COLUMN_SPACING, 0), height)
+        left = self.kanban_board_scroll.horizontalScrollBar().value()
+        first = max(0, left // pitch - 1)
+        last = min(len(self.kanban_column_configs) - 1, (left + viewport.width()) // pitch + 1)
+        visible = {}
+        for i in range(first, last + 1):
+            visible[self.kanban_column_configs[i].get("key", "unknown")] = i
+        for key in list(self.kanban_columns):
+            if key not in visible:
+                self.release_kanban_column(key)
+        for key, i in visible.items():
+            frame = self.kanban_columns.get(key)
+            if frame is None:
+                frame = self.kanban_column_pool.pop() if self.kanban_column_pool else self.create_kanban_column()
+                self.bind_kanban_column(frame, self.kanban_column_configs[i])
+                self.kanban_columns[key] = frame
+                frame.setGeometry(i * pitch, 0, KANBAN_COLUMN_WIDTH, height)
+                frame.show()
+                self.refresh_kanban_board([key])
+                # Прокрутку вернём, когда раскладка карточек даст нужный диапазон
+                frame.pending_scroll = self.kanban_scroll_positions.get(key, 0)
+            else:
+                frame.setGeometry(i * pitch, 0, KANBAN_COLUMN_WIDTH, height)
+
+    def restore_kanban_column_scroll(self, frame):
+        scroll_bar = frame.scroll.verticalScrollBar()
+        if frame.pending_scroll and scroll_bar.maximum() >= frame.pending_scroll:
+            scroll_bar.setValue(frame.pending_scroll)
+            frame.pending_scroll = 0
+
+    def release_kanban_column(self, key):
+        """Убирает колонку с экрана: запоминает прокрутку, удаляет карточки, рамку кладёт в пул."""
+        frame = self.kanban_columns.pop(key)
+        self.kanban_scroll_positions[key] = frame.scroll.verticalScrollBar().value()
+        layout = frame.list_layout
+        while layout.count():
+            widget = layout.takeAt(0).widget()
+            if widget:
+                if self.kanban_cards.get(getattr(widget, "task_id", None)) is widget:
+                    del self.kanban_cards[widget.task_id]
+                widget.deleteLater()
+        frame.hide()
+        self.kanban_column_pool.append(frame)
+
+    def refresh_kanban_board(self, columns=None):
+        """Перестраивает карточки колонок; columns — только изменившиеся колонки."""
+        keys = list(self.kanban_columns.keys()) if columns is None else [k for k in columns if k in self.kanban_columns]
+        for key in keys:
+            layout = self.kanban_columns[key].list_layout
             while layout.count():
                 item = layout.takeAt(0)
-                if item.widget():
-                    item.widget().deleteLater()
-        for key in self.kanban_columns.keys():
-            frame = self.kanban_columns[key]
-            layout = frame.list_layout
-            seen = set()
-            for task_text in self.kanban_data.get(key, []):
-                if task_text in seen:
-                    continue
-                seen.add(task_text)
-                task_widget = QFrame()
-                task_widget.setStyleSheet("""
-                    QFrame {
-                        background: rgba(255, 255, 255, 10);
-                        border: 1px solid rgba(255, 255, 255, 30);
-                        border-radius: 10px;
-                        padding: 8px;
-                        margin: 4px 0;
-                    }
-                    QFrame:hover {
-                        background: rgba(255, 255, 255, 20);
-                        border: 1px solid rgba(200, 220, 255, 80);
-                    }
-                """)
-                task_layout = QHBoxLayout(task_widget)
-                task_layout.setContentsMargins(10, 8, 10, 8)
-                if hasattr(self, 'file_paths') and task_text in self.file_paths:
-                    file_path = self.file_paths[task_text]
-                    if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')):
-                        pixmap = QPixmap(file_path)
-                        if not pixmap.isNull():
-                            pixmap = pixmap.scaled(40, 40, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                            image_label = QLabel()
-                            image_label.setPixmap(pixmap)
-                            image_label.setFixedSize(40, 40)
-                            image_label.setStyleSheet("border: 1px solid rgba(255,255,255,50); border-radius: 4px;")
-                            task_layout.addWidget(image_label)
-                    text_label = QLabel(task_text)
-                    text_label.setWordWrap(True)
-                    text_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
-                    text_label.setMinimumWidth(100)
-                    text_label.setMaximumWidth(16777215)
-                    text_label.setWordWrap(True)
-                    text_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
-                    if key == "done":
-                        text_label.setStyleSheet("color: rgba(180, 180, 180, 220); text-decoration: line-through;")
-                    else:
-                        text_label.setStyleSheet("color: white;")
-                    task_layout.addWidget(text_label, 1)
-                else:
-                    text_label = QLabel(task_text)
-                    text_label.setWordWrap(True)
-                    text_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
-                    text_label.setMinimumWidth(100)
-                    text_label.setMaximumWidth(16777215)
-                    text_label.setWordWrap(True)
-                    text_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
-                    if key == "done":
-                        text_label.setStyleSheet("color: rgba(180, 180, 180, 220); text-decoration: line-through;")
-                    else:
-                        text_label.setStyleSheet("color: white;")
-                    task_layout.addWidget(text_label, 1)
-                delete_btn = QPushButton()
-                delete_icon = self.ICONS.get("delete_task")
-                if delete_icon:
-                    delete_btn.setIcon(QIcon(delete_icon))
-                    delete_btn.setIconSize(delete_icon.size())
-                else:
-                    delete_btn.setText("🗑️")
-                    delete_btn.setStyleSheet("font-size: 14px;")
-                delete_btn.setFixedSize(28, 28)
-                delete_btn.setStyleSheet("""
-                    QPushButton {
-                        background: transparent;
-                        border: none;
-                    }
-                    QPushButton:hover {
-                        background: rgba(255, 100, 100, 40);
-                        border-radius: 8px;
-                    }
-                """)
-                delete_btn.clicked.connect(lambda _, t=task_text: self.remove_kanban_task(t))
-                task_widget.task_text = task_text
-                task_widget.startPos = None
-                def make_mouse_events(widget, col_name):
-                    def mousePressEvent(event):
-                        if event.button() == Qt.LeftButton:
-                            widget.startPos = event.pos()
-                        event.accept()
-                    def mouseMoveEvent(event):
-                        if event.buttons() == Qt.LeftButton and widget.startPos:
-                            if (event.pos() - widget.startPos).manhattanLength() > 20:
-                                drag = QDrag(widget)
-                                mime_data = QMimeData()
-                                mime_data.setText(f"{widget.task_text}|{col_name}")
-                                drag.setMimeData(mime_data)
-                                pixmap = QPixmap(widget.size())
-                                widget.render(pixmap)
-                                drag.setPixmap(pixmap)
-                                drag.setHotSpot(event.pos() - widget.rect().topLeft())
-                                drag.exec_(Qt.MoveAction)
-                    widget.mousePressEvent = mousePressEvent
-                    widget.mouseMoveEvent = mouseMoveEvent
-                make_mouse_events(task_widget, key)
-                task_layout.addWidget(delete_btn)
-                layout.addWidget(task_widget)
+                widget = item.widget()
+                if widget:
+                    if self.kanban_cards.get(getattr(widget, "task_id", None)) is widget:
+                        del self.kanban_cards[widget.task_id]
+                    widget.deleteLater()
+            for task in self.task_store.column_tasks(key):
+                card = self.create_kanban_card(task, key)
+                self.kanban_cards[task["id"]] = card
+                layout.addWidget(card)
+
+    def create_kanban_card(self, task, key):
+        task_id = task["id"]
+        task_text = task["text"]
+        task_widget = QFrame()
+        task_widget.setStyleSheet("""
+            QFrame {
+                background: rgba(255, 255, 255, 10);
+                border: 1px solid rgba(255, 255, 255, 30);
+                border-radius: 10px;
+                padding: 8px;
+                margin: 4px 0;
+            }
+            QFrame:hover {
+                background: rgba(255, 255, 255, 20);
+                border: 1px solid rgba(200, 220, 255, 80);
+            }
+            QFrame[searchHit="true"] {
+                background: rgba(255, 210, 90, 40);
+                border: 1px solid rgba(255, 210, 90, 220);
+            }
+        """)
+        task_widget.setProperty("searchHit", task_id in self.search_hits)
+        task_layout = QHBoxLayout(task_widget)
+        task_layout.setContentsMargins(10, 8, 10, 8)
+        if task.get("file_path"):
+            file_path = task["file_path"]
+            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp')):
+                if not self.thumbnails.is_failed(file_path):
+                    image_label = QLabel()
+                    image_label.setPixmap(self.thumbnails.pixmap(file_path, image_label))
+                    image_label.setFixedSize(40, 40)
+                    image_label.setStyleSheet("border: 1px solid rgba(255,255,255,50); border-radius: 4px;")
+                    task_layout.addWidget(image_label)
+            text_label = QLabel(task_text)
+            text_label.setWordWrap(True)
+            text_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
+            text_label.setMinimumWidth(100)
+            text_label.setMaximumWidth(16777215)
+            text_label.setWordWrap(True)
+            text_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+            if key == "done":
+                text_label.setStyleSheet("color: rgba(180, 180, 180, 220); text-decoration: line-through;")
+            else:
+                text_label.setStyleSheet("color: white;")
+            task_layout.addWidget(text_label, 1)
+        else:
+            text_label = QLabel(task_text)
+            text_label.setWordWrap(True)
+            text_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
+            text_label.setMinimumWidth(100)
+            text_label.setMaximumWidth(16777215)
+            text_label.setWordWrap(True)
+            text_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+            if key == "done":
+                text_label.setStyleSheet("color: rgba(180, 180, 180, 220); text-decoration: line-through;")
+            else:
+                text_label.setStyleSheet("color: white;")
+            task_layout.addWidget(text_label, 1)
+        delete_btn = QPushButton()
+        delete_icon = self.ICONS.get("delete_task")
+        if delete_icon:
+            delete_btn.setIcon(QIcon(delete_icon))
+            delete_btn.setIconSize(delete_icon.size())
+        else:
+            delete_btn.setText("🗑️")
+            delete_btn.setStyleSheet("font-size: 14px;")
+        delete_btn.setFixedSize(28, 28)
+        delete_btn.setStyleSheet("""
+            QPushButton {
+                background: transparent;
+                border: none;
+            }
+            QPushButton:hover {
+                background: rgba(255, 100, 100, 40);
+                border-radius: 8px;
+            }
+        """)
+        delete_btn.clicked.connect(lambda _, t=task_id: self.remove_kanban_task(t))
+        task_widget.task_id = task_id
+        task_widget.task_text = task_text
+        task_widget.startPos = None
+        def make_mouse_events(widget, col_name):
+            def mousePressEvent(event):
+                if event.button() == Qt.LeftButton:
+                    widget.startPos = event.pos()
+                event.accept()
+            def mouseMoveEvent(event):
+                if event.buttons() == Qt.LeftButton and widget.startPos:
+                    if (event.pos() - widget.startPos).manhattanLength() > 20:
+                        drag = QDrag(widget)
+                        mime_data = QMimeData()
+                        mime_data.setText(widget.task_text)
+                        mime_data.setData(TASK_MIME_TYPE, widget.task_id.encode("utf-8"))
+                        drag.setMimeData(mime_data)
+                        pixmap = QPixmap(widget.size())
+                        widget.render(pixmap)
+                        drag.setPixmap(pixmap)
+                        drag.setHotSpot(event.pos() - widget.rect().topLeft())
+                        drag.exec_(Qt.MoveAction)
+            widget.mousePressEvent = mousePressEvent
+            widget.mouseMoveEvent = mouseMoveEvent
+        make_mouse_events(task_widget, key)
+        due_label = self.create_due_label(task)
+        if due_label is not None:
+            task_layout.addWidget(due_label)
+        task_layout.addWidget(delete_btn)
+        self.attach_task_menu(task_widget, task_id)
+        return task_widget
 
     def show_kanban_help(self):
         tr = self.translations.get(self.current_language, self.translations.get("ru", {}))
@@ -1743,16 +2583,517 @@ class FloatingFocusApp(QWidget):
     def hide_kanban_panel(self):
         self.kanban_panel.hide()
 
-    def remove_kanban_task(self, task_text):
-        for col in self.kanban_columns.keys():
-            if task_text in self.kanban_data.get(col, []):
-                self.kanban_data[col].remove(task_text)
-        self.tasks_data = [task for task in self.tasks_data if task["text"] != task_text]
-        if hasattr(self, 'file_paths') and task_text in self.file_paths:
-            del self.file_paths[task_text]
+    def remove_kanban_task(self, task_id):
+        self.task_store.remove(task_id)
+        self.commit_changes()
+
+    # ============ ПОИСК ============
+    def run_search(self):
+        """Ищет по индексу и подсвечивает только те карточки и строки, чьё состояние изменилось."""
+        self.search_query = self.kanban_search_input.text().strip()
+        old_hits = self.search_hits
+        self.search_hits = self.task_store.search.search(self.search_query) if self.search_query else {}
+        for task_id in old_hits.keys() ^ self.search_hits.keys():
+            for widget in (self.kanban_cards.get(task_id), self.todo_rows.get(task_id)):
+                if widget is not None and not sip.isdeleted(widget):
+                    widget.setProperty("searchHit", task_id in self.search_hits)
+                    widget.style().unpolish(widget)
+                    widget.style().polish(widget)
+        # Первое совпадение в каждой колонке прокручиваем в видимую область
+        for frame in self.kanban_columns.values():
+            layout = frame.list_layout
+            for i in range(layout.count()):
+                widget = layout.itemAt(i).widget()
+                if widget is not None and getattr(widget, "task_id", None) in self.search_hits:
+                    frame.scroll.ensureWidgetVisible(widget)
+                    break
+        self.highlight_note_hits()
+
+    def highlight_note_hits(self):
+        if not hasattr(self, 'notes_text'):
+            return
+        hits = self.notes_index.search(self.search_query) if self.search_query else {}
+        contents = {self.notes_data[i].get("content", "") for i in hits if i < len(self.notes_data)}
+        selections = []
+        block = self.notes_text.document().begin()
+        while block.isValid():
+            if block.text() in contents:
+                selection = QTextEdit.ExtraSelection()
+                selection.cursor = QTextCursor(block)
+                selection.format.setBackground(QColor(255, 210, 90, 70))
+                selection.format.setProperty(QTextFormat.FullWidthSelection, True)
+                selections.append(selection)
+            block = block.next()
+        self.notes_text.setExtraSelections(selections)
+
+    # ============ ИМПОРТ/ЭКСПОРТ ============
+    def import_tasks_dialog(self):
+        tr = self.translations.get(self.current_language, {})
+        path, _ = QFileDialog.getOpenFileName(
+            self, tr.get("kanban_import_tooltip", "Import tasks"), "",
+            "Tasks (*.csv *.md *.markdown *.txt *.json *.jsonl *.ndjson);;All files (*)")
+        if not path:
+            return
+        try:
+            added, duplicates, invalid = self.import_tasks(path)
+        except Exception as e:
+            QMessageBox.critical(self, tr.get("kanban_import_tooltip", "Import tasks"), str(e))
+            return
+        text = tr.get("kanban_import_result", "Added: {added}, duplicates skipped: {duplicates}, invalid rows: {invalid}")
+        QMessageBox.information(self, tr.get("kanban_import_tooltip", "Import tasks"),
+                                text.format(added=added, duplicates=duplicates, invalid=invalid))
+
+    def import_tasks(self, path, fmt=None):
+        """Импортирует задачи одной транзакцией: проверка, удаление дублей, одна перерисовка."""
+        fmt = fmt or TaskTransfer.detect_format(path)
+        store = self.task_store
+        columns_config = self.read_kanban_columns_config()
+        tr = self.translations.get(self.current_language, {})
+        column_lookup = {}
+        for config in columns_config:
+            key = config["key"]
+            column_lookup[key.lower()] = key
+            column_lookup[config.get("title", key).strip().lower()] = key
+            column_lookup[tr.get(f"kanban_column_{key}", key).strip().lower()] = key
+        keys = set(column_lookup.values())
+        default_column = "todo" if "todo" in keys else columns_config[0]["key"] if columns_config else "todo"
+        new_columns = []
+        counts = {"added": 0, "duplicates": 0, "invalid": 0}
+
+        def resolve_column(name, completed):
+            if not name:
+                return "done" if completed and "done" in keys else default_column
+            key = column_lookup.get(name.lower())
+            if key is None:
+                key = self.generate_unique_column_key(name, {c["key"] for c in columns_config})
+                config = {"key": key, "title": name, "color": [100, 100, 100]}
+                columns_config.append(config)
+                new_columns.append(config)
+                column_lookup[name.lower()] = key
+            return key
+
+        def apply_row(row):
+            text = row["text"]
+            if not isinstance(text, str) or not text.strip():
+                counts["invalid"] += 1
+                return
+            text = text.strip()[:TaskTransfer.MAX_TEXT_LENGTH]
+            column_key = resolve_column(row["column"], row["completed"])
+            if any(store.get(task_id)["column"] == column_key for task_id in store.by_text.get(text, ())):
+                counts["duplicates"] += 1
+                return
+            task_id = store.add(text)
+            self.move_task_to_column(task_id, column_key)
+            if row["completed"] and column_key != "done":
+                store.set_completed(task_id, True)
+            counts["added"] += 1
+
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            total = os.path.getsize(path)
+            with self.batch_update():
+                self.run_batch(TaskTransfer.read(f, fmt), apply_row, total=total,
+                               label=tr.get("kanban_import_progress", "Importing tasks..."),
+                               position=lambda: f.buffer.tell())
+                if new_columns:
+                    self.write_kanban_columns_config(columns_config)
+                    self.apply_kanban_columns_config(columns_config)
+        return counts["added"], counts["duplicates"], counts["invalid"]
+
+    def export_tasks_dialog(self):
+        tr = self.translations.get(self.current_language, {})
+        path, _ = QFileDialog.getSaveFileName(
+            self, tr.get("kanban_export_tooltip", "Export tasks"), "tasks.csv",
+            "CSV (*.csv);;Markdown (*.md);;JSON (*.json)")
+        if not path:
+            return
+        try:
+            self.export_tasks(path)
+        except Exception as e:
+            QMessageBox.critical(self, tr.get("kanban_export_tooltip", "Export tasks"), str(e))
+
+    def export_tasks(self, path, fmt=None):
+        fmt = fmt or TaskTransfer.detect_format(path)
+        store = self.task_store
+
+        def rows():
+            for config in self.read_kanban_columns_config():
+                for task in store.column_tasks(config["key"]):
+                    yield {"text": task["text"], "column": config["key"],
+                           "column_title": config.get("title", config["key"]), "completed": task["completed"]}
+            for task in store.todo_tasks():
+                if task["column"] is None:
+                    yield {"text": task["text"], "column": "", "column_title": "To-Do", "completed": task["completed"]}
+
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            TaskTransfer.write(f, fmt, rows())
+
+    # ============ ДОСКИ ============
+    def load_board_index(self):
+        """При запуске читается только список досок; задачи — лишь у открытой доски."""
+        index = {"current": DEFAULT_BOARD_ID, "boards": [{"id": DEFAULT_BOARD_ID, "title": "Main"}]}
+        try:
+            if os.path.exists(BOARDS_FILE):
+                with open(BOARDS_FILE, "r", encoding="utf-8") as f:
+                    index.update(json.load(f))
+        except Exception as e:
+            print(f"❌ Boards index error: {e}")
+        if not index["boards"]:
+            # Пустой список (правка руками, сбой при удалении) — основная доска в data/ есть всегда
+            index["boards"] = [{"id": DEFAULT_BOARD_ID, "title": "Main"}]
+        if not any(board["id"] == index["current"] for board in index["boards"]):
+            index["current"] = index["boards"][0]["id"]
+        return index
+
+    def save_board_index(self):
+        try:
+            with open(BOARDS_FILE, "w", encoding="utf-8") as f:
+                json.dump(self.boards, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"❌ Boards index error: {e}")
+
+    def board_directory(self, board_id):
+        if board_id == DEFAULT_BOARD_ID:
+            return DATA_DIR
+        path = os.path.join(BOARDS_DIR, board_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def board_file(self, path):
+        """Путь к файлу доски: у основной доски — как раньше в data/, у остальных — в data/boards/<id>/."""
+        if self.board_dir == DATA_DIR:
+            return path
+        return os.path.join(self.board_dir, os.path.basename(path))
+
+    def populate_board_selector(self):
+        tr = self.translations.get(self.current_language, {})
+        self.board_selector.clear()
+        for board in self.boards["boards"]:
+            self.board_selector.addItem(board["title"], board["id"])
+        self.board_selector.addItem(tr.get("kanban_board_new", "+ New board..."), None)
+        ids = [board["id"] for board in self.boards["boards"]]
+        self.board_selector.setCurrentIndex(ids.index(self.boards["current"]))
+
+    def on_board_selected(self, index):
+        board_id = self.board_selector.itemData(index)
+        if board_id is None:
+            tr = self.translations.get(self.current_language, {})
+            title, ok = QInputDialog.getText(self, tr.get("kanban_board_new_title", "New board"),
+                                             tr.get("kanban_board_new_prompt", "Board name:"))
+            if ok and title.strip():
+                board_id = uuid.uuid4().hex[:8]
+                self.boards["boards"].append({"id": board_id, "title": title.strip()})
+            else:
+                board_id = self.boards["current"]
+        self.open_board(board_id)
+        self.populate_board_selector()
+
+    def open_board(self, board_id):
+        """Сохраняет и выгружает задачи текущей доски, затем загружает выбранную."""
+        if board_id == self.boards["current"]:
+            return
+        self.save_tasks()
+        self.boards["current"] = board_id
+        self.save_board_index()
+        self.board_dir = self.board_directory(board_id)
+        self.task_store = self.load_task_store()
+        self.task_store.undo_record = {}
+        self.history = UndoHistory()
+        self._columns_before = None
+        self.archive = TaskArchive(self.board_file(ARCHIVE_FILE))
+        self.load_task_events()
+        self.search_hits = {}
+        self.kanban_scroll_positions = {}
+        self.create_kanban_columns_from_settings()
         self.refresh_todo_list()
-        self.refresh_kanban_board()
-        self.save_data()
+        self.archive_done_tasks()
+        self.rebuild_reminders()
+        if self.search_query:
+            self.run_search()
+
+    # ============ СРОКИ И НАПОМИНАНИЯ ============
+    def reminder_time(self, task):
+        """Когда напомнить о задаче; None — если напоминать не о чем."""
+        if task is None or task.get("reminded") or task["completed"] or task["column"] == "done":
+            return None
+        return task.get("remind_at", task.get("due_at"))
+
+    def rebuild_reminders(self):
+        """Заполняет колесо заново по задачам текущей доски (при запуске и смене доски)."""
+        self.reminders = TimerWheel(time.time())
+        for task in self.task_store.tasks.values():
+            when = self.reminder_time(task)
+            if when is not None:
+                self.reminders.schedule(task["id"], when)
+        self.update_reminder_timer()
+
+    def sync_reminders(self, task_ids):
+        """Переставляет напоминания только у задач, затронутых транзакцией."""
+        for task_id in task_ids:
+            when = self.reminder_time(self.task_store.get(task_id))
+            if when is None:
+                self.reminders.cancel(task_id)
+            else:
+                self.reminders.schedule(task_id, when)
+        self.update_reminder_timer()
+
+    def update_reminder_timer(self):
+        if not len(self.reminders):
+            self.reminder_timer.stop()
+        elif not self.reminder_timer.isActive():
+            self.reminder_timer.start(REMINDER_TICK_MS)
+
+    def fire_reminders(self):
+        # Во время пакетной операции ждём следующего тика — колесо никуда не денется
+        if self._batch_depth > 0:
+            return
+        store = self.task_store
+        fired = [task_id for task_id in self.reminders.advance(time.time()) if task_id in store]
+        if fired:
+            for task_id in fired:
+                store.set_reminded(task_id)
+            # Отметка о напоминании — служебная, в историю отмены не попадает
+            store.take_undo_record()
+            self.commit_changes()
+            self.play_sound("timer_end")
+            tr = self.translations.get(self.current_language, {})
+            texts = [store.get(task_id)["text"] for task_id in fired[:3]]
+            if len(fired) > 3:
+                texts.append(f"+{len(fired) - 3}")
+            self.show_toast(tr.get("reminder_toast", "⏰ Reminder: {text}").format(text=", ".join(texts)))
+        self.update_reminder_timer()
+
+    def show_toast(self, text):
+        if not hasattr(self, "toast_label"):
+            self.toast_label = QLabel(self)
+            self.toast_label.setWordWrap(True)
+            self.toast_label.setAlignment(Qt.AlignCenter)
+            self.toast_label.setStyleSheet("""
+                background: rgba(30, 30, 40, 220);
+                color: white;
+                border: 1px solid rgba(255, 210, 90, 200);
+                border-radius: 12px;
+                padding: 12px 18px;
+                font-size: 14px;
+            """)
+            self.toast_timer = QTimer()
+            self.toast_timer.setSingleShot(True)
+            self.toast_timer.timeout.connect(self.toast_label.hide)
+        self.toast_label.setText(text)
+        self.toast_label.setFixedWidth(min(420, self.width() - 40))
+        self.toast_label.adjustSize()
+        self.toast_label.move((self.width() - self.toast_label.width()) // 2, 20)
+        self.toast_label.show()
+        self.toast_label.raise_()
+        self.toast_timer.start(REMINDER_TOAST_MS)
+
+    def create_due_label(self, task):
+        """Метка срока для карточки и строки to-do; просроченный срок подсвечивается."""
+        due_at = task.get("due_at")
+        if due_at is None:
+            return None
+        label = QLabel("⏰ " + time.strftime("%d.%m %H:%M", time.localtime(due_at)))
+        overdue = due_at <= time.time() and not task["completed"] and task["column"] != "done"
+        label.setStyleSheet(f"color: {'rgba(255, 120, 120, 255)' if overdue else 'rgba(200, 220, 255, 200)'}; font-size: 11px; border: none; background: transparent;")
+        return label
+
+    def attach_task_menu(self, widget, task_id):
+        widget.setContextMenuPolicy(Qt.CustomContextMenu)
+        widget.customContextMenuRequested.connect(lambda pos: self.show_task_menu(task_id, widget.mapToGlobal(pos)))
+
+    def show_task_menu(self, task_id, global_pos):
+        task = self.task_store.get(task_id)
+        if task is None:
+            return
+        tr = self.translations.get(self.current_language, {})
+        menu = QMenu(self)
+        menu.addAction(tr.get("task_menu_set_due", "⏰ Set due date…"), lambda: self.edit_task_due(task_id))
+        if task.get("due_at") is not None:
+            menu.addAction(tr.get("task_menu_clear_due", "Clear due date"), lambda: self.set_task_due(task_id, None))
+        menu.exec_(global_pos)
+
+    def edit_task_due(self, task_id):
+        task = self.task_store.get(task_id)
+        if task is None:
+            return
+        tr = self.translations.get(self.current_language, {})
+        dialog = QDialog(self)
+        dialog.setWindowTitle(tr.get("due_dialog_title", "Due date"))
+        layout = QGridLayout(dialog)
+        layout.addWidget(QLabel(tr.get("due_dialog_due_label", "Due:")), 0, 0)
+        due_edit = QDateTimeEdit()
+        due_edit.setCalendarPopup(True)
+        due_edit.setDisplayFormat("dd.MM.yyyy HH:mm")
+        if task.get("due_at") is not None:
+            due_edit.setDateTime(QDateTime.fromSecsSinceEpoch(task["due_at"]))
+        else:
+            due_edit.setDateTime(QDateTime.currentDateTime().addSecs(60 * 60))
+        layout.addWidget(due_edit, 0, 1)
+        layout.addWidget(QLabel(tr.get("due_dialog_remind_label", "Remind:")), 1, 0)
+        remind_combo = QComboBox()
+        remind_names = {
+            0: tr.get("remind_at_due", "At due time"),
+            15 * 60: tr.get("remind_15_minutes", "15 minutes before"),
+            60 * 60: tr.get("remind_1_hour", "1 hour before"),
+            24 * 60 * 60: tr.get("remind_1_day", "1 day before"),
+        }
+        for offset in REMINDER_OFFSETS:
+            remind_combo.addItem(remind_names[offset], offset)
+        if task.get("due_at") is not None:
+            offset = task["due_at"] - task.get("remind_at", task["due_at"])
+            if offset in REMINDER_OFFSETS:
+                remind_combo.setCurrentIndex(REMINDER_OFFSETS.index(offset))
+        layout.addWidget(remind_combo, 1, 1)
+        ok_btn = QPushButton(tr.get("kanban_column_ok_button", "OK"))
+        cancel_btn = QPushButton(tr.get("kanban_column_cancel_button", "Отмена"))
+        ok_btn.clicked.connect(dialog.accept)
+        cancel_btn.clicked.connect(dialog.reject)
+        layout.addWidget(ok_btn, 2, 0)
+        layout.addWidget(cancel_btn, 2, 1)
+        if dialog.exec_() == QDialog.Accepted:
+            due_at = due_edit.dateTime().toSecsSinceEpoch()
+            self.set_task_due(task_id, due_at, due_at - remind_combo.currentData())
+
+    def set_task_due(self, task_id, due_at, remind_at=None):
+        if task_id not in self.task_store:
+            return
+        self.task_store.set_due(task_id, due_at, remind_at)
+        self.commit_changes()
+
+    # ============ АРХИВ ============
+    def load_archive_settings(self):
+        try:
+            if os.path.exists(ARCHIVE_SETTINGS_FILE):
+                with open(ARCHIVE_SETTINGS_FILE, "r", encoding="utf-8") as f:
+                    return max(0, int(json.load(f).get("archive_after_days", ARCHIVE_AFTER_DAYS)))
+        except Exception as e:
+            print(f"❌ Archive settings error: {e}")
+        return ARCHIVE_AFTER_DAYS
+
+    def save_archive_settings(self):
+        try:
+            with open(ARCHIVE_SETTINGS_FILE, "w", encoding="utf-8") as f:
+                json.dump({"archive_after_days": self.archive_after_days}, f)
+        except Exception as e:
+            print(f"❌ Archive settings error: {e}")
+
+    def archive_done_tasks(self):
+        """Переносит карточки, лежащие в done дольше archive_after_days, в архивный файл (0 — не архивировать)."""
+        if self._batch_depth > 0:
+            return 0
+        store = self.task_store
+        now = int(time.time())
+        cutoff = now - self.archive_after_days * 24 * 60 * 60
+        expired = []
+        for task in store.column_tasks("done"):
+            done_at = task.get("done_at")
+            if done_at is None:
+                store.set_done_at(task["id"], now)
+            elif self.archive_after_days > 0 and done_at <= cutoff:
+                expired.append(task)
+        if expired:
+            try:
+                self.archive.append(expired, now)
+            except OSError as e:
+                print(f"❌ Archive error: {e}")
+                expired = []
+            for task in expired:
+                store.remove(task["id"])
+            self.history.forget([task["id"] for task in expired])
+        # Архивирование — служебная операция, в историю отмены не попадает
+        self.sync_reminders(store.take_undo_record())
+        self.commit_changes()
+        return len(expired)
+
+    def open_archive_view(self):
+        tr = self.translations.get(self.current_language, {})
+        dialog = QDialog(self)
+        dialog.setWindowTitle(tr.get("kanban_archive_title", "Archive"))
+        dialog.resize(420, 500)
+        layout = QVBoxLayout(dialog)
+        total = len(self.archive)
+        count_label = QLabel(tr.get("kanban_archive_count", "Archived cards: {count}").format(count=total))
+        layout.addWidget(count_label)
+        archive_list = QListWidget()
+        archive_list.setStyleSheet("""
+            QListWidget {
+                background: rgba(30, 30, 40, 200);
+                border: 1px solid rgba(100, 100, 150, 150);
+                border-radius: 8px;
+                color: white;
+            }
+            QListWidget::item {
+                padding: 6px;
+                border-bottom: 1px solid rgba(100, 100, 150, 100);
+            }
+        """)
+        layout.addWidget(archive_list)
+
+        def load_page():
+            # Следующая страница подгружается, только когда список докручен до конца
+            for record in self.archive.page(archive_list.count(), ARCHIVE_PAGE_SIZE):
+                done_at = record.get("done_at") or record.get("archived_at")
+                date = time.strftime("%Y-%m-%d", time.localtime(done_at)) if done_at else ""
+                archive_list.addItem(f"{date}  {record.get('text', '')}")
+
+        def on_scroll(value):
+            if value >= archive_list.verticalScrollBar().maximum() and archive_list.count() < total:
+                load_page()
+
+        load_page()
+        archive_list.verticalScrollBar().valueChanged.connect(on_scroll)
+        dialog.exec_()
+
+    # ============ АНАЛИТИКА ============
+    def load_task_events(self):
+        self.task_events = TaskEventStore(self.board_file(EVENTS_FILE), self.board_file(EVENTS_TASKS_FILE),
+                                          self.board_file(EVENTS_COLUMNS_FILE))
+        if len(self.task_events) == 0:
+            # Первый запуск журнала: текущее положение задач — точка отсчёта
+            self.task_events.record([(task_id, None, task["column"])
+                                     for task_id, task in self.task_store.tasks.items() if task["column"] is not None])
+
+    def record_task_transitions(self, records):
+        """Пишет в журнал событий смены колонок по записям задач «до» транзакции."""
+        transitions = []
+        for task_id, record in records.items():
+            before = record.get("column") if record else None
+            task = self.task_store.get(task_id)
+            after = task["column"] if task else None
+            if before != after:
+                transitions.append((task_id, before, after))
+        self.task_events.record(transitions)
+
+    def open_analytics_panel(self):
+        tr = self.translations.get(self.current_language, {})
+        clock = QElapsedTimer()
+        clock.start()
+        stats = self.task_events.analytics(days=ANALYTICS_DAYS)
+        elapsed = clock.elapsed()
+        dialog = QDialog(self)
+        dialog.setWindowTitle(tr.get("analytics_title", "Analytics"))
+        dialog.resize(520, 380)
+        layout = QVBoxLayout(dialog)
+
+        def hours(values):
+            if not values:
+                return tr.get("analytics_no_data", "no data yet")
+            return " · ".join(f"p{p} {values[p]:.1f}" for p in values)
+
+        lines = [
+            tr.get("analytics_throughput", "Done in the last {days} days: {count}").format(
+                days=ANALYTICS_DAYS, count=int(stats["throughput"].sum())),
+            tr.get("analytics_cycle_time", "Cycle time, h: {values}").format(values=hours(stats["cycle_time"])),
+            tr.get("analytics_lead_time", "Lead time, h: {values}").format(values=hours(stats["lead_time"])),
+            tr.get("analytics_wip", "Work in progress now: {count}").format(count=int(stats["wip"][-1])),
+        ]
+        for line in lines:
+            layout.addWidget(QLabel(line))
+        layout.addWidget(AnalyticsChart(stats["throughput"], stats["wip"]), 1)
+        footer = QLabel(tr.get("analytics_computed", "{events} events, computed in {ms} ms").format(
+            events=len(self.task_events), ms=elapsed))
+        footer.setStyleSheet("color: gray;")
+        layout.addWidget(footer)
+        dialog.exec_()
 
     # ============ РАДИАЛЬНОЕ МЕНЮ НАСТРОЕК ============
     def setup_settings_radial_menu(self):
@@ -1994,10 +3335,15 @@ class FloatingFocusApp(QWidget):
             title_label = self.playlist_panel.layout().itemAt(0).widget()
             if isinstance(title_label, QLabel):
                 title_label.setText(tr.get("playlist_title", "Current Playlist"))
-        if hasattr(self, 'library_panel') and self.library_panel.layout() is not None:
-            title_label = self.library_panel.layout().itemAt(0).widget()
-            if isinstance(title_label, QLabel):
-                title_label.setText(tr.get("library_title", "Music Library"))
+        if hasattr(self, 'library_title'):
+            self.library_title.setText(tr.get("library_title", "Music Library"))
+            self.library_filter_input.setPlaceholderText(f"🔍 {tr.get('library_filter_placeholder', 'Filter tracks...')}")
+            self.update_library_headers()
+        if hasattr(self, 'playlist_selector'):
+            self.populate_playlist_selector()
+        if hasattr(self, 'visualizer_btn'):
+            self.visualizer_btn.setToolTip(tr.get("visualizer_tooltip", "Spectrum visualizer"))
+            self.spectrum_widget.cpu_text = tr.get("visualizer_cpu", "Visualizer CPU: {load:.1f}%")
         if hasattr(self, 'noises_panel') and self.noises_panel.layout() is not None:
             header_layout = self.noises_panel.layout().itemAt(0)
             if header_layout and header_layout.layout():
@@ -2043,6 +3389,10 @@ class FloatingFocusApp(QWidget):
         if hasattr(self, 'todo_input'):
             tr = self.translations.get(self.current_language, {})
             self.todo_input.setPlaceholderText(f"✍️ {tr.get('todo_input_placeholder', 'Введите задачу...')}")
+        if hasattr(self, 'board_selector'):
+            self.populate_board_selector()
+        if hasattr(self, 'kanban_search_input'):
+            self.kanban_search_input.setPlaceholderText(f"🔍 {tr.get('kanban_search_placeholder', 'Search...')}")
         self.update_kanban_column_titles()
         self.save_language_preference()
 
@@ -2141,25 +3491,9 @@ class FloatingFocusApp(QWidget):
             if os.path.exists(NOTES_FILE):
                 with open(NOTES_FILE, "r", encoding="utf-8") as f:
                     self.notes_data = json.load(f)
-            if os.path.exists(TASKS_FILE):
-                with open(TASKS_FILE, "r", encoding="utf-8") as f:
-                    self.tasks_data = json.load(f)
-            else:
-                self.tasks_data = []
-            if os.path.exists(KANBAN_FILE):
-                with open(KANBAN_FILE, "r", encoding="utf-8") as f:
-                    self.kanban_data = json.load(f)
-            else:
-                try:
-                    with open(KANBAN_COLUMNS_FILE, "r", encoding="utf-8") as f:
-                        columns_config = json.load(f)
-                        self.kanban_data = {col["key"]: [] for col in columns_config}
-                except:
-                    self.kanban_data = {"todo": [], "progress": [], "done": []}
-            if os.path.exists(PLAYLIST_FILE):
-                with open(PLAYLIST_FILE, "r", encoding="utf-8") as f:
-                    saved = json.load(f)
-                    self.track_list = [p for p in saved if os.path.exists(p)]
+            self.update_notes_index()
+            self.task_store = self.load_task_store()
+            self.load_playlists()
             if os.path.exists(NOISES_FILE):
                 with open(NOISES_FILE, "r") as f:
                     data = json.load(f)
@@ -2168,44 +3502,84 @@ class FloatingFocusApp(QWidget):
                 with open(PLAYER_STATE_FILE, "r") as f:
                     state = json.load(f)
                     self.last_played_track = state.get("last_track")
+                    self.visualizer_enabled = bool(state.get("visualizer", False))
             else:
                 self.last_played_track = None
-            if os.path.exists(os.path.join(DATA_DIR, "file_paths.json")):
-                with open(os.path.join(DATA_DIR, "file_paths.json"), "r", encoding="utf-8") as f:
-                    self.file_paths = json.load(f)
-            else:
-                self.file_paths = {}
             self.load_language_preference()
         except Exception as e:
             print(f"❌ Error loading  {e}")
-            self.tasks_data = []
-            try:
-                with open(KANBAN_COLUMNS_FILE, "r", encoding="utf-8") as f:
-                    columns_config = json.load(f)
-                    self.kanban_data = {col["key"]: [] for col in columns_config}
-            except:
-                self.kanban_data = {"todo": [], "progress": [], "done": []}
-            self.file_paths = {}
+            self.task_store = TaskStore()
+        self.task_store.undo_record = {}
+        self.history = UndoHistory()
+
+    def load_task_store(self):
+        """Читает задачи; старый формат (tasks.json + kanban.json + file_paths.json) переносится в хранилище с id."""
+        store = TaskStore.load(self.board_file(TASKS_FILE), self.board_file(TASKS_JOURNAL_FILE))
+        if store is not None:
+            return store
+        if self.board_dir != DATA_DIR:
+            return TaskStore()
+        tasks_data = []
+        if os.path.exists(TASKS_FILE):
+            with open(TASKS_FILE, "r", encoding="utf-8") as f:
+                tasks_data = json.load(f)
+        kanban_data = {"todo": [], "progress": [], "done": []}
+        if os.path.exists(KANBAN_FILE):
+            with open(KANBAN_FILE, "r", encoding="utf-8") as f:
+                kanban_data = json.load(f)
+        file_paths = {}
+        if os.path.exists(FILE_PATHS_FILE):
+            with open(FILE_PATHS_FILE, "r", encoding="utf-8") as f:
+                file_paths = json.load(f)
+        return TaskStore.from_legacy(tasks_data, kanban_data, file_paths)
 
     def save_data(self):
         try:
             with open(NOTES_FILE, "w", encoding="utf-8") as f:
                 json.dump(self.notes_data, f, indent=2)
-            with open(TASKS_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.tasks_data, f, indent=2)
-            with open(KANBAN_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.kanban_data, f, indent=2)
+            self.task_store.flush(self.board_file(TASKS_FILE), self.board_file(TASKS_JOURNAL_FILE))
+            self.save_noise_volumes()
+            self.save_playlists()
+        except Exception as e:
+            print(f"❌ Save error: {e}")
+
+    def save_noise_volumes(self):
+        self.noise_save_timer.stop()
+        try:
             with open(NOISES_FILE, "w") as f:
                 json.dump({k: int(v) for k, v in self.noises_volumes.items()}, f)
+        except Exception as e:
+            print(f"❌ Noises save error: {e}")
+
+    def load_playlists(self):
+        """Плейлисты, очередь и текущий плейлист; старый формат — просто список путей."""
+        data = []
+        if os.path.exists(PLAYLIST_FILE):
+            with open(PLAYLIST_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        if isinstance(data, list):
+            data = {"playlists": [{"name": DEFAULT_PLAYLIST_NAME, "tracks": data}]}
+        self.playlists = [Playlist(item["name"], [p for p in item.get("tracks", []) if os.path.exists(p)])
+                          for item in data.get("playlists", []) if item.get("name")]
+        if not self.playlists:
+            self.playlists = [Playlist(DEFAULT_PLAYLIST_NAME)]
+        current = data.get("current")
+        self.playlist = next((playlist for playlist in self.playlists if playlist.name == current), self.playlists[0])
+        self.play_queue = deque(p for p in data.get("queue", []) if os.path.exists(p))
+
+    def save_playlists(self):
+        try:
             with open(PLAYLIST_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.track_list, f, indent=2)
+                json.dump({
+                    "version": 2,
+                    "current": self.playlist.name,
+                    "playlists": [playlist.to_json() for playlist in self.playlists],
+                    "queue": list(self.play_queue),
+                }, f, ensure_ascii=False, indent=2)
             with open(PLAYER_STATE_FILE, "w", encoding="utf-8") as f:
-                last_track = self.track_list[self.current_index] if self.track_list else None
-                json.dump({"last_track": last_track}, f, indent=2)
-            with open(os.path.join(DATA_DIR, "file_paths.json"), "w", encoding="utf-8") as f:
-                json.dump(self.file_paths, f, indent=2)
+                json.dump({"last_track": self.current_track, "visualizer": self.visualizer_enabled}, f, indent=2)
         except Exception as e:
-            print(f"❌ Save error: {e}")
+            print(f"❌ Playlist save error: {e}")
 
     def load_video(self):
         if not hasattr(self, 'background_files') or len(self.background_files) == 0:
@@ -2259,6 +3633,9 @@ class FloatingFocusApp(QWidget):
 
     def closeEvent(self, event):
         self.save_data()
+        self.thumbnails.save_index()
+        self.library.save()
+        self.loudness.shutdown()
         event.accept()
 
     # --- УПРАВЛЕНИЕ НАСТРОЙКАМИ ДОСКИ KANBAN ---
@@ -2266,7 +3643,7 @@ class FloatingFocusApp(QWidget):
         tr = self.translations.get(self.current_language, {})
         dialog = QDialog(self)
         dialog.setWindowTitle(tr.get("kanban_settings_title", "Настройки Kanban Board"))
-        dialog.setFixedSize(500, 400)
+        dialog.setFixedSize(500, 440)
         main_layout = QVBoxLayout(dialog)
         self.kanban_settings_list = QListWidget()
         self.kanban_settings_list.setSelectionMode(QAbstractItemView.SingleSelection)
@@ -2345,6 +3722,13 @@ class FloatingFocusApp(QWidget):
         delete_btn.clicked.connect(self.delete_selected_kanban_column)
         buttons_layout.addWidget(delete_btn)
         main_layout.addLayout(buttons_layout)
+        archive_layout = QHBoxLayout()
+        archive_layout.addWidget(QLabel(tr.get("kanban_archive_after_label", "Archive done cards after, days (0 = never):")))
+        self.archive_days_spin = QSpinBox()
+        self.archive_days_spin.setRange(0, 3650)
+        self.archive_days_spin.setValue(self.archive_after_days)
+        archive_layout.addWidget(self.archive_days_spin)
+        main_layout.addLayout(archive_layout)
         ok_cancel_layout = QHBoxLayout()
         ok_btn = QPushButton(tr.get("kanban_column_ok_button", "OK"))
         ok_btn.clicked.connect(lambda: self.apply_kanban_settings(dialog))
@@ -2362,14 +3746,13 @@ class FloatingFocusApp(QWidget):
     def populate_kanban_settings_list(self):
         self.kanban_settings_list.clear()
         try:
-            with open(KANBAN_COLUMNS_FILE, "r", encoding="utf-8") as f:
+            with open(self.board_file(KANBAN_COLUMNS_FILE), "r", encoding="utf-8") as f:
                 self.backup_columns_config = json.load(f)
         except:
             self.backup_columns_config = []
         for col_config in self.backup_columns_config:
             key = col_config.get("key", "unknown")
             title = col_config.get("title", key.capitalize())
-            task_count = len(self.kanban_data.get(key, []))
             item = QListWidgetItem(title)
             item.setData(Qt.UserRole, col_config)
             self.kanban_settings_list.addItem(item)
@@ -2414,20 +3797,18 @@ class FloatingFocusApp(QWidget):
             item = QListWidgetItem(f"{title}{tr_format.format(count=0)}")
             item.setData(Qt.UserRole, new_config)
             self.kanban_settings_list.addItem(item)
-            if not hasattr(self, 'kanban_data'):
-                self.kanban_data = {}
-            self.kanban_data[key] = []
 
-    def generate_unique_column_key(self, title):
+    def generate_unique_column_key(self, title, existing_keys=None):
         base_key = "".join(c.lower() for c in title if c.isalnum() or c == '_') or "column"
         key = base_key
         counter = 1
-        existing_keys = set()
-        for i in range(self.kanban_settings_list.count()):
-            item = self.kanban_settings_list.item(i)
-            config = item.data(Qt.UserRole)
-            if config:
-                existing_keys.add(config.get("key", ""))
+        if existing_keys is None:
+            existing_keys = set()
+            for i in range(self.kanban_settings_list.count()):
+                item = self.kanban_settings_list.item(i)
+                config = item.data(Qt.UserRole)
+                if config:
+                    existing_keys.add(config.get("key", ""))
         while key in existing_keys:
             key = f"{base_key}_{counter}"
             counter += 1
@@ -2477,7 +3858,7 @@ class FloatingFocusApp(QWidget):
             new_config = old_config.copy()
             new_config["title"] = new_title
             new_config["color"] = [old_color.red(), old_color.green(), old_color.blue()]
-            task_count = len(self.kanban_data.get(new_config["key"], []))
+            task_count = self.task_store.column_count(new_config["key"])
             tr_format = tr.get("kanban_column_task_count_format", " (Задач: {count})")
             current_item.setText(f"{new_title}{tr_format.format(count=task_count)}")
             current_item.setData(Qt.UserRole, new_config)
@@ -2494,7 +3875,7 @@ class FloatingFocusApp(QWidget):
             return
         col_key = col_config.get("key", "")
         col_title = col_config.get("title", "")
-        task_count = len(self.kanban_data.get(col_key, []))
+        task_count = self.task_store.column_count(col_key)
         if task_count > 0:
             tr_text = tr.get("kanban_column_delete_confirm_text", "В колонке '{col_name}' есть {task_count} задач. Они будут удалены. Продолжить?")
             formatted_text = tr_text.format(col_name=col_title, task_count=task_count)
@@ -2507,7 +3888,6 @@ class FloatingFocusApp(QWidget):
             )
             if reply == QMessageBox.No:
                 return
-        self.kanban_data.pop(col_key, None)
         self.kanban_settings_list.takeItem(current_row)
 
     def move_selected_column(self, direction):
@@ -2529,11 +3909,17 @@ class FloatingFocusApp(QWidget):
                 config = item.data(Qt.UserRole)
                 if config:
                     new_columns_config.append(config)
-            with open(KANBAN_COLUMNS_FILE, "w", encoding="utf-8") as f:
-                json.dump(new_columns_config, f, indent=2)
-            self.create_kanban_columns_from_settings()
-            self.refresh_kanban_board()
-            self.save_data()
+            self.write_kanban_columns_config(new_columns_config)
+            new_keys = {config.get("key") for config in new_columns_config}
+            for config in self.kanban_column_configs:
+                if config.get("key") not in new_keys:
+                    self.task_store.drop_column(config.get("key"))
+            self.apply_kanban_columns_config(new_columns_config)
+            self.commit_changes()
+            if self.archive_days_spin.value() != self.archive_after_days:
+                self.archive_after_days = self.archive_days_spin.value()
+                self.save_archive_settings()
+                self.archive_done_tasks()
             QMessageBox.information(self, "Успех", "Настройки Kanban Board успешно применены.")
             dialog.accept()
         except Exception as e:
@@ -2605,27 +3991,9 @@ class FloatingFocusApp(QWidget):
     def add_task_from_input(self, line_edit, input_container, column_key, column_layout):
         text = line_edit.text().strip()
         if text:
-            for col in self.kanban_columns.keys():
-                if text in self.kanban_data.get(col, []):
-                    self.kanban_data[col].remove(text)
-            if column_key not in self.kanban_data:
-                self.kanban_data[column_key] = []
-            self.kanban_data[column_key].append(text)
-            if column_key in ["progress", "done"]:
-                found = False
-                for task in self.tasks_data:
-                    if task["text"] == text:
-                        task["completed"] = (column_key == "done")
-                        found = True
-                        break
-                if not found:
-                    initial_status = True if column_key == "done" else False
-                    self.tasks_data.append({"text": text, "completed": initial_status})
-            else:
-                self.tasks_data = [task for task in self.tasks_data if task["text"] != text]
-            self.save_data()
-            self.refresh_kanban_board()
-            self.refresh_todo_list()
+            task_id = self.task_store.add(text)
+            self.move_task_to_column(task_id, column_key)
+            self.commit_changes()
         self.cancel_add_task(input_container, column_layout)
 
     def cancel_add_task(self, input_container, column_layout):
@@ -2657,77 +4025,2893 @@ class KanbanDropContainer(QWidget):
     def dragEnterEvent(self, event):
         if event.mimeData().hasText() or event.mimeData().hasUrls():
             event.acceptProposedAction()
+    def drop_index(self, pos, skip_id=None):
+        """Позиция вставки в колонке: число карточек выше точки сброса."""
+        index = 0
+        layout = self.layout()
+        for i in range(layout.count()):
+            widget = layout.itemAt(i).widget()
+            task_id = getattr(widget, 'task_id', None)
+            if task_id is None or task_id == skip_id or widget.isHidden():
+                continue
+            if widget.geometry().center().y() < pos.y():
+                index += 1
+        return index
     def dropEvent(self, event):
         mime_data = event.mimeData()
+        app = self.parent_app
+        if not isinstance(app, FloatingFocusApp):
+            event.ignore()
+            return
+        store = app.task_store
         if mime_data.hasUrls():
-            for url in mime_data.urls():
-                if url.isLocalFile():
-                    file_path = url.toLocalFile()
-                    file_name = os.path.basename(file_path)
-                    app = self.parent_app
-                    if isinstance(app, FloatingFocusApp):
-                        for col in app.kanban_columns.keys():
-                            if file_name in app.kanban_data.get(col, []):
-                                app.kanban_data[col].remove(file_name)
-                        if self.column_name not in app.kanban_data:
-                            app.kanban_data[self.column_name] = []
-                        app.kanban_data[self.column_name].append(file_name)
-                        if self.column_name in ["progress", "done"]:
-                            found = False
-                            for task in app.tasks_data:
-                                if task["text"] == file_name:
-                                    if self.column_name == "done":
-                                        task["completed"] = True
-                                    else:
-                                        task["completed"] = False
-                                    found = True
-                                    break
-                            if not found:
-                                initial_status = True if self.column_name == "done" else False
-                                app.tasks_data.append({"text": file_name, "completed": initial_status})
-                        else:
-                            app.tasks_data = [task for task in app.tasks_data if task["text"] != file_name]
-                        if not hasattr(app, 'file_paths'):
-                            app.file_paths = {}
-                        app.file_paths[file_name] = file_path
-                        app.refresh_todo_list()
-                        app.refresh_kanban_board()
-                        app.save_data()
-        elif mime_data.hasText():
-            data = mime_data.text()
-            if "|" in data:
-                task_text, source_column = data.rsplit("|", 1)
-            else:
-                task_text = data
-                source_column = "unknown"
-            app = self.parent_app
-            if isinstance(app, FloatingFocusApp):
-                for col in app.kanban_columns.keys():
-                    if task_text in app.kanban_data.get(col, []):
-                        app.kanban_data[col].remove(task_text)
-                if self.column_name not in app.kanban_data:
-                    app.kanban_data[self.column_name] = []
-                app.kanban_data[self.column_name].append(task_text)
-                if self.column_name in ["progress", "done"]:
-                    found = False
-                    for task in app.tasks_data:
-                        if task["text"] == task_text:
-                            if self.column_name == "done":
-                                task["completed"] = True
-                            else:
-                                task["completed"] = False
-                            found = True
-                            break
-                    if not found:
-                        initial_status = True if self.column_name == "done" else False
-                        app.tasks_data.append({"text": task_text, "completed": initial_status})
-                else:
-                    app.tasks_data = [task for task in app.tasks_data if task["text"] != task_text]
-                app.refresh_todo_list()
-                app.refresh_kanban_board()
-                app.save_data()
+            file_paths = [url.toLocalFile() for url in mime_data.urls() if url.isLocalFile()]
+            index = self.drop_index(event.pos())
+            def add_file(file_path):
+                nonlocal index
+                task_id = store.find_file(file_path)
+                if task_id is None:
+                    task_id = store.add(os.path.basename(file_path), file_path=file_path)
+                app.move_task_to_column(task_id, self.column_name, index)
+                index += 1
+            tr = app.translations.get(app.current_language, {})
+            app.run_batch(file_paths, add_file, total=len(file_paths), label=tr.get("kanban_batch_progress", "Adding files..."))
+        elif mime_data.hasFormat(TASK_MIME_TYPE):
+            task_id = bytes(mime_data.data(TASK_MIME_TYPE)).decode("utf-8")
+            if task_id in store:
+                app.move_task_to_column(task_id, self.column_name, self.drop_index(event.pos(), skip_id=task_id))
+                app.commit_changes()
+        elif mime_data.hasText() and mime_data.text().strip():
+            task_id = store.add(mime_data.text().strip())
+            app.move_task_to_column(task_id, self.column_name, self.drop_index(event.pos()))
+            app.commit_changes()
         event.accept()
 
+# === ГОРИЗОНТАЛЬНАЯ ЛЕНТА KANBAN ===
+class KanbanBoardScroll(QScrollArea):
+    """Прокрутка доски по горизонтали; при изменении размера пересчитывает видимые колонки."""
+    def __init__(self, parent_app):
+        super().__init__()
+        self.parent_app = parent_app
+        self.setWidgetResizable(False)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setStyleSheet("QScrollArea { border: none; background: transparent; }")
+        self.viewport().setStyleSheet("background: transparent;")
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.parent_app.layout_kanban_columns()
+
+# === ГРАФИК АНАЛИТИКИ ===
+class AnalyticsChart(QWidget):
+    """Столбцы — задачи, завершённые за день; линия — WIP на конец дня."""
+    def __init__(self, throughput, wip, parent=None):
+        super().__init__(parent)
+        self.throughput = throughput
+        self.wip = wip
+        self.setMinimumHeight(160)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        width, height = self.width(), self.height() - 4
+        days = len(self.throughput)
+        if days == 0:
+            return
+        step = width / days
+        top = max(int(self.throughput.max()), int(self.wip.max()), 1)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(50, 205, 50, 160))
+        for i, count in enumerate(self.throughput):
+            bar = int(height * count / top)
+            painter.drawRect(int(i * step) + 1, height - bar, max(int(step) - 2, 1), bar)
+        painter.setPen(QPen(QColor(255, 165, 0), 2))
+        points = [QPoint(int((i + 0.5) * step), height - int(height * value / top)) for i, value in enumerate(self.wip)]
+        for a, b in zip(points, points[1:]):
+            painter.drawLine(a, b)
+
+# === КЛЮЧИ ПОРЯДКА КАРТОЧЕК ===
+# Ключ = целая часть + дробная часть. Первая буква целой части задаёт её длину
+# ('a'..'z' — положительные числа, 'A'..'Z' — отрицательные), поэтому добавление в начало или
+# конец колонки удлиняет ключ логарифмически, а вставка между соседями берёт середину дробной части.
+RANK_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+RANK_REBALANCE_LENGTH = 12
+
+def _rank_midpoint(a, b):
+    """Дробная часть строго между a и b (b=None — без верхней границы)."""
+    zero = RANK_DIGITS[0]
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else zero) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _rank_midpoint(a[n:], b[n:])
+    digit_a = RANK_DIGITS.index(a[0]) if a else 0
+    digit_b = RANK_DIGITS.index(b[0]) if b is not None else len(RANK_DIGITS)
+    if digit_b - digit_a > 1:
+        return RANK_DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return RANK_DIGITS[digit_a] + _rank_midpoint(a[1:], None)
+
+def _rank_integer_length(head):
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"invalid rank head: {head!r}")
+
+def _rank_increment(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in range(len(digits) - 1, -1, -1):
+        d = RANK_DIGITS.index(digits[i]) + 1
+        if d < len(RANK_DIGITS):
+            digits[i] = RANK_DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = RANK_DIGITS[0]
+    if head == "Z":
+        return "a" + RANK_DIGITS[0]
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digits.append(RANK_DIGITS[0])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+def _rank_decrement(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in range(len(digits) - 1, -1, -1):
+        d = RANK_DIGITS.index(digits[i]) - 1
+        if d >= 0:
+            digits[i] = RANK_DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = RANK_DIGITS[-1]
+    if head == "a":
+        return "Z" + RANK_DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digits.append(RANK_DIGITS[-1])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+def rank_valid(key):
+    try:
+        length = _rank_integer_length(key[0])
+    except (ValueError, IndexError):
+        return False
+    return len(key) >= length and all(c in RANK_DIGITS for c in key[1:]) and not key[length:].endswith(RANK_DIGITS[0])
+
+def rank_between(before=None, after=None):
+    """Возвращает ключ, который сортируется строго между before и after (None — край колонки)."""
+    zero = RANK_DIGITS[0]
+    if before is None and after is None:
+        return "a" + zero
+    if before is None:
+        int_b = after[:_rank_integer_length(after[0])]
+        if int_b == "A" + zero * 26:
+            return int_b + _rank_midpoint("", after[len(int_b):])
+        if int_b < after:
+            return int_b
+        return _rank_decrement(int_b)
+    int_a = before[:_rank_integer_length(before[0])]
+    frac_a = before[len(int_a):]
+    if after is None:
+        bigger = _rank_increment(int_a)
+        return int_a + _rank_midpoint(frac_a, None) if bigger is None else bigger
+    int_b = after[:_rank_integer_length(after[0])]
+    if int_a == int_b:
+        return int_a + _rank_midpoint(frac_a, after[len(int_b):])
+    bigger = _rank_increment(int_a)
+    if bigger is not None and bigger < after:
+        return bigger
+    return int_a + _rank_midpoint(frac_a, None)
+
+def rank_sequence(count):
+    """Короткие последовательные ключи для count карточек (перебалансировка колонки)."""
+    ranks = []
+    key = None
+    for _ in range(count):
+        key = rank_between(key, None)
+        ranks.append(key)
+    return ranks
+
+# === ХРАНИЛИЩЕ ЗАДАЧ ===
+class TaskStore:
+    """Единый источник задач: to-do список и колонки kanban — представления над ним.
+    Порядок карточек задаётся ключом rank, поэтому перенос меняет запись только одной задачи."""
+    JOURNAL_COMPACT_LINES = 500
+
+    def __init__(self):
+        self.tasks = {}         # id -> запись задачи
+        self.columns = {}       # ключ колонки -> отсортированный список (rank, id)
+        self.todo = {}          # id -> None, порядок to-do списка
+        self.by_text = {}       # текст -> {id: None}
+        self.search = SearchIndex()  # полнотекстовый индекс по тексту и именам вложений
+        self.dirty = set()      # id задач, изменённых с последнего сохранения
+        self.unbalanced = set()  # колонки, где ключи стали слишком длинными
+        self.changed_columns = set()  # колонки, чьи карточки надо перерисовать
+        self.todo_changed = False
+        self.snapshot_stale = False
+        self.journal_lines = 0
+        self._todo_seq = 0
+        self.undo_record = None  # id -> запись до изменения (None — задачи не было); None — запись выключена
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self, task_id):
+        return task_id in self.tasks
+
+    def get(self, task_id):
+        return self.tasks.get(task_id)
+
+    def add(self, text, column=None, todo=False, completed=False, file_path=None, task_id=None, index=None):
+        task_id = task_id or uuid.uuid4().hex[:12]
+        self._remember(task_id)
+        task = {"id": task_id, "text": text, "completed": bool(completed), "column": None}
+        if file_path:
+            task["file_path"] = file_path
+        self.tasks[task_id] = task
+        self.by_text.setdefault(text, {})[task_id] = None
+        self.search.update(task_id, self._search_text(task))
+        self.dirty.add(task_id)
+        if column is not None:
+            self.move(task_id, column, index)
+        if todo:
+            self.set_todo(task_id, True)
+        return task_id
+
+    def remove(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        self._remember(task_id)
+        self._unlink(task)
+        del self.tasks[task_id]
+        if task_id in self.todo:
+            del self.todo[task_id]
+            self.todo_changed = True
+        same_text = self.by_text.get(task["text"])
+        if same_text is not None:
+            same_text.pop(task_id, None)
+            if not same_text:
+                del self.by_text[task["text"]]
+        self.search.discard(task_id)
+        self.dirty.add(task_id)
+        return task
+
+    def _unlink(self, task):
+        seq = self.columns.get(task["column"])
+        if seq is None:
+            return
+        self.changed_columns.add(task["column"])
+        i = bisect.bisect_left(seq, (task.get("rank", ""), task["id"]))
+        if i < len(seq) and seq[i][1] == task["id"]:
+            del seq[i]
+
+    def move(self, task_id, column, index=None):
+        """Ставит задачу в колонку на позицию index (None — в конец); пересчитывается только её ключ."""
+        task = self.tasks[task_id]
+        self._remember(task_id)
+        self._unlink(task)
+        task["column"] = column
+        if column is None:
+            task.pop("rank", None)
+        else:
+            seq = self.columns.setdefault(column, [])
+            if index is None or index > len(seq):
+                index = len(seq)
+            before = seq[index - 1][0] if index > 0 else None
+            after = seq[index][0] if index < len(seq) else None
+            rank = rank_between(before, after)
+            task["rank"] = rank
+            seq.insert(index, (rank, task_id))
+            self.changed_columns.add(column)
+            if len(rank) > RANK_REBALANCE_LENGTH:
+                self.unbalanced.add(column)
+        self.dirty.add(task_id)
+
+    def rebalance(self, column):
+        """Заново раздаёт короткие равномерные ключи всей колонке."""
+        self.unbalanced.discard(column)
+        seq = self.columns.get(column)
+        if not seq:
+            return
+        ranks = rank_sequence(len(seq))
+        for i, (rank, (_, task_id)) in enumerate(zip(ranks, seq)):
+            self._remember(task_id)
+            self.tasks[task_id]["rank"] = rank
+            seq[i] = (rank, task_id)
+            self.dirty.add(task_id)
+
+    def position(self, task_id):
+        task = self.tasks[task_id]
+        seq = self.columns.get(task["column"], [])
+        return bisect.bisect_left(seq, (task.get("rank", ""), task_id))
+
+    def set_completed(self, task_id, state):
+        self._remember(task_id)
+        self.tasks[task_id]["completed"] = bool(state)
+        self.dirty.add(task_id)
+        if task_id in self.todo:
+            self.todo_changed = True
+
+    def set_done_at(self, task_id, timestamp):
+        """Время попадания в колонку done (None — задача не в done)."""
+        task = self.tasks[task_id]
+        if task.get("done_at") == timestamp:
+            return
+        self._remember(task_id)
+        if timestamp is None:
+            del task["done_at"]
+        else:
+            task["done_at"] = timestamp
+        self.dirty.add(task_id)
+
+    def set_due(self, task_id, due_at, remind_at=None):
+        """Срок задачи и время напоминания (None — без срока); новое время снова включает напоминание."""
+        task = self.tasks[task_id]
+        self._remember(task_id)
+        for field, value in (("due_at", due_at), ("remind_at", remind_at)):
+            if value is None:
+                task.pop(field, None)
+            else:
+                task[field] = value
+        task.pop("reminded", None)
+        self._touch(task)
+
+    def set_reminded(self, task_id):
+        task = self.tasks[task_id]
+        self._remember(task_id)
+        task["reminded"] = True
+        self._touch(task)
+
+    def _touch(self, task):
+        """Помечает задачу к сохранению, а её колонку и to-do список — к перерисовке."""
+        self.dirty.add(task["id"])
+        if task["column"] is not None:
+            self.changed_columns.add(task["column"])
+        if task["id"] in self.todo:
+            self.todo_changed = True
+
+    def set_todo(self, task_id, state):
+        task = self.tasks[task_id]
+        self._remember(task_id)
+        if state:
+            if task_id not in self.todo:
+                self._todo_seq += 1
+                task["todo"] = self._todo_seq
+                self.todo[task_id] = None
+                self.dirty.add(task_id)
+                self.todo_changed = True
+            return
+        if task_id in self.todo:
+            del self.todo[task_id]
+            self.todo_changed = True
+        if task.pop("todo", None) is not None:
+            self.dirty.add(task_id)
+        # Задача без колонки и вне to-do списка больше нигде не видна
+        if task["column"] is None:
+            self.remove(task_id)
+
+    def find(self, text):
+        return list(self.by_text.get(text, ()))
+
+    def find_file(self, file_path):
+        for task_id in self.by_text.get(os.path.basename(file_path), ()):
+            if self.tasks[task_id].get("file_path") == file_path:
+                return task_id
+        return None
+
+    def column_tasks(self, column):
+        return [self.tasks[task_id] for _, task_id in self.columns.get(column, ())]
+
+    def column_count(self, column):
+        return len(self.columns.get(column, ()))
+
+    def todo_tasks(self):
+        return [self.tasks[task_id] for task_id in self.todo]
+
+    def drop_column(self, column):
+        self.changed_columns.add(column)
+        for _, task_id in self.columns.pop(column, []):
+            task = self.tasks[task_id]
+            self._remember(task_id)
+            task["column"] = None
+            task.pop("rank", None)
+            self.dirty.add(task_id)
+            if task_id not in self.todo:
+                self.remove(task_id)
+
+    # --- Отмена: копии только затронутых записей вместо копии всей доски ---
+    def _remember(self, task_id):
+        record = self.undo_record
+        if record is not None and task_id not in record:
+            task = self.tasks.get(task_id)
+            record[task_id] = dict(task) if task is not None else None
+
+    def take_undo_record(self):
+        """Забирает записи, накопленные с прошлой транзакции."""
+        record, self.undo_record = self.undo_record, {}
+        return record or {}
+
+    def restore(self, records):
+        """Возвращает задачи к сохранённым записям и отдаёт обратную запись (для повтора).
+        Ключи rank восстанавливаются как были, поэтому карточки встают на прежние места."""
+        saved = self.undo_record
+        self.undo_record = {}
+        for task_id in records:
+            self._remember(task_id)
+        inverse = self.undo_record
+        self.undo_record = None
+        for task_id in records:
+            self.remove(task_id)
+        restored_todo = False
+        for task_id, record in records.items():
+            self.dirty.add(task_id)
+            if record is None:
+                continue
+            task = dict(record)
+            self._index(task, keep_sorted=True)
+            if task.get("column") is not None:
+                self.changed_columns.add(task["column"])
+            if task.get("todo") is not None:
+                self.todo[task_id] = None
+                restored_todo = True
+        if restored_todo:
+            self.todo = dict.fromkeys(sorted(self.todo, key=lambda i: self.tasks[i]["todo"]))
+            self.todo_changed = True
+        self.undo_record = saved
+        return inverse
+
+    # --- Сохранение: снимок + журнал изменений ---
+    @staticmethod
+    def _search_text(task):
+        file_path = task.get("file_path")
+        return f"{task['text']} {os.path.basename(file_path)}" if file_path else task["text"]
+
+    def _index(self, task, keep_sorted=False):
+        self.tasks[task["id"]] = task
+        self.by_text.setdefault(task["text"], {})[task["id"]] = None
+        self.search.update(task["id"], self._search_text(task))
+        if task.get("column") is not None:
+            seq = self.columns.setdefault(task["column"], [])
+            item = (task.get("rank", ""), task["id"])
+            if keep_sorted:
+                bisect.insort(seq, item)
+            else:
+                seq.append(item)
+        if task.get("todo") is not None:
+            self._todo_seq = max(self._todo_seq, task["todo"])
+
+    def _apply_journal_entry(self, entry):
+        if "del" in entry:
+            self.remove(entry["del"])
+        elif "put" in entry:
+            task = entry["put"]
+            if task["id"] in self.tasks:
+                self.remove(task["id"])
+            self._index(task, keep_sorted=True)
+
+    def _finish_load(self):
+        for seq in self.columns.values():
+            seq.sort()
+        self.changed_columns.clear()
+        self.todo_changed = False
+        todo_ids = [t["id"] for t in self.tasks.values() if t.get("todo") is not None]
+        todo_ids.sort(key=lambda task_id: self.tasks[task_id]["todo"])
+        self.todo = dict.fromkeys(todo_ids)
+        self.dirty.clear()
+        # Недействительные ключи (повреждённый снимок) заменяются на новые без изменения порядка
+        for column, seq in self.columns.items():
+            if not all(rank_valid(rank) for rank, _ in seq):
+                self.rebalance(column)
+
+    def to_json(self):
+        return {"version": 2, "tasks": list(self.tasks.values())}
+
+    @classmethod
+    def load(cls, snapshot_path, journal_path):
+        data = {"version": 2, "tasks": []}  # новой доске снимок ещё не записан
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        if not isinstance(data, dict):
+            return None
+        store = cls()
+        for task in data.get("tasks", []):
+            store._index(task)
+        for seq in store.columns.values():
+            seq.sort()
+        if os.path.exists(journal_path):
+            with open(journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # оборванная последняя запись
+                    store.journal_lines += 1
+                    store._apply_journal_entry(entry)
+        store._finish_load()
+        return store
+
+    def flush(self, snapshot_path, journal_path):
+        """Дописывает в журнал только изменённые задачи; время от времени сжимает журнал в снимок."""
+        if not self.dirty and not self.snapshot_stale:
+            return
+        if self.snapshot_stale or self.journal_lines + len(self.dirty) > self.JOURNAL_COMPACT_LINES:
+            tmp_path = snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_json(), f, ensure_ascii=False)
+            os.replace(tmp_path, snapshot_path)
+            with open(journal_path, "w", encoding="utf-8"):
+                pass
+            self.journal_lines = 0
+            self.snapshot_stale = False
+        else:
+            with open(journal_path, "a", encoding="utf-8") as f:
+                for task_id in self.dirty:
+                    task = self.tasks.get(task_id)
+                    entry = {"put": task} if task is not None else {"del": task_id}
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.journal_lines += len(self.dirty)
+        self.dirty.clear()
+
+    @classmethod
+    def from_legacy(cls, tasks_data, kanban_data, file_paths):
+        """Переносит старый формат (задачи по тексту) в хранилище с id."""
+        store = cls()
+        for col, texts in kanban_data.items():
+            seen = set()
+            for text in texts:
+                if text in seen:
+                    continue
+                seen.add(text)
+                store.add(text, column=col, file_path=file_paths.get(text))
+        for task in tasks_data:
+            text = task.get("text", "")
+            match = next((i for i in store.by_text.get(text, ()) if i not in store.todo), None)
+            if match is None:
+                store.add(text, todo=True, completed=task.get("completed", False))
+            else:
+                store.set_todo(match, True)
+                store.set_completed(match, task.get("completed", False))
+        store.dirty.clear()
+        store.changed_columns.clear()
+        store.todo_changed = False
+        store.snapshot_stale = True
+        return store
+
+# === ИСТОРИЯ ОТМЕНЫ ===
+class UndoHistory:
+    """Стеки отмены и повтора. Команда: {"tasks": записи задач до изменения,
+    "columns": конфигурация колонок до изменения или None}."""
+    LIMIT = 100
+
+    def __init__(self, limit=LIMIT):
+        self.undo_stack = deque(maxlen=limit)
+        self.redo_stack = []
+
+    def push(self, command):
+        self.undo_stack.append(command)
+        self.redo_stack.clear()
+
+    def amend(self, records):
+        """Дописывает в последнюю команду служебные изменения (перебалансировку ключей)."""
+        if self.undo_stack:
+            tasks = self.undo_stack[-1]["tasks"]
+            for task_id, record in records.items():
+                tasks.setdefault(task_id, record)
+
+    def forget(self, task_ids):
+        """Убирает из истории задачи, ушедшие в архив, чтобы отмена их не воскрешала."""
+        for command in list(self.undo_stack) + self.redo_stack:
+            for task_id in task_ids:
+                command["tasks"].pop(task_id, None)
+
+# === АРХИВ ЗАДАЧ ===
+class TaskArchive:
+    """Архив выполненных задач: файл только на дозапись, одна строка JSON на задачу.
+    Смещения строк собираются один раз и дочитываются только с конца файла."""
+    KEPT_FIELDS = ("id", "text", "completed", "column", "file_path", "done_at")
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = []
+        self._scanned = 0
+
+    def append(self, tasks, archived_at):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for task in tasks:
+                record = {key: task[key] for key in self.KEPT_FIELDS if key in task}
+                record["archived_at"] = archived_at
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _scan(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < self._scanned:
+            self.offsets, self._scanned = [], 0
+        if size == self._scanned:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._scanned)
+            pos = self._scanned
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # недописанная строка — дочитаем в следующий раз
+                if line.strip():
+                    self.offsets.append(pos)
+                pos += len(line)
+        self._scanned = pos
+
+    def __len__(self):
+        self._scan()
+        return len(self.offsets)
+
+    def page(self, start, count):
+        """Записи start..start+count, начиная с самых новых; читаются только нужные строки."""
+        self._scan()
+        end = len(self.offsets) - start
+        records = []
+        if end <= 0:
+            return records
+        with open(self.path, "rb") as f:
+            for offset in reversed(self.offsets[max(0, end - count):end]):
+                f.seek(offset)
+                try:
+                    records.append(json.loads(f.readline()))
+                except ValueError:
+                    continue
+        return records
+
+# === ИМПОРТ/ЭКСПОРТ ЗАДАЧ ===
+class TaskTransfer:
+    """Потоковое чтение и запись задач в CSV, Markdown-чеклистах и JSON (массив или JSON Lines)."""
+    TEXT_FIELDS = ("text", "title", "name", "task", "summary")
+    COLUMN_FIELDS = ("column", "status", "list", "state", "stage")
+    COMPLETED_FIELDS = ("completed", "done", "checked")
+    TRUE_VALUES = {"1", "true", "yes", "y", "x", "done", "да"}
+    MAX_TEXT_LENGTH = 2000
+    JSON_CHUNK = 64 * 1024
+    INVALID_ROW = {"text": None, "column": None, "completed": False}  # учитывается импортом как неверная строка
+
+    @staticmethod
+    def detect_format(path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext in (".md", ".markdown", ".txt"):
+            return "markdown"
+        if ext in (".json", ".jsonl", ".ndjson"):
+            return "json"
+        return "csv"
+
+    @classmethod
+    def read(cls, f, fmt):
+        """Генератор строк {"text", "column", "completed"}; файл читается по частям."""
+        if fmt == "markdown":
+            return cls._read_markdown(f)
+        if fmt == "json":
+            return cls._read_json(f)
+        return cls._read_csv(f)
+
+    @classmethod
+    def _pick(cls, row, fields):
+        for field in fields:
+            if field in row and row[field] not in (None, ""):
+                return row[field]
+        return None
+
+    @classmethod
+    def _normalize(cls, row):
+        row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+        text = cls._pick(row, cls.TEXT_FIELDS)
+        completed = cls._pick(row, cls.COMPLETED_FIELDS)
+        if not isinstance(completed, bool):
+            completed = str(completed).strip().lower() in cls.TRUE_VALUES if completed is not None else False
+        column = cls._pick(row, cls.COLUMN_FIELDS)
+        return {
+            "text": text,
+            "column": str(column).strip() if column is not None else None,
+            "completed": completed,
+        }
+
+    @classmethod
+    def _read_csv(cls, f):
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        names = [h.strip().lower() for h in header]
+        if not any(name in cls.TEXT_FIELDS for name in names):
+            # Файл без заголовка: текст, колонка, выполнено
+            names = ["text", "column", "completed"]
+            yield cls._normalize(dict(zip(names, header)))
+        for values in reader:
+            if values:
+                yield cls._normalize(dict(zip(names, values)))
+
+    @classmethod
+    def _read_markdown(cls, f):
+        column = None
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith("#"):
+                title = stripped.lstrip("#").strip()
+                # Заголовок первого уровня — имя доски, колонки начинаются со второго
+                column = title if len(stripped) - len(stripped.lstrip("#")) > 1 and title else None
+                continue
+            if stripped[:2] not in ("- ", "* ", "+ "):
+                continue
+            item = stripped[2:].lstrip()
+            completed = False
+            if item[:3].lower() in ("[ ]", "[x]"):
+                completed = item[1].lower() == "x"
+                item = item[3:].strip()
+            yield {"text": item, "column": column, "completed": completed}
+
+    @classmethod
+    def _json_row(cls, obj):
+        if isinstance(obj, dict):
+            return cls._normalize(obj)
+        if isinstance(obj, str):
+            return {"text": obj, "column": None, "completed": False}
+        return dict(cls.INVALID_ROW)
+
+    @staticmethod
+    def _json_truncated(buffer, error):
+        """Ошибка из-за того, что элемент дочитан не до конца, а не из-за повреждения."""
+        return error.msg.startswith("Unterminated string") or re.fullmatch(r"[\w.+-]*\s*", buffer[error.pos:]) is not None
+
+    @staticmethod
+    def _json_element_end(buffer):
+        """Позиция ',' или ']', которыми кончается повреждённый элемент массива; None — элемент не дочитан."""
+        depth = 0
+        in_string = escaped = False
+        for i, ch in enumerate(buffer):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in "[{":
+                depth += 1
+            elif ch in "]}":
+                if depth == 0:
+                    return i
+                depth -= 1
+            elif ch == "," and depth == 0:
+                return i
+        return None
+
+    @classmethod
+    def _read_json(cls, f):
+        decoder = json.JSONDecoder()
+        buffer = f.read(cls.JSON_CHUNK).lstrip()
+        if buffer.startswith("["):
+            buffer = buffer[1:]
+            while True:
+                buffer = buffer.lstrip().lstrip(",").lstrip()
+                if buffer.startswith("]"):
+                    return
+                try:
+                    obj, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError as e:
+                    # Дочитываем, только если элемент оборван концом буфера; повреждённый пропускаем до следующего
+                    end = None if cls._json_truncated(buffer, e) else cls._json_element_end(buffer)
+                    if end is None:
+                        chunk = f.read(cls.JSON_CHUNK)
+                        if chunk:
+                            buffer += chunk
+                            continue
+                        # Файл оборван: незакрытый элемент — неверная строка, а не тихий конец импорта
+                        if buffer.strip():
+                            yield dict(cls.INVALID_ROW)
+                        return
+                    buffer = buffer[end:]
+                    yield dict(cls.INVALID_ROW)
+                    continue
+                buffer = buffer[end:]
+                yield cls._json_row(obj)
+        else:
+            # JSON Lines: один объект на строку
+            pending = ""
+            while True:
+                lines = (pending + buffer).split("\n")
+                pending = lines.pop()
+                for line in lines:
+                    line = line.strip()
+                    if line:
+                        yield cls._json_line(line)
+                buffer = f.read(cls.JSON_CHUNK)
+                if not buffer:
+                    break
+            if pending.strip():
+                yield cls._json_line(pending)
+
+    @classmethod
+    def _json_line(cls, line):
+        try:
+            return cls._json_row(json.loads(line))
+        except ValueError:
+            return dict(cls.INVALID_ROW)
+
+    @classmethod
+    def write(cls, f, fmt, rows):
+        """Записывает строки {"text", "column", "column_title", "completed"} по одной."""
+        if fmt == "markdown":
+            column = None
+            for row in rows:
+                if row["column_title"] != column:
+                    if column is not None:
+                        f.write("\n")
+                    f.write(f"## {row['column_title']}\n\n")
+                    column = row["column_title"]
+                f.write(f"- [{'x' if row['completed'] else ' '}] {row['text']}\n")
+        elif fmt == "json":
+            f.write("[\n")
+            first = True
+            for row in rows:
+                if not first:
+                    f.write(",\n")
+                first = False
+                f.write(json.dumps({"text": row["text"], "column": row["column"], "completed": row["completed"]}, ensure_ascii=False))
+            f.write("\n]\n")
+        else:
+            writer = csv.writer(f)
+            writer.writerow(["text", "column", "completed"])
+            for row in rows:
+                writer.writerow([row["text"], row["column"], "1" if row["completed"] else "0"])
+
+# === ПОИСКОВЫЙ ИНДЕКС ===
+class SearchIndex:
+    """Инвертированный индекс в памяти: слово -> документы. Обновляется по одному документу,
+    поддерживает поиск по префиксу и нечёткий поиск (одна опечатка).
+    Отсортированный словарь для префиксов обновляется не на каждое слово, а перед поиском — одним слиянием."""
+    TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+    FUZZY_MIN_LENGTH = 4    # короче этого опечатки не ищем
+
+    def __init__(self):
+        self.docs = {}       # документ -> кортеж его слов
+        self.postings = {}   # слово -> {документ: None}
+        self.vocab = []      # отсортированный словарь для поиска по префиксу
+        self.new_words = []  # слова, ещё не влитые в vocab
+        self.stale = 0       # сколько слов в vocab уже удалены из индекса
+        self.deletes = {}    # слово без одной буквы -> {слово: None}
+
+    def __len__(self):
+        return len(self.docs)
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.TOKEN_RE.findall(text.lower())
+
+    @staticmethod
+    def _deletions(token):
+        return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+    def update(self, doc_id, text):
+        tokens = tuple(dict.fromkeys(self.tokenize(text)))
+        if self.docs.get(doc_id) == tokens:
+            return
+        self.discard(doc_id)
+        self.docs[doc_id] = tokens
+        for token in tokens:
+            docs = self.postings.get(token)
+            if docs is None:
+                docs = self.postings[token] = {}
+                self.new_words.append(token)
+                if len(token) >= self.FUZZY_MIN_LENGTH:
+                    for variant in self._deletions(token):
+                        self.deletes.setdefault(variant, {})[token] = None
+            docs[doc_id] = None
+
+    def discard(self, doc_id):
+        for token in self.docs.pop(doc_id, ()):
+            docs = self.postings[token]
+            docs.pop(doc_id, None)
+            if docs:
+                continue
+            del self.postings[token]
+            self.stale += 1
+            if len(token) >= self.FUZZY_MIN_LENGTH:
+                for variant in self._deletions(token):
+                    same = self.deletes.get(variant)
+                    if same is not None:
+                        same.pop(token, None)
+                        if not same:
+                            del self.deletes[variant]
+
+    def _sorted_vocab(self):
+        """Вливает новые слова в словарь. Два отсортированных куска timsort сливает за линейное время,
+        поэтому пакет из тысяч слов стоит одного прохода, а не прохода на слово."""
+        if self.new_words or self.stale > len(self.vocab) // 2:
+            self.new_words.sort()
+            merged = sorted(self.vocab + self.new_words)
+            # Удалённые слова и повторно добавленные дубли выбрасываются здесь же
+            self.vocab = [token for i, token in enumerate(merged)
+                          if token in self.postings and (i == 0 or merged[i - 1] != token)]
+            self.new_words = []
+            self.stale = 0
+        return self.vocab
+
+    def _term_matches(self, term):
+        """Документы для одного слова запроса: точное совпадение (3), префикс (2), опечатка (1)."""
+        vocab = self._sorted_vocab()
+        start = bisect.bisect_left(vocab, term)
+        end = bisect.bisect_left(vocab, term + "\uffff", start)
+        prefixed = [self.postings[token] for token in vocab[start:end] if token != term and token in self.postings]
+        scores = dict.fromkeys(set().union(*prefixed), 2)
+        scores.update(dict.fromkeys(self.postings.get(term, ()), 3))
+        # Опечатки ищем, только если слово не нашлось ни целиком, ни по префиксу
+        if not scores and len(term) >= self.FUZZY_MIN_LENGTH:
+            similar = set(self.deletes.get(term, ()))
+            for variant in self._deletions(term):
+                if variant in self.postings:
+                    similar.add(variant)
+                similar.update(self.deletes.get(variant, ()))
+            scores = dict.fromkeys(set().union(*(self.postings[token] for token in similar)), 1)
+        return scores
+
+    def search(self, query):
+        """Возвращает {документ: вес}; документ должен подходить под каждое слово запроса."""
+        terms = list(dict.fromkeys(self.tokenize(query)))
+        if not terms:
+            return {}
+        per_term = sorted((self._term_matches(term) for term in terms), key=len)
+        result = per_term[0]
+        for scores in per_term[1:]:
+            result = {doc_id: result[doc_id] + scores[doc_id] for doc_id in result.keys() & scores.keys()}
+            if not result:
+                break
+        return result
+
+# === ЖУРНАЛ СОБЫТИЙ ЗАДАЧ ===
+class TaskEventStore:
+    """Переходы задач между колонками в столбцовом виде (массивы numpy).
+    События дописываются в бинарный файл записями фиксированного размера, id задач и
+    ключи колонок хранятся отдельно и заменяются в событиях целыми кодами."""
+    DTYPE = np.dtype([("time", "<f8"), ("task", "<i4"), ("src", "<i2"), ("dst", "<i2")])
+    NONE = -1  # задачи не было / задача удалена
+
+    def __init__(self, events_path, tasks_path, columns_path):
+        self.events_path = events_path
+        self.tasks_path = tasks_path
+        self.columns_path = columns_path
+        self.task_ids = []
+        self.columns = []
+        if os.path.exists(tasks_path):
+            with open(tasks_path, "r", encoding="utf-8") as f:
+                self.task_ids = [line.rstrip("\n") for line in f]
+        if os.path.exists(columns_path):
+            with open(columns_path, "r", encoding="utf-8") as f:
+                self.columns = json.load(f)
+        self.task_codes = {task_id: i for i, task_id in enumerate(self.task_ids)}
+        self.column_codes = {key: i for i, key in enumerate(self.columns)}
+        data = np.empty(0, dtype=self.DTYPE)
+        if os.path.exists(events_path):
+            count = os.path.getsize(events_path) // self.DTYPE.itemsize
+            data = np.fromfile(events_path, dtype=self.DTYPE, count=count)
+            # Событие с кодом задачи, который не успел записаться, отбрасываем
+            data = data[data["task"] < len(self.task_ids)]
+        self.size = len(data)
+        self._data = np.empty(max(1024, self.size * 2), dtype=self.DTYPE)
+        self._data[:self.size] = data
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def events(self):
+        return self._data[:self.size]
+
+    def column_code(self, key):
+        if key is None:
+            return self.NONE
+        code = self.column_codes.get(key)
+        if code is None:
+            code = self.column_codes[key] = len(self.columns)
+            self.columns.append(key)
+            with open(self.columns_path, "w", encoding="utf-8") as f:
+                json.dump(self.columns, f, ensure_ascii=False)
+        return code
+
+    def record(self, transitions, timestamp=None):
+        """transitions — список (id задачи, колонка до, колонка после)."""
+        if not transitions:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        new_ids = []
+        batch = np.empty(len(transitions), dtype=self.DTYPE)
+        batch["time"] = timestamp
+        for i, (task_id, src, dst) in enumerate(transitions):
+            code = self.task_codes.get(task_id)
+            if code is None:
+                code = self.task_codes[task_id] = len(self.task_ids)
+                self.task_ids.append(task_id)
+                new_ids.append(task_id)
+            batch[i] = (timestamp, code, self.column_code(src), self.column_code(dst))
+        try:
+            if new_ids:
+                with open(self.tasks_path, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{task_id}\n" for task_id in new_ids))
+            with open(self.events_path, "ab") as f:
+                batch.tofile(f)
+        except OSError as e:
+            print(f"❌ Events save error: {e}")
+        end = self.size + len(batch)
+        if end > len(self._data):
+            grown = np.empty(max(end, len(self._data) * 2), dtype=self.DTYPE)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:end] = batch
+        self.size = end
+
+    def _per_task(self, reduce, tasks, times):
+        """Свёртка времени событий по задачам (np.fmin — первое, np.fmax — последнее); NaN — событий нет."""
+        result = np.full(len(self.task_ids), np.nan)
+        reduce.at(result, tasks, times)
+        return result
+
+    def analytics(self, done_column="done", start_column="progress", wip_columns=None, days=30, now=None):
+        """Пропускная способность по дням, перцентили cycle/lead time (в часах) и WIP на конец каждого дня."""
+        now = time.time() if now is None else now
+        events = self.events
+        t, task, src, dst = events["time"], events["task"], events["src"], events["dst"]
+        done = self.column_codes.get(done_column, -2)
+        start = self.column_codes.get(start_column, -2)
+        day = 24 * 60 * 60
+        local = time.localtime(now)
+        midnight = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, 0, 0, 0, 0, 0, -1))
+        day_ends = midnight + day * np.arange(2 - days, 2)  # граница конца каждого из последних days дней
+        # Пропускная способность: сколько задач вошло в done за каждый день
+        into_done = t[dst == done]
+        into_done = into_done[into_done >= day_ends[0] - day]
+        bins = np.searchsorted(day_ends, into_done, side="right")
+        throughput = np.bincount(bins[bins < days], minlength=days)
+        # Cycle time: первое попадание в работу -> последнее попадание в done; lead time: создание -> done
+        is_done, is_start, is_new = dst == done, dst == start, src == self.NONE
+        finished = self._per_task(np.fmax, task[is_done], t[is_done])
+        started = self._per_task(np.fmin, task[is_start], t[is_start])
+        created = self._per_task(np.fmin, task[is_new], t[is_new])
+        cycle = (finished - started) / 3600
+        lead = (finished - created) / 3600
+        cycle = cycle[np.isfinite(cycle) & (cycle >= 0)]
+        lead = lead[np.isfinite(lead) & (lead >= 0)]
+        percentiles = (50, 85, 95)
+        # WIP: +1 при входе в колонку работы, -1 при выходе; значение на конец дня — кумулятивная сумма
+        if wip_columns is None:
+            wip_columns = [key for key in self.columns if key not in ("todo", done_column)]
+        in_wip = np.zeros(len(self.columns) + 1, dtype=np.int32)  # сдвиг на 1: код NONE = -1
+        in_wip[[self.column_codes[key] + 1 for key in wip_columns if key in self.column_codes]] = 1
+        delta = in_wip[dst + 1] - in_wip[src + 1]
+        running = np.concatenate(([0], np.cumsum(delta)))
+        wip = running[np.searchsorted(t, day_ends, side="right")]
+        return {
+            "throughput": throughput,
+            "wip": wip,
+            "cycle_time": dict(zip(percentiles, np.percentile(cycle, percentiles))) if len(cycle) else {},
+            "lead_time": dict(zip(percentiles, np.percentile(lead, percentiles))) if len(lead) else {},
+            "samples": len(cycle),
+        }
+
+# === КОЛЕСО НАПОМИНАНИЙ ===
+class TimerWheel:
+    """Иерархическое колесо таймеров с шагом в секунду: 4 уровня по 64 слота (~194 дня), дальше — общий список.
+    Вставка и отмена — O(1); тик разбирает один слот и изредка переносит слот верхнего уровня вниз,
+    пустые участки времени пропускаются целыми блоками."""
+    BITS = 6
+    SLOTS = 1 << BITS
+    LEVELS = 4
+
+    def __init__(self, now):
+        self.current = int(now)
+        self.wheels = [[{} for _ in range(self.SLOTS)] for _ in range(self.LEVELS)]
+        self.overflow = {}
+        self.counts = [0] * (self.LEVELS + 1)  # число ключей на каждом уровне, последний — overflow
+        self.where = {}  # ключ -> (слот, уровень)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key, due):
+        self.cancel(key)
+        self._place(key, max(int(due), self.current + 1))
+
+    def cancel(self, key):
+        entry = self.where.pop(key, None)
+        if entry is not None:
+            bucket, level = entry
+            del bucket[key]
+            self.counts[level] -= 1
+
+    def _place(self, key, due):
+        # Уровень — самый младший, в блоке которого совпадают текущее время и срок
+        for level in range(self.LEVELS):
+            shift = self.BITS * (level + 1)
+            if due >> shift == self.current >> shift:
+                bucket = self.wheels[level][(due >> (self.BITS * level)) & (self.SLOTS - 1)]
+                break
+        else:
+            level, bucket = self.LEVELS, self.overflow
+        bucket[key] = due
+        self.where[key] = (bucket, level)
+        self.counts[level] += 1
+
+    def advance(self, now):
+        """Продвигает колесо до now и возвращает ключи, чей срок наступил."""
+        fired = []
+        now = int(now)
+        while self.current < now and self.where:
+            # Пока младшие уровни пусты, прыгаем к концу блока — там сработает перенос сверху
+            level = 0
+            while self.counts[level] == 0:
+                level += 1
+            if level:
+                self.current = min(now - 1, self.current | ((1 << (self.BITS * level)) - 1))
+            self.current += 1
+            if self.current & ((1 << (self.BITS * self.LEVELS)) - 1) == 0:
+                self._cascade(self.overflow, self.LEVELS)
+            for level in range(self.LEVELS - 1, 0, -1):
+                if self.current & ((1 << (self.BITS * level)) - 1) == 0:
+                    slot = (self.current >> (self.BITS * level)) & (self.SLOTS - 1)
+                    self._cascade(self.wheels[level][slot], level)
+            bucket = self.wheels[0][self.current & (self.SLOTS - 1)]
+            for key in bucket:
+                del self.where[key]
+                fired.append(key)
+            self.counts[0] -= len(bucket)
+            bucket.clear()
+        self.current = max(self.current, now)
+        return fired
+
+    def _cascade(self, bucket, level):
+        entries = list(bucket.items())
+        bucket.clear()
+        self.counts[level] -= len(entries)
+        for key, due in entries:
+            del self.where[key]
+            self._place(key, due)
+
+# === БИБЛИОТЕКА МУЗЫКИ ===
+class _LibrarySignals(QObject):
+    batch = pyqtSignal(object)     # путь -> запись индекса
+    finished = pyqtSignal(object)  # итог обхода: перечитанные папки, найденные файлы и подпапки, переименования
+
+class _LibraryScanJob(QRunnable):
+    """Обходит папки музыки в фоновом потоке; теги и длительность читает только у новых и изменённых файлов.
+    Переименованный или перенесённый файл узнаётся по размеру и mtime и забирает запись без повторного чтения тегов."""
+    BATCH = 200
+
+    def __init__(self, targets, known, signals):
+        super().__init__()
+        self.targets = targets  # [(папка, рекурсивно)]
+        self.known = known      # путь -> запись индекса
+        self.signals = signals
+
+    def run(self):
+        listed = {}  # перечитанная папка -> mtime (None — папки больше нет)
+        unreadable = set()
+        subdirs = set()
+        seen = set()
+        renamed = {}
+        batch = {}
+        by_stamp = None
+        stack = list(self.targets)
+        while stack:
+            directory, recursive = stack.pop()
+            if directory in listed:
+                continue
+            try:
+                listed[directory] = os.stat(directory).st_mtime
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                listed[directory] = None
+                continue
+            except OSError as e:
+                listed.pop(directory, None)
+                unreadable.add(directory)
+                print(f"❌ Library scan error {directory}: {e}")
+                continue
+            for entry in entries:
+                path = os.path.join(directory, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(path)
+                        if recursive:
+                            stack.append((path, True))
+                        continue
+                    if not entry.name.lower().endswith(MUSIC_EXTENSIONS) or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                seen.add(path)
+                info = self.known.get(path)
+                if info is not None and (info["size"], info["mtime"]) == (st.st_size, st.st_mtime):
+                    continue
+                old_path = None
+                if info is None:
+                    if by_stamp is None:
+                        by_stamp = {(i["size"], i["mtime"]): p for p, i in self.known.items()}
+                    old_path = by_stamp.get((st.st_size, st.st_mtime))
+                    if old_path is None or old_path in renamed or os.path.exists(old_path):
+                        old_path = None
+                if old_path is not None:
+                    renamed[old_path] = path
+                    batch[path] = dict(self.known[old_path])
+                else:
+                    batch[path] = self.read_info(path, st)
+                if len(batch) >= self.BATCH:
+                    self.signals.batch.emit(batch)
+                    batch = {}
+        if batch:
+            self.signals.batch.emit(batch)
+        self.signals.finished.emit({
+            "listed": listed, "subdirs": subdirs, "files": seen, "renamed": renamed,
+            "recursive": [directory for directory, recursive in self.targets if recursive], "unreadable": unreadable
+        })
+
+    @staticmethod
+    def read_info(path, st):
+        info = {"size": st.st_size, "mtime": st.st_mtime, "duration": None, "title": None, "artist": None, "album": None}
+        try:
+            if mutagen is not None:
+                audio = mutagen.File(path, easy=True)
+                if audio is not None:
+                    if audio.info is not None:
+                        info["duration"] = round(audio.info.length, 2)
+                    for tag in ("title", "artist", "album"):
+                        values = audio.get(tag)
+                        if values:
+                            info[tag] = str(values[0])
+            elif path.lower().endswith(".wav"):
+                with wave.open(path, "rb") as f:
+                    info["duration"] = round(f.getnframes() / f.getframerate(), 2)
+        except Exception as e:
+            print(f"❌ Library tags error {path}: {e}")
+        return info
+
+class MusicLibrary(QObject):
+    """Индекс музыкальной библиотеки: путь -> размер, mtime, длительность и теги.
+    Индекс хранится в кэше в data/, поэтому панель открывается сразу. Полный обход корней делается один раз
+    при запуске, дальше QFileSystemWatcher (или опрос mtime папок, если наблюдать не удалось) перечитывает
+    только изменившиеся папки."""
+    changed = pyqtSignal(object, object)  # новые или изменённые пути, удалённые пути
+    renamed = pyqtSignal(object)          # старый путь -> новый
+    POLL_INTERVAL_MS = 5000
+    SAVE_DELAY_MS = 5000
+
+    def __init__(self, cache_path, roots, parent=None):
+        super().__init__(parent)
+        self.cache_path = cache_path
+        self.roots = list(roots)
+        self.tracks = {}
+        try:
+            if os.path.exists(cache_path):
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    self.tracks = json.load(f).get("tracks", {})
+        except Exception as e:
+            print(f"❌ Library cache error: {e}")
+        # Корень могли убрать из настроек, пока приложение было закрыто
+        prefixes = tuple(os.path.join(root, "") for root in self.roots)
+        outside = [path for path in self.tracks if not path.startswith(prefixes)]
+        for path in outside:
+            del self.tracks[path]
+        self.dir_files = {}  # папка -> пути треков в ней
+        for path in self.tracks:
+            self.dir_files.setdefault(os.path.dirname(path), set()).add(path)
+        self.dirs = {}     # известная папка -> mtime при последнем чтении
+        self.pending = {}  # папка -> рекурсивно; ждёт следующего фонового обхода
+        self.dirty = bool(outside)
+        self.scanning = False
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.signals = _LibrarySignals()
+        self.signals.batch.connect(self._on_batch)
+        self.signals.finished.connect(self._on_finished)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.scan_directory)
+        self.watched = set()
+        self.polled = set()  # папки, которые наблюдатель не взял, — их проверяем по mtime
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self._poll)
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.timeout.connect(self.save)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __contains__(self, path):
+        return path in self.tracks
+
+    def get(self, path):
+        return self.tracks.get(path)
+
+    def scan(self):
+        """Полный фоновый обход всех корней."""
+        for root in self.roots:
+            self.pending[root] = True
+        self._start()
+
+    def scan_directory(self, directory):
+        """Перечитывает одну папку; новые подпапки потом обходятся целиком."""
+        self.pending.setdefault(directory, False)
+        self._start()
+
+    def set_roots(self, roots):
+        roots = list(dict.fromkeys(roots))
+        dropped = [root for root in self.roots if root not in roots]
+        self.roots = roots
+        removed = []
+        for root in dropped:
+            removed.extend(self._drop_directory(root))
+        if removed:
+            self.dirty = True
+            self.save_timer.start(self.SAVE_DELAY_MS)
+            self.changed.emit([], removed)
+        for root in roots:
+            if root not in self.dirs:
+                self.pending[root] = True
+        self._start()
+
+    def _start(self):
+        if self.scanning or not self.pending:
+            return
+        targets, self.pending = list(self.pending.items()), {}
+        self.scanning = True
+        self.pool.start(_LibraryScanJob(targets, dict(self.tracks), self.signals))
+
+    def _on_batch(self, entries):
+        for path in entries:
+            self.dir_files.setdefault(os.path.dirname(path), set()).add(path)
+        self.tracks.update(entries)
+        self.dirty = True
+        self.changed.emit(list(entries), [])
+
+    def _on_finished(self, result):
+        listed, subdirs = result["listed"], result["subdirs"]
+        removed = []
+        for directory, mtime in listed.items():
+            gone = self.dir_files.get(directory, set()) - result["files"]
+            for path in gone:
+                del self.tracks[path]
+            if gone:
+                self.dir_files[directory] -= gone
+            removed.extend(gone)
+            if mtime is None:
+                removed.extend(self._drop_directory(directory))
+        # Подпапки, пропавшие из перечитанных папок, уходят вместе со всем содержимым
+        for directory in [d for d in self.dirs if os.path.dirname(d) in listed and d not in subdirs and d not in listed]:
+            removed.extend(self._drop_directory(directory))
+        # Папки из кэша прошлых сессий в self.dirs не попадают: после полного обхода корня
+        # всё, что лежит под ним и не было перечитано, удалено с диска
+        skipped = tuple(os.path.join(d, "") for d in result["unreadable"])
+        for root in result["recursive"]:
+            if listed.get(root) is None:
+                continue
+            prefix = os.path.join(root, "")
+            for directory in [d for d in self.dir_files if d.startswith(prefix) and d not in listed]:
+                if directory not in result["unreadable"] and not directory.startswith(skipped) and directory in self.dir_files:
+                    removed.extend(self._drop_directory(directory))
+        new_dirs = []
+        for directory, mtime in listed.items():
+            if mtime is not None:
+                if directory not in self.watched:
+                    new_dirs.append(directory)
+                self.dirs[directory] = mtime
+        for directory in subdirs:
+            if directory not in listed and directory not in self.dirs:
+                self.pending[directory] = True
+        if new_dirs:
+            self.watched.update(new_dirs)
+            failed = self.watcher.addPaths(new_dirs)
+            if failed:
+                self.polled.update(failed)
+                if not self.poll_timer.isActive():
+                    self.poll_timer.start(self.POLL_INTERVAL_MS)
+            # Папка могла измениться между чтением и постановкой на наблюдение
+            for directory in new_dirs:
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except OSError:
+                    mtime = None
+                if mtime != listed[directory]:
+                    self.pending.setdefault(directory, False)
+        if removed:
+            self.dirty = True
+            self.changed.emit([], removed)
+        if result["renamed"]:
+            self.renamed.emit(result["renamed"])
+        self.scanning = False
+        self._start()
+        if self.dirty and not self.scanning:
+            self.save_timer.start(self.SAVE_DELAY_MS)
+
+    def _drop_directory(self, directory):
+        """Забывает папку и всё, что под ней; возвращает удалённые из индекса треки."""
+        prefix = os.path.join(directory, "")
+        removed = []
+        for path in [d for d in set(self.dirs) | set(self.dir_files) if d == directory or d.startswith(prefix)] + [directory]:
+            self.dirs.pop(path, None)
+            for track in self.dir_files.pop(path, ()):
+                del self.tracks[track]
+                removed.append(track)
+            if path in self.watched:
+                self.watched.discard(path)
+                self.watcher.removePath(path)
+            self.polled.discard(path)
+        if not self.polled:
+            self.poll_timer.stop()
+        return removed
+
+    def _poll(self):
+        for directory in list(self.polled):
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self.dirs.get(directory):
+                self.scan_directory(directory)
+
+    def set_loudness(self, path, loudness):
+        """Результат анализа громкости хранится в индексе рядом с тегами; изменённый файл получит новую запись без него."""
+        info = self.tracks.get(path)
+        if info is None:
+            return
+        info["loudness"] = loudness
+        self.dirty = True
+        if not self.scanning:
+            self.save_timer.start(self.SAVE_DELAY_MS)
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            tmp_path = self.cache_path + ".tmp"
+            # dumps целиком идёт через C-кодировщик — в разы быстрее потокового dump на больших библиотеках
+            text = json.dumps({"version": 1, "tracks": self.tracks}, ensure_ascii=False)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+        except Exception as e:
+            print(f"❌ Library cache save error: {e}")
+
+class LibraryModel(QAbstractTableModel):
+    """Модель библиотеки для QTableView: хранит только отсортированный список путей, прошедших фильтр.
+    Строки рисуются по мере прокрутки, изменения индекса приходят вставками и удалениями отдельных строк."""
+    STATE, NAME, DURATION, FOLDER = range(4)
+    IN_PLAYLIST_ROLE = Qt.UserRole + 1
+    BULK_CHANGES = 1000  # больше изменений за раз — дешевле пересобрать список целиком
+    WARM_UP_SLICE_MS = 10
+    WARM_UP_INTERVAL_MS = 50  # между порциями интерфейс свободен не меньше 80% времени
+
+    def __init__(self, library, display_name, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.display_name = display_name
+        self.in_playlist = lambda path: False
+        self.headers = ["", "Name", "Duration", "Folder"]
+        self.sort_column = self.NAME
+        self.descending = False
+        self.terms = []
+        self.order = []  # отсортированные ключ + (путь,) — плоские кортежи сравниваются быстрее вложенных
+        self.keys = {}   # путь -> ключ сортировки
+        self.entries = {}  # путь -> (название, название в нижнем регистре, текст для фильтра)
+        self.built = False  # список строится при первом показе панели
+
+    def entry(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            name = self.display_name(path)
+            album = self.library.get(path).get("album") or ""
+            entry = self.entries[path] = (name, name.lower(), f"{name} {path} {album}".lower())
+        return entry
+
+    def sort_key(self, path):
+        name = self.entry(path)[1]
+        if self.sort_column == self.DURATION:
+            duration = self.library.get(path).get("duration")
+            return (duration if duration is not None else -1.0, name)
+        if self.sort_column == self.FOLDER:
+            return (os.path.dirname(path).lower(), name)
+        return (name,)
+
+    def matches(self, path):
+        text = self.entry(path)[2]
+        return all(term in text for term in self.terms)
+
+    def rebuild(self):
+        self.beginResetModel()
+        self.built = True
+        if len(self.entries) > len(self.library.tracks) * 2:
+            self.entries = {}
+        paths = self.library.tracks
+        if self.terms:
+            paths = [path for path in paths if self.matches(path)]
+        self.keys = {path: self.sort_key(path) for path in paths}
+        self.order = sorted(key + (path,) for path, key in self.keys.items())
+        self.endResetModel()
+
+    def ensure_built(self):
+        if not self.built:
+            self.rebuild()
+
+    def warm_up(self):
+        """Готовит названия короткими порциями в фоне, чтобы первое открытие панели только сортировало.
+        Сам список строится лениво — при первом показе панели."""
+        self.warm_up_paths = iter(list(self.library.tracks))
+        self.warm_up_timer = QTimer(self)
+        self.warm_up_timer.timeout.connect(self._warm_up_step)
+        self.warm_up_timer.start(self.WARM_UP_INTERVAL_MS)
+
+    def _warm_up_step(self):
+        if self.built:
+            # Панель уже открыли — rebuild() подготовил все названия сам
+            self.warm_up_timer.stop()
+            return
+        clock = QElapsedTimer()
+        clock.start()
+        for path in self.warm_up_paths:
+            if path in self.library:
+                self.entry(path)
+            if clock.elapsed() >= self.WARM_UP_SLICE_MS:
+                return
+        self.warm_up_timer.stop()
+
+    def set_filter(self, text):
+        terms = text.lower().split()
+        if terms != self.terms:
+            self.terms = terms
+            if self.built:
+                self.rebuild()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Колонку +/− не сортируем — она сортирует по названию
+        column = column if column != self.STATE else self.NAME
+        descending = order == Qt.DescendingOrder
+        # QTableView может запросить одну и ту же сортировку дважды подряд
+        if (column, descending) == (self.sort_column, self.descending) and self.built:
+            return
+        self.sort_column = column
+        self.descending = descending
+        if self.built:
+            self.rebuild()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 4
+
+    def path_at(self, row):
+        return self.order[len(self.order) - 1 - row if self.descending else row][-1]
+
+    def row_of(self, path):
+        key = self.keys.get(path)
+        if key is None:
+            return None
+        i = bisect.bisect_left(self.order, key + (path,))
+        return len(self.order) - 1 - i if self.descending else i
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.path_at(index.row())
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == self.NAME:
+                return self.entry(path)[0]
+            if column == self.DURATION:
+                duration = self.library.get(path).get("duration")
+                if duration is None:
+                    return "—"
+                m, s = divmod(int(duration), 60)
+                return f"{m}:{s:02}"
+            if column == self.FOLDER:
+                return os.path.basename(os.path.dirname(path))
+        elif role == Qt.ToolTipRole:
+            return path
+        elif role == Qt.UserRole:
+            return path
+        elif role == self.IN_PLAYLIST_ROLE:
+            return self.in_playlist(path)
+        elif role == Qt.TextAlignmentRole and column == self.DURATION:
+            return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def set_headers(self, headers):
+        self.headers = headers
+        self.headerDataChanged.emit(Qt.Horizontal, 0, 3)
+
+    def apply_changes(self, updated, removed):
+        """Переносит в модель изменения индекса: строки вставляются и удаляются по одной."""
+        for path in updated:
+            self.entries.pop(path, None)
+        for path in removed:
+            self.entries.pop(path, None)
+        if not self.built:
+            return
+        if len(updated) + len(removed) > max(self.BULK_CHANGES, len(self.order) // 4):
+            self.rebuild()
+            return
+        for path in removed:
+            self._remove(path)
+        for path in updated:
+            if path not in self.library or not self.matches(path):
+                self._remove(path)
+            elif self.keys.get(path) == self.sort_key(path):
+                self.refresh_path(path)
+            else:
+                self._remove(path)
+                self._insert(path)
+
+    def refresh_path(self, path):
+        row = self.row_of(path)
+        if row is not None:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, 3))
+
+    def _remove(self, path):
+        row = self.row_of(path)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.order[bisect.bisect_left(self.order, self.keys.pop(path) + (path,))]
+        self.endRemoveRows()
+
+    def _insert(self, path):
+        key = self.sort_key(path)
+        i = bisect.bisect_left(self.order, key + (path,))
+        row = len(self.order) - i if self.descending else i
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.order.insert(i, key + (path,))
+        self.keys[path] = key
+        self.endInsertRows()
+
+class LibraryStateDelegate(QStyledItemDelegate):
+    """Рисует «+»/«−» в первой колонке и по клику переключает трек в плейлисте."""
+    toggled = pyqtSignal(str)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        if option.state & QStyle.State_MouseOver:
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(255, 255, 255, 30))
+            painter.drawRoundedRect(option.rect.adjusted(3, 3, -3, -3), 10, 10)
+        painter.setPen(QColor("white"))
+        font = painter.font()
+        font.setPointSize(13)
+        painter.setFont(font)
+        painter.drawText(option.rect, Qt.AlignCenter, "−" if index.data(LibraryModel.IN_PLAYLIST_ROLE) else "+")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            self.toggled.emit(index.data(Qt.UserRole))
+            return True
+        return False
+
+# === ПЛЕЙЛИСТЫ ===
+class Playlist:
+    """Именованный плейлист: порядок держится на ключах rank, как у карточек kanban, а индекс путь -> ключ
+    даёт проверку «трек в плейлисте» за O(1). Перенос трека меняет только его ключ."""
+
+    def __init__(self, name, paths=()):
+        self.name = name
+        paths = list(dict.fromkeys(paths))
+        self.order = list(zip(rank_sequence(len(paths)), paths))  # отсортированные (rank, путь)
+        self.ranks = {path: rank for rank, path in self.order}     # путь -> rank
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, path):
+        return path in self.ranks
+
+    def __iter__(self):
+        return (path for _, path in self.order)
+
+    def path_at(self, index):
+        return self.order[index][1]
+
+    def position(self, path):
+        return bisect.bisect_left(self.order, (self.ranks[path], path))
+
+    def insert(self, path, index=None):
+        """Ставит трек на позицию index (None — в конец); трек, уже стоящий в плейлисте, переносится."""
+        if path in self.ranks:
+            self.remove(path)
+        if index is None or index > len(self.order):
+            index = len(self.order)
+        before = self.order[index - 1][0] if index > 0 else None
+        after = self.order[index][0] if index < len(self.order) else None
+        rank = rank_between(before, after)
+        self.order.insert(index, (rank, path))
+        self.ranks[path] = rank
+        if len(rank) > RANK_REBALANCE_LENGTH:
+            self.rebalance()
+        return index
+
+    def remove(self, path):
+        del self.order[self.position(path)]
+        del self.ranks[path]
+
+    def rebalance(self):
+        self.order = [(rank, path) for rank, (_, path) in zip(rank_sequence(len(self.order)), self.order)]
+        self.ranks = {path: rank for rank, path in self.order}
+
+    def to_json(self):
+        return {"name": self.name, "tracks": list(self)}
+
+class PlaylistModel(QAbstractListModel):
+    """Весь текущий плейлист для QListView: строки рисуются по мере прокрутки,
+    перетаскивание применяется как перенос одной строки, а не пересборка списка."""
+    MIME_TYPE = "application/x-focus-track"
+
+    def __init__(self, display_name, parent=None):
+        super().__init__(parent)
+        self.display_name = display_name
+        self.playlist = Playlist("")
+        self.current = None  # играющий трек — выделяется жирным
+        self.queued = ()     # треки в очереди «играть следующим»
+
+    def set_playlist(self, playlist):
+        self.beginResetModel()
+        self.playlist = playlist
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.playlist)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.playlist.path_at(index.row())
+        if role == Qt.DisplayRole:
+            return ("⏭ " if path in self.queued else "") + self.display_name(path)
+        if role == Qt.UserRole or role == Qt.ToolTipRole:
+            return path
+        if role == Qt.FontRole and path == self.current:
+            font = QFont()
+            font.setBold(True)
+            return font
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction
+
+    def mimeTypes(self):
+        return [self.MIME_TYPE]
+
+    def mimeData(self, indexes):
+        mime_data = QMimeData()
+        paths = [self.playlist.path_at(index.row()) for index in indexes if index.isValid()]
+        mime_data.setData(self.MIME_TYPE, json.dumps(paths).encode("utf-8"))
+        return mime_data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if not data.hasFormat(self.MIME_TYPE):
+            return False
+        if row < 0:
+            row = parent.row() if parent.isValid() else len(self.playlist)
+        for path in json.loads(bytes(data.data(self.MIME_TYPE)).decode("utf-8")):
+            if path in self.playlist:
+                row = self.move_path(path, row) + 1
+        # Перенос уже применён — виду не нужно удалять исходные строки
+        return False
+
+    def move_path(self, path, row):
+        """Переносит трек так, чтобы он встал перед строкой row; возвращает его новую позицию."""
+        source = self.playlist.position(path)
+        if row in (source, source + 1):
+            return source
+        self.beginMoveRows(QModelIndex(), source, source, QModelIndex(), row)
+        target = self.playlist.insert(path, row - 1 if row > source else row)
+        self.endMoveRows()
+        return target
+
+    def insert_path(self, path, index=None):
+        row = len(self.playlist) if index is None else min(index, len(self.playlist))
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.playlist.insert(path, row)
+        self.endInsertRows()
+
+    def remove_path(self, path):
+        row = self.playlist.position(path)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.playlist.remove(path)
+        self.endRemoveRows()
+
+    def refresh_path(self, path):
+        if path in self.playlist:
+            index = self.index(self.playlist.position(path))
+            self.dataChanged.emit(index, index)
+
+# === ЗВУКОВАЯ ПОДСИСТЕМА ===
+class LatencyProbe:
+    """Оценка задержки от действия до слышимого звука: от отметки mark() до начала блока, в который попало
+    изменение (heard()), плюс длительность буфера устройства. Хранит последние SAMPLES замеров на источник."""
+    SAMPLES = 20
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.pending = {}  # источник -> время первого ещё не прозвучавшего действия
+        self.samples = {}  # источник -> deque задержек, с
+
+    def mark(self, kind):
+        # При движении ползунка считается от первого шага, а не от последнего
+        self.pending.setdefault(kind, time.monotonic())
+
+    def heard(self, kind, at):
+        started = self.pending.pop(kind, None)
+        if started is None:
+            return
+        latency = max(0.0, at - started) + self.audio.device_latency()
+        self.samples.setdefault(kind, deque(maxlen=self.SAMPLES)).append(latency)
+
+    def summary(self, kind):
+        """(последняя, средняя, число замеров) в секундах или None."""
+        values = self.samples.get(kind)
+        if not values:
+            return None
+        return values[-1], sum(values) / len(values), len(values)
+
+class AudioSystem:
+    """Микшер pygame запускается при первом обращении к звуку, а не при импорте, с частотой, размером буфера
+    и числом каналов из AUDIO_SETTINGS_FILE. Короткий сигнал таймера загружается там же."""
+    DEFAULTS = {"frequency": 44100, "buffer": 512, "channels": 2}
+    FREQUENCIES = [22050, 32000, 44100, 48000]
+    BUFFERS = [128, 256, 512, 1024, 2048, 4096]
+    CHANNELS = [1, 2]
+
+    def __init__(self, settings_path):
+        self.settings_path = settings_path
+        self.settings = dict(self.DEFAULTS)
+        try:
+            if os.path.exists(settings_path):
+                with open(settings_path, "r", encoding="utf-8") as f:
+                    self.settings.update({k: int(v) for k, v in json.load(f).items() if k in self.DEFAULTS})
+        except Exception as e:
+            print(f"❌ Audio settings error: {e}")
+        self.started = False
+        self.failed = False
+        self.sounds = {}
+        self.channels = {}
+        self.probe = LatencyProbe(self)
+
+    def start(self):
+        if self.started or self.failed:
+            return self.started
+        clock = QElapsedTimer()
+        clock.start()
+        try:
+            pygame.mixer.init(frequency=self.settings["frequency"], size=-16,
+                              channels=self.settings["channels"], buffer=self.settings["buffer"])
+            pygame.init()
+        except pygame.error as e:
+            print(f"❌ Audio init error: {e}")
+            self.failed = True
+            return False
+        self.started = True
+        # Канал шумов и канал сигнала не отдаются Sound.play() под другие звуки
+        pygame.mixer.set_reserved(2)
+        if os.path.exists(SOUND_PATHS["timer_end"]):
+            self.channels["timer_end"] = pygame.mixer.Channel(TIMER_END_CHANNEL)
+            try:
+                self.sounds["timer_end"] = pygame.mixer.Sound(SOUND_PATHS["timer_end"])
+            except Exception as e:
+                print(f"❌ Failed to load sound timer_end: {e}")
+        print(f"✅ Audio started in {clock.elapsed()} ms: {pygame.mixer.get_init()}")
+        return True
+
+    def device_latency(self):
+        """Сколько звука стоит в буфере устройства, с."""
+        return self.settings["buffer"] / self.settings["frequency"]
+
+    def save_settings(self, settings):
+        self.settings.update(settings)
+        try:
+            with open(self.settings_path, "w", encoding="utf-8") as f:
+                json.dump(self.settings, f, indent=2)
+        except Exception as e:
+            print(f"❌ Audio settings save error: {e}")
+
+# === ФОНОВЫЕ ШУМЫ ===
+def to_mixer_frames(samples, rate):
+    """float32-кадры (кадры, каналы) -> float32 в частоте и числе каналов микшера pygame."""
+    frequency, _, mixer_channels = pygame.mixer.get_init()
+    if rate != frequency:
+        positions = np.arange(int(len(samples) * frequency / rate)) * (rate / frequency)
+        source = np.arange(len(samples))
+        samples = np.stack([np.interp(positions, source, samples[:, c]) for c in range(samples.shape[1])], axis=1)
+    if samples.shape[1] != mixer_channels:
+        samples = np.repeat(samples.mean(axis=1, keepdims=True), mixer_channels, axis=1)
+    return samples.astype(np.float32, copy=False)
+
+class _NoiseDecoder(threading.Thread):
+    """Декодирует файл шума по кругу кусками в ограниченную очередь: в памяти не больше buffer_chunks кусков."""
+    def __init__(self, path, chunk_seconds, buffer_chunks):
+        super().__init__(daemon=True)
+        self.path = path
+        self.chunk_seconds = chunk_seconds
+        self.chunks = queue.Queue(maxsize=buffer_chunks)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            with soundfile.SoundFile(self.path) as f:
+                if not f.frames:
+                    return
+                chunk_frames = int(self.chunk_seconds * f.samplerate)
+                while not self.stopped.is_set():
+                    parts, need = [], chunk_frames
+                    while need:
+                        block = f.read(need, dtype="float32", always_2d=True)
+                        if not len(block):
+                            f.seek(0)  # петля: кусок добирается с начала файла
+                            continue
+                        parts.append(block)
+                        need -= len(block)
+                    chunk = to_mixer_frames(np.concatenate(parts), f.samplerate)
+                    while not self.stopped.is_set():
+                        try:
+                            self.chunks.put(chunk, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+        except Exception as e:
+            print(f"❌ Noise stream error: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+class NoiseLayer:
+    """Слой фонового шума из файла. Загружается при первой ненулевой громкости; длинные петли
+    (при наличии soundfile) читаются кусками из ограниченного буфера, короткие лежат в памяти целиком.
+    gain — громкость, уже применённая к выходу, target — громкость с ползунка."""
+
+    def __init__(self, path):
+        self.path = path
+        self.gain = 0.0
+        self.target = 0.0
+        self.muted_at = None
+        self.samples = None  # int16 (кадры, каналы) короткой петли
+        self.position = 0
+        self.decoder = None
+        self.chunk = None    # недочитанный кусок потока
+        self.chunk_position = 0
+
+    def is_loaded(self):
+        return self.samples is not None or self.decoder is not None
+
+    def load(self):
+        try:
+            if soundfile is not None and os.path.getsize(self.path) >= NOISE_STREAM_MIN_BYTES:
+                self.decoder = _NoiseDecoder(self.path, NOISE_CHUNK_SECONDS, NOISE_BUFFER_CHUNKS)
+                self.decoder.start()
+            else:
+                self.samples = pygame.sndarray.array(pygame.mixer.Sound(self.path))
+                if self.samples.ndim == 1:
+                    self.samples = self.samples[:, None]
+                self.position = 0
+        except Exception as e:
+            print(f"❌ Failed to load sound {self.path}: {e}")
+
+    def unload(self):
+        if self.decoder is not None:
+            self.decoder.stop()
+            self.decoder = None
+        self.samples = self.chunk = None
+
+    def read(self, out):
+        """Заполняет out (кадры, каналы) следующими кадрами петли; при нехватке декодированного — тишиной."""
+        filled = 0
+        while filled < len(out):
+            if self.samples is not None:
+                source, start = self.samples, self.position
+            else:
+                if self.chunk is None or self.chunk_position >= len(self.chunk):
+                    try:
+                        self.chunk, self.chunk_position = self.decoder.chunks.get_nowait(), 0
+                    except queue.Empty:
+                        out[filled:] = 0
+                        return
+                source, start = self.chunk, self.chunk_position
+            count = min(len(out) - filled, len(source) - start)
+            out[filled:filled + count] = source[start:start + count]
+            filled += count
+            if self.samples is not None:
+                out[filled - count:filled] *= 1.0 / 32768
+                self.position = (start + count) % len(source)
+            else:
+                self.chunk_position = start + count
+
+def leaky_integrate(x, a, state, step=256):
+    """y[k] = a*y[k-1] + x[k] по первой оси, векторно: кусками по step, чтобы a**-k оставалось в пределах float64.
+    Возвращает y и новое состояние (последнюю строку y)."""
+    y = np.empty_like(x)
+    if a < 1:
+        step = max(1, min(step, int(300 / -math.log(a))))  # a**step не уходит в машинный ноль
+    powers = (a ** np.arange(step, dtype=np.float64))[:, None]
+    for start in range(0, len(x), step):
+        part = x[start:start + step]
+        p = powers[:len(part)]
+        y[start:start + len(part)] = p * (a * state + np.cumsum(part / p, axis=0))
+        state = y[start + len(part) - 1].astype(np.float64)
+    return y, state
+
+class NoiseGenerator:
+    """Процедурный слой шума (дождь, ветер, розовый, коричневый, белый): блоки считаются на лету
+    фильтрами NumPy из белого шума, состояние — несколько чисел на канал. Интерфейс как у NoiseLayer."""
+    KINDS = ("rain", "wind", "pink", "brown", "white")
+    LEVEL = 0.25  # среднеквадратичный уровень на выходе, как у записанных шумов
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.gain = 0.0
+        self.target = 0.0
+        self.muted_at = None
+        self.state = None
+
+    def is_loaded(self):
+        return self.state is not None
+
+    def load(self):
+        frequency, _, mixer_channels = pygame.mixer.get_init()
+        self.rate = frequency
+        self.rng = np.random.default_rng()
+        zero = np.zeros(mixer_channels)
+        self.state = {"b0": zero, "b1": zero, "b2": zero, "low": zero, "drop": zero, "gust": 0.6}
+
+    def unload(self):
+        self.state = None
+
+    def pole(self, cutoff):
+        """Коэффициент однополюсного фильтра для частоты среза cutoff (Гц)."""
+        return math.exp(-2 * math.pi * cutoff / self.rate)
+
+    def lowpass(self, x, key, cutoff):
+        a = self.pole(cutoff)
+        y, self.state[key] = leaky_integrate(x * (1 - a), a, self.state[key])
+        return y
+
+    def read(self, out):
+        white = self.rng.standard_normal(out.shape)
+        out[:] = getattr(self, "_" + self.kind)(white) * self.LEVEL
+
+    def _white(self, white):
+        return white
+
+    def _brown(self, white):
+        # Проинтегрированный белый шум; утечка не даёт уйти в постоянную составляющую
+        a = 0.998
+        y, self.state["low"] = leaky_integrate(white, a, self.state["low"])
+        return y * math.sqrt(1 - a * a)
+
+    def _pink(self, white):
+        # Приближение 1/f суммой трёх однополюсных фильтров (П. Келлет)
+        y = white * 0.1848
+        for key, a, weight in (("b0", 0.99765, 0.0990460), ("b1", 0.96300, 0.2965164), ("b2", 0.57000, 1.0526913)):
+            part, self.state[key] = leaky_integrate(white * weight, a, self.state[key])
+            y += part
+        return y * 0.3
+
+    def _wind(self, white):
+        # Низкочастотный шум с порывами: огибающая медленно блуждает от блока к блоку
+        gust = self.state["gust"]
+        target = min(1.0, max(0.2, gust + self.rng.normal(0, 0.15)))
+        self.state["gust"] = target
+        envelope = np.linspace(gust, target, len(white))[:, None]
+        a = self.pole(350)
+        return self.lowpass(white, "low", 350) * math.sqrt((1 + a) / (1 - a)) * envelope
+
+    def _rain(self, white):
+        # Шелест — белый шум без низов; капли — редкие импульсы с быстро затухающей огибающей
+        hiss = white - self.lowpass(white, "low", 1500)
+        impulses = (self.rng.random(white.shape) < 60 / self.rate) * self.rng.uniform(0.3, 1.0, white.shape)
+        envelope, self.state["drop"] = leaky_integrate(impulses, self.pole(40), self.state["drop"])
+        return hiss * 0.5 + envelope * white * 0.5
+
+class AmbientMixer(QObject):
+    """Сводит активные слои шума в один поток на одном канале pygame.
+    Громкость слоя меняется линейной рампой, поэтому движение ползунка не даёт щелчков. Исходные кадры
+    переданных каналу блоков хранятся, и при смене громкости звук пересводится с текущей позиции — её слышно сразу.
+    Неактивные слои не читаются и после NOISE_UNLOAD_DELAY_MS тишины освобождают память."""
+
+    def __init__(self, channel_index, probe, parent=None):
+        super().__init__(parent)
+        self.channel_index = channel_index
+        self.channel = None  # создаётся при первом блоке — микшер к этому моменту уже запущен
+        self.probe = probe
+        self.scheduled_end = 0.0  # когда закончится весь переданный каналу звук (time.monotonic)
+        self.layers = {}  # имя -> слой с методом read(out)
+        self.scheduled = deque()  # переданные каналу блоки: (начало, кадры, {имя: (кадры слоя, от, до, длина рампы)})
+        self.last_output = None  # (время, последний сведённый блок) — для визуализатора
+        self.feed_timer = QTimer(self)
+        self.feed_timer.setInterval(AMBIENT_FEED_INTERVAL_MS)
+        self.feed_timer.timeout.connect(self._feed)
+        self.unload_timer = QTimer(self)
+        self.unload_timer.setSingleShot(True)
+        self.unload_timer.timeout.connect(self._unload_muted)
+
+    def add_layer(self, name, layer):
+        self.layers[name] = layer
+
+    def set_volume(self, name, volume):
+        layer = self.layers[name]
+        if volume > 0 or self.feed_timer.isActive():
+            self.probe.mark("noise")
+        layer.target = volume
+        if volume > 0:
+            layer.muted_at = None
+            if not layer.is_loaded():
+                layer.load()
+        elif layer.muted_at is None:
+            layer.muted_at = time.monotonic()
+            if not self.unload_timer.isActive():
+                self.unload_timer.start(NOISE_UNLOAD_DELAY_MS)
+        if self.feed_timer.isActive():
+            self._remix()
+        elif volume > 0:
+            self._feed()
+            self.feed_timer.start()
+
+    def _feed(self):
+        """Держит за играющим блоком следующий в очереди канала."""
+        if not any(layer.gain or layer.target for layer in self.layers.values()):
+            self.feed_timer.stop()
+            return
+        if self.channel is None:
+            self.channel = pygame.mixer.Channel(self.channel_index)
+        for _ in range(2):
+            if self.channel.get_busy() and self.channel.get_queue() is not None:
+                return
+            sources, output = self._mix_block()
+            frames = len(output)
+            now = time.monotonic()
+            self.last_output = (now, output)
+            sound = pygame.mixer.Sound(buffer=output.tobytes())
+            if self.channel.get_busy():
+                self.channel.queue(sound)
+                start = max(now, self.scheduled_end)
+            else:
+                self.channel.play(sound)
+                self.scheduled.clear()
+                start = now
+            self.scheduled.append((start, frames, sources))
+            self.scheduled_end = start + frames / pygame.mixer.get_init()[0]
+            # Рампа громкости начинается с первого кадра блока — тогда изменение и слышно
+            self.probe.heard("noise", start)
+
+    def _mix_block(self):
+        """Следующий блок: кадры активных слоёв и сведённый из них int16."""
+        frequency, _, mixer_channels = pygame.mixer.get_init()
+        frames = int(frequency * AMBIENT_BLOCK_SECONDS)
+        sources = {}
+        for name, layer in self.layers.items():
+            if (layer.gain or layer.target) and layer.is_loaded():
+                block = np.empty((frames, mixer_channels), dtype=np.float32)
+                layer.read(block)
+                sources[name] = (block, layer.gain, layer.target, frames)
+            layer.gain = layer.target
+        return sources, self._render(sources, frames)
+
+    def _remix(self):
+        """Заменяет переданный каналу звук пересведённым с текущей позиции под новые громкости слоёв.
+        Кадры слоёв те же, что уже звучат, поэтому поток не прерывается — меняется только громкость."""
+        if self.channel is None or not self.channel.get_busy():
+            return
+        frequency, _, mixer_channels = pygame.mixer.get_init()
+        now = time.monotonic()
+        while self.scheduled and self.scheduled[0][0] + self.scheduled[0][1] / frequency <= now:
+            self.scheduled.popleft()
+        if not self.scheduled:
+            return
+        offset = max(0, int((now - self.scheduled[0][0]) * frequency))
+        frames = sum(block_frames for _, block_frames, _ in self.scheduled) - offset
+        ramp = min(frames, int(frequency * AMBIENT_RAMP_SECONDS))
+        if not any(layer.target for layer in self.layers.values()):
+            frames = ramp  # после затухания остаётся только тишина
+        if frames <= 0:
+            return
+        sources = {}
+        for name, layer in self.layers.items():
+            first = self.scheduled[0][2].get(name)
+            current = 0.0
+            if first is not None:
+                _, gain_from, gain_to, first_ramp = first
+                current = gain_from + (gain_to - gain_from) * min(offset / first_ramp, 1.0)
+            if not (current or layer.target):
+                layer.gain = layer.target
+                continue
+            parts = []
+            skip = offset
+            for _, block_frames, block_sources in self.scheduled:
+                if name in block_sources:
+                    parts.append(block_sources[name][0][skip:])
+                else:
+                    # Слой в этом блоке молчал: берём свежие кадры, если он включён, иначе тишину
+                    part = np.zeros((block_frames - skip, mixer_channels), dtype=np.float32)
+                    if layer.target and layer.is_loaded():
+                        layer.read(part)
+                    parts.append(part)
+                skip = 0
+            sources[name] = (np.concatenate(parts)[:frames], current, layer.target, ramp)
+            layer.gain = layer.target
+        output = self._render(sources, frames)
+        self.channel.play(pygame.mixer.Sound(buffer=output.tobytes()))
+        self.scheduled = deque([(now, frames, sources)])
+        self.scheduled_end = now + frames / frequency
+        self.last_output = (now, output)
+        self.probe.heard("noise", now)
+        # Остаток может быть короче интервала таймера — следующий блок ставим в очередь сразу
+        self._feed()
+
+    @staticmethod
+    def _render(sources, frames):
+        """Сводит кадры слоёв с рампой громкости: от прежней к новой за первые ramp кадров, дальше ровно."""
+        mix = np.zeros((frames, pygame.mixer.get_init()[2]), dtype=np.float32)
+        position = np.arange(frames, dtype=np.float32)[:, None]
+        for block, gain_from, gain_to, ramp in sources.values():
+            gain = gain_from + (gain_to - gain_from) * np.minimum(position / max(ramp, 1), 1.0)
+            mix += block * gain
+        np.clip(mix, -1.0, 1.0, out=mix)
+        return (mix * 32767).astype(np.int16)
+
+    def recent_block(self, frames):
+        """Кусок последнего сведённого блока в моно (float32), сдвигающийся со временем; None — шумы молчат."""
+        last = self.last_output
+        if last is None or not self.feed_timer.isActive():
+            return None
+        produced_at, output = last
+        if len(output) < frames:
+            return None
+        offset = int((time.monotonic() - produced_at) * pygame.mixer.get_init()[0]) % (len(output) - frames + 1)
+        return output[offset:offset + frames].mean(axis=1, dtype=np.float32) / 32768
+
+    def _unload_muted(self):
+        now = time.monotonic()
+        waiting = []
+        for layer in self.layers.values():
+            if layer.muted_at is None or not layer.is_loaded():
+                continue
+            left = layer.muted_at + NOISE_UNLOAD_DELAY_MS / 1000 - now
+            if left <= 0:
+                layer.unload()
+            else:
+                waiting.append(left)
+        if waiting:
+            self.unload_timer.start(int(min(waiting) * 1000) + 1)
+
+# === СОБЫТИЯ ЗВУКА ===
+class AudioEvents(QObject):
+    """Переводит событие pygame о конце трека в сигнал Qt.
+    Очередь SDL опрашивается только пока играет музыка или отслеживаемый канал; в тишине таймер стоит."""
+    POLL_INTERVAL_MS = 50
+    IDLE_POLLS = 2  # событие конца может прийти чуть позже, чем get_busy() станет False
+    MUSIC_END = pygame.USEREVENT + 1
+    music_finished = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.channels = []  # каналы, звук на которых держит опрос включённым
+        self.idle_polls = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.POLL_INTERVAL_MS)
+        self.timer.timeout.connect(self._poll)
+
+    def start(self):
+        """Вызывается сразу после запуска микшера."""
+        pygame.mixer.music.set_endevent(self.MUSIC_END)
+
+    def watch_channel(self, channel):
+        self.channels.append(channel)
+
+    def activate(self):
+        """Вызывается после любого запуска звука — включает опрос до наступления тишины."""
+        self.idle_polls = 0
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def is_busy(self):
+        return pygame.mixer.music.get_busy() or any(channel.get_busy() for channel in self.channels)
+
+    def _poll(self):
+        for event in pygame.event.get():
+            if event.type == self.MUSIC_END:
+                self.music_finished.emit()
+        if self.is_busy():
+            self.idle_polls = 0
+        else:
+            self.idle_polls += 1
+            if self.idle_polls >= self.IDLE_POLLS:
+                self.timer.stop()
+
+# === ПРЕДЗАГРУЗКА ТРЕКОВ ===
+class _PreloadSignals(QObject):
+    finished = pyqtSignal(str, object)
+
+class _PreloadJob(QRunnable):
+    """Читает файл трека в память в фоновом потоке, чтобы load() не ждал диска."""
+    def __init__(self, path, limit, signals):
+        super().__init__()
+        self.path = path
+        self.limit = limit
+        self.signals = signals
+
+    def run(self):
+        data = None
+        try:
+            if os.path.getsize(self.path) <= self.limit:
+                with open(self.path, "rb") as f:
+                    data = f.read()
+        except OSError as e:
+            print(f"❌ Track preload error: {e}")
+        self.signals.finished.emit(self.path, data)
+
+class TrackPreloader(QObject):
+    """Держит в памяти несколько ближайших треков (LRU с лимитом по байтам).
+    Слишком большие и нечитаемые файлы помечаются готовыми без данных — их pygame откроет с диска сам."""
+    MEMORY_LIMIT = 256 * 1024 * 1024
+    ready = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.memory = OrderedDict()  # путь -> bytes или None
+        self.memory_size = 0
+        self.pending = set()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.signals = _PreloadSignals()
+        self.signals.finished.connect(self._on_finished)
+
+    def is_ready(self, path):
+        return path in self.memory
+
+    def request(self, path):
+        if path in self.memory:
+            self.memory.move_to_end(path)
+            self.ready.emit(path)
+        elif path not in self.pending:
+            self.pending.add(path)
+            self.pool.start(_PreloadJob(path, self.MEMORY_LIMIT // 2, self.signals))
+
+    def source(self, path):
+        """Что передать в pygame.mixer.music.load/queue: поток из памяти или сам путь."""
+        data = self.memory.get(path)
+        if data is None:
+            return path
+        self.memory.move_to_end(path)
+        return io.BytesIO(data)
+
+    def _on_finished(self, path, data):
+        self.pending.discard(path)
+        self.memory[path] = data
+        self.memory_size += len(data or b"")
+        while self.memory_size > self.MEMORY_LIMIT and len(self.memory) > 1:
+            _, dropped = self.memory.popitem(last=False)
+            self.memory_size -= len(dropped or b"")
+        self.ready.emit(path)
+
+# === ВИЗУАЛИЗАТОР СПЕКТРА ===
+class SpectrumSource:
+    """Откуда визуализатор берёт PCM: играющий трек читается с диска в позиции воспроизведения
+    (нужен soundfile), иначе — свежий блок фонового микса. Вызывается только из потока анализа."""
+
+    def __init__(self, music_position, ambient_block):
+        self.music_position = music_position  # () -> (путь, секунды) или None
+        self.ambient_block = ambient_block    # (кадры) -> float32 моно или None
+        self.file = None
+        self.path = None
+
+    def read(self, frames):
+        position = self.music_position()
+        if position is not None and soundfile is not None:
+            block = self._read_music(*position, frames)
+            if block is not None:
+                return block
+        return self.ambient_block(frames)
+
+    def _read_music(self, path, seconds, frames):
+        try:
+            if path != self.path:
+                self.close()
+                self.path = path
+                self.file = soundfile.SoundFile(path)
+            if self.file is None:
+                return None
+            start = min(int(seconds * self.file.samplerate), self.file.frames - frames)
+            self.file.seek(max(0, start))
+            data = self.file.read(frames, dtype="float32", always_2d=True)
+            return data.mean(axis=1) if len(data) == frames else None
+        except Exception:
+            # Формат, которого нет в libsndfile: до смены трека файл больше не открываем
+            self.file = None
+            return None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.path = None
+
+class _SpectrumSignals(QObject):
+    frame = pyqtSignal(object)
+
+class _SpectrumWorker(threading.Thread):
+    """Считает спектр не чаще fps раз в секунду: окно Ханна, rfft по FFT_SIZE кадрам, логарифмические
+    полосы в дБ. Раз в секунду сверяет потраченное потоком время процессора с бюджетом и при перерасходе
+    снижает частоту кадров."""
+    FFT_SIZE = 2048
+    BANDS = 32
+    FLOOR_DB = -60.0
+    FALL = 0.85  # доля уровня, остающаяся от прошлого кадра, — полосы опадают плавно
+
+    def __init__(self, source, signals):
+        super().__init__(daemon=True)
+        self.source = source
+        self.signals = signals
+        self.stopped = threading.Event()
+        self.fps = VISUALIZER_FPS
+        self.cpu_load = 0.0  # доля одного ядра за последнюю секунду
+        self.window = np.hanning(self.FFT_SIZE).astype(np.float32)
+        edges = np.unique(np.geomspace(2, self.FFT_SIZE // 2, self.BANDS + 1).astype(int))
+        self.edges = edges[:-1]
+        self.levels = np.zeros(len(self.edges), dtype=np.float32)
+
+    def run(self):
+        try:
+            cpu_start, wall_start = time.thread_time(), time.monotonic()
+            next_frame = wall_start
+            while not self.stopped.is_set():
+                self.signals.frame.emit(self.analyze(self.source.read(self.FFT_SIZE)))
+                now = time.monotonic()
+                if now - wall_start >= 1.0:
+                    self.cpu_load = (time.thread_time() - cpu_start) / (now - wall_start)
+                    if self.cpu_load > VISUALIZER_CPU_BUDGET:
+                        self.fps = max(VISUALIZER_MIN_FPS, self.fps * 2 // 3)
+                    cpu_start, wall_start = time.thread_time(), now
+                next_frame = max(next_frame + 1.0 / self.fps, now)
+                self.stopped.wait(next_frame - now)
+        finally:
+            self.source.close()
+
+    def analyze(self, block):
+        self.levels *= self.FALL
+        if block is not None:
+            # Синус полной шкалы под окном Ханна даёт пик FFT_SIZE/4 — это 0 дБ
+            spectrum = np.abs(np.fft.rfft(block * self.window)) / (self.FFT_SIZE / 4)
+            bands = np.maximum.reduceat(spectrum[:self.FFT_SIZE // 2], self.edges)
+            levels = (20 * np.log10(bands + 1e-9) - self.FLOOR_DB) / -self.FLOOR_DB
+            np.maximum(self.levels, np.clip(levels, 0.0, 1.0), out=self.levels)
+        return self.levels.copy()
+
+    def stop(self):
+        self.stopped.set()
+
+class SpectrumWidget(QWidget):
+    """Полосы спектра в панели плеера. Поток анализа живёт, только пока виджет показан.
+    Каждый поток получает свой источник: остановленный может ещё дочитывать кадр, когда виджет уже показан снова."""
+    def __init__(self, make_source, parent=None):
+        super().__init__(parent)
+        self.make_source = make_source  # () -> SpectrumSource
+        self.worker = None
+        self.levels = np.zeros(0)
+        self.cpu_text = "{load:.1f}%"
+        self.signals = _SpectrumSignals()
+        self.signals.frame.connect(self._on_frame)
+        self.setFixedSize(120, 36)
+
+    def cpu_load(self):
+        return self.worker.cpu_load if self.worker is not None else 0.0
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.worker is None:
+            self.worker = _SpectrumWorker(self.make_source(), self.signals)
+            self.worker.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+        self.levels = np.zeros(0)
+
+    def _on_frame(self, levels):
+        if self.worker is None:
+            return
+        self.levels = levels
+        self.setToolTip(self.cpu_text.format(load=self.cpu_load() * 100))
+        self.update()
+
+    def paintEvent(self, event):
+        if not len(self.levels):
+            return
+        painter = QPainter(self)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(20, 200, 195, 180))
+        width, height = self.width(), self.height()
+        step = width / len(self.levels)
+        for i, level in enumerate(self.levels):
+            bar = max(1, int(height * level))
+            painter.drawRect(int(i * step), height - bar, max(int(step) - 1, 1), bar)
+
+# === ГРОМКОСТЬ ТРЕКОВ ===
+def _init_loudness_worker():
+    """Процесс анализа работает с пониженным приоритетом и без устройства вывода: pygame нужен только как декодер."""
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    try:
+        if hasattr(os, "nice"):
+            os.nice(10)
+        else:
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), 0x4000)  # BELOW_NORMAL_PRIORITY_CLASS
+    except Exception as e:
+        print(f"❌ Loudness worker priority error: {e}")
+
+def _decode_blocks(path, seconds=10):
+    """Трек кусками float32 (кадры, каналы) вместе с частотой: soundfile читает потоково, pygame — целиком."""
+    if soundfile is not None:
+        try:
+            f = soundfile.SoundFile(path)
+        except RuntimeError:
+            f = None  # формат, которого нет в libsndfile
+        if f is not None:
+            with f:
+                for block in f.blocks(blocksize=int(f.samplerate * seconds), dtype="float32", always_2d=True):
+                    yield block, f.samplerate
+            return
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    samples = pygame.sndarray.array(pygame.mixer.Sound(path))
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    rate = pygame.mixer.get_init()[0]
+    step = rate * seconds
+    for start in range(0, len(samples), step):
+        yield samples[start:start + step].astype(np.float32) / 32768, rate
+
+def measure_loudness(path):
+    """Интегральная громкость трека в LUFS по схеме ITU-R BS.1770: K-взвешивание, блоки 400 мс
+    с шагом 100 мс, абсолютный гейт -70 LUFS и относительный -10 LU. Фильтры K-взвешивания приближены
+    однополюсными: срез низов на 38 Гц и подъём +4 дБ выше 1.5 кГц. None — трек не удалось декодировать."""
+    try:
+        hops, energy, filled, states = [], 0.0, 0, None
+        for block, rate in _decode_blocks(path):
+            if states is None:
+                hop = rate // 10
+                low_pole = math.exp(-2 * math.pi * 38 / rate)
+                shelf_pole = math.exp(-2 * math.pi * 1500 / rate)
+                states = [np.zeros(block.shape[1]), np.zeros(block.shape[1])]
+            x = block.astype(np.float64)
+            low, states[0] = leaky_integrate(x * (1 - low_pole), low_pole, states[0], step=1024)
+            x -= low
+            mid, states[1] = leaky_integrate(x * (1 - shelf_pole), shelf_pole, states[1], step=1024)
+            x += 0.585 * (x - mid)
+            # Сумма квадратов по каналам, накопленная по отрезкам в 100 мс
+            power = np.einsum("ij,ij->i", x, x)
+            while len(power):
+                take = min(hop - filled, len(power))
+                energy += power[:take].sum()
+                filled += take
+                power = power[take:]
+                if filled == hop:
+                    hops.append(energy / hop)
+                    energy, filled = 0.0, 0
+        if len(hops) < 4:
+            return None
+        hops = np.array(hops)
+        blocks = (hops[:-3] + hops[1:-2] + hops[2:-1] + hops[3:]) / 4
+        blocks = blocks[blocks > 10 ** ((-70 + 0.691) / 10)]
+        if not len(blocks):
+            return None
+        threshold = -0.691 + 10 * math.log10(blocks.mean()) - 10
+        blocks = blocks[blocks > 10 ** ((threshold + 0.691) / 10)]
+        return round(-0.691 + 10 * math.log10(blocks.mean()), 2)
+    except Exception as e:
+        print(f"❌ Loudness analysis error {path}: {e}")
+        return None
+
+class _LoudnessSignals(QObject):
+    finished = pyqtSignal(str, object, object)  # путь, LUFS или None, исключение задачи (None — замер состоялся)
+
+class LoudnessAnalyzer(QObject):
+    """Очередь анализа громкости. Треки декодируются по одному в отдельном процессе с пониженным
+    приоритетом, так что воспроизведение и интерфейс не делят с ним ни GIL, ни ядро. Процесс создаётся
+    при первой задаче и закрывается, когда очередь пуста дольше IDLE_SHUTDOWN_MS."""
+    IDLE_SHUTDOWN_MS = 30000
+    analyzed = pyqtSignal(str, object)  # путь, LUFS или None
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.queue = deque()
+        self.queued = set()
+        self.running = None
+        self.executor = None
+        self.signals = _LoudnessSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(self.IDLE_SHUTDOWN_MS)
+        self.idle_timer.timeout.connect(self.shutdown)
+
+    def request(self, path, urgent=False):
+        """urgent — трек скоро заиграет: он встаёт в начало очереди."""
+        if path == self.running:
+            return
+        if path in self.queued:
+            if not urgent:
+                return
+            self.queue.remove(path)
+        self.queued.add(path)
+        if urgent:
+            self.queue.appendleft(path)
+        else:
+            self.queue.append(path)
+        self._next()
+
+    def _next(self):
+        if self.running is not None or not self.queue:
+            return
+        self.idle_timer.stop()
+        path = self.queue.popleft()
+        self.queued.discard(path)
+        for _ in range(2):
+            try:
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                                       initializer=_init_loudness_worker)
+                future = self.executor.submit(measure_loudness, path)
+                break
+            except BrokenProcessPool:
+                # Процесс упал, а пул это заметил только сейчас — создаём новый
+                self.executor = None
+            except Exception as e:
+                print(f"❌ Loudness worker error: {e}")
+                return
+        else:
+            print("❌ Loudness worker error: process pool is broken")
+            return
+        self.running = path
+        future.add_done_callback(lambda f, p=path: self._emit_finished(p, f))
+
+    def _emit_finished(self, path, future):
+        # Вызывается из служебного потока пула — в поток интерфейса результат уходит сигналом
+        error = CancelledError() if future.cancelled() else future.exception()
+        self.signals.finished.emit(path, None if error is not None else future.result(), error)
+
+    def _on_finished(self, path, loudness, error):
+        self.running = None
+        if isinstance(error, BrokenProcessPool):
+            # Упавший процесс (например, декодер на битом файле) ломает пул: все следующие submit тоже упадут
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if error is None:
+            self.analyzed.emit(path, loudness)
+        elif not isinstance(error, CancelledError):
+            # Без записи в индекс: трек проанализируется снова при следующем запросе
+            print(f"❌ Loudness analysis error {path}: {error!r}")
+        if self.queue:
+            self._next()
+        else:
+            self.idle_timer.start()
+
+    def shutdown(self):
+        self.idle_timer.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.running = None
+
+# === МИНИАТЮРЫ ВЛОЖЕНИЙ ===
+class _ThumbnailSignals(QObject):
+    finished = pyqtSignal(str, object, QImage, bool)  # путь, [размер, mtime, sha1], картинка, файл не менялся
+
+class _ThumbnailJob(QRunnable):
+    """Считает хэш содержимого и декодирует уменьшенную копию картинки в фоновом потоке.
+    current — (размер, mtime) уже показанной версии: если файл тот же, ничего не читается."""
+    def __init__(self, path, known, current, cache_dir, size, signals):
+        super().__init__()
+        self.path = path
+        self.known = known
+        self.current = current
+        self.cache_dir = cache_dir
+        self.size = size
+        self.signals = signals
+
+    def run(self):
+        stamp = None
+        image = QImage()
+        try:
+            st = os.stat(self.path)
+            if self.current == (st.st_size, st.st_mtime):
+                self.signals.finished.emit(self.path, None, image, True)
+                return
+            if self.known and self.known[0] == st.st_size and self.known[1] == st.st_mtime:
+                digest = self.known[2]
+            else:
+                sha = hashlib.sha1()
+                with open(self.path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        sha.update(chunk)
+                digest = sha.hexdigest()
+            stamp = [st.st_size, st.st_mtime, digest]
+            cache_path = os.path.join(self.cache_dir, f"{digest}_{self.size}.png")
+            if os.path.exists(cache_path):
+                image = QImage(cache_path)
+                os.utime(cache_path)  # mtime файла кэша — время последнего использования для очистки
+            if image.isNull():
+                reader = QImageReader(self.path)
+                reader.setAutoTransform(True)
+                original = reader.size()
+                if original.isValid():
+                    # JPEG и некоторые другие форматы умеют декодировать сразу в уменьшенном размере
+                    reader.setScaledSize(original.scaled(self.size * 2, self.size * 2, Qt.KeepAspectRatio))
+                image = reader.read()
+                if not image.isNull():
+                    image = image.scaled(self.size, self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                    image.save(cache_path, "PNG")
+        except Exception as e:
+            print(f"❌ Thumbnail error {self.path}: {e}")
+        self.signals.finished.emit(self.path, stamp, image, False)
+
+class _ThumbnailPruneJob(QRunnable):
+    """Удаляет давно не использованные миниатюры, пока дисковый кэш больше лимита."""
+    def __init__(self, cache_dir, limit):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.limit = limit
+
+    def run(self):
+        try:
+            files = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".png") and entry.is_file():
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.limit:
+                    break
+                os.remove(path)
+                total -= size
+        except OSError as e:
+            print(f"❌ Thumbnail cache prune error: {e}")
+
+class ThumbnailService(QObject):
+    """Миниатюры вложений: пул потоков, дисковый кэш по хэшу содержимого и LRU в памяти.
+    Показанная миниатюра и неудачная попытка помнят размер и mtime файла; фоновая проверка не чаще
+    раза в CHECK_INTERVAL секунд перечитывает изменённую картинку. Поток интерфейса к файлам не обращается."""
+    MEMORY_LIMIT = 256
+    CHECK_INTERVAL = 5.0
+    INDEX_LIMIT = 5000
+    DISK_LIMIT = 32 * 1024 * 1024
+
+    def __init__(self, cache_dir, size=40, parent=None):
+        super().__init__(parent)
+        self.cache_dir = cache_dir
+        self.size = size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.index = {}  # путь -> [размер, mtime, sha1]
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self.index = json.load(f)
+        except Exception as e:
+            print(f"❌ Thumbnail index error: {e}")
+        self.index_dirty = False
+        self.memory = OrderedDict()  # путь -> (размер, mtime, QPixmap)
+        self.failed = {}   # путь -> (размер, mtime) неудачной попытки; None — файла не было
+        self.waiting = {}  # путь -> [QLabel]
+        self.checked = {}  # путь -> time.monotonic() последней проверки
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(2)
+        self.pool.start(_ThumbnailPruneJob(cache_dir, self.DISK_LIMIT))
+        self.signals = _ThumbnailSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.placeholder = QPixmap(size, size)
+        self.placeholder.fill(Qt.transparent)
+        painter = QPainter(self.placeholder)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(255, 255, 255, 40))
+        painter.drawRoundedRect(0, 0, size, size, 4, 4)
+        painter.end()
+
+    def is_failed(self, path):
+        """Картинку не удалось прочитать; заодно в фоне проверяется, не исправлен ли файл с тех пор."""
+        if path not in self.failed:
+            return False
+        self._check(path, self.failed[path])
+        return True
+
+    def pixmap(self, path, label=None):
+        """Возвращает готовую миниатюру или заглушку; label получит картинку, когда она будет готова или обновится."""
+        entry = self.memory.get(path)
+        if entry is not None:
+            self.memory.move_to_end(path)
+            self._check(path, entry[:2], label)
+            return entry[2]
+        if path in self.failed:
+            self._check(path, self.failed[path], label)
+        else:
+            self._check(path, None, label, force=True)
+        return self.placeholder
+
+    def _check(self, path, current, label=None, force=False):
+        if path not in self.waiting:
+            now = time.monotonic()
+            if not force and now - self.checked.get(path, 0.0) < self.CHECK_INTERVAL:
+                return
+            self.checked[path] = now
+            self.waiting[path] = []
+            self.pool.start(_ThumbnailJob(path, self.index.get(path), current, self.cache_dir, self.size, self.signals))
+        if label is not None:
+            self.waiting[path].append(label)
+
+    def _on_finished(self, path, stamp, image, unchanged):
+        labels = self.waiting.pop(path, [])
+        if unchanged:
+            return
+        if stamp is not None and self.index.get(path) != stamp:
+            self.index.pop(path, None)
+            self.index[path] = stamp
+            while len(self.index) > self.INDEX_LIMIT:
+                del self.index[next(iter(self.index))]
+            self.index_dirty = True
+        if image.isNull():
+            self.memory.pop(path, None)
+            self.failed[path] = tuple(stamp[:2]) if stamp is not None else None
+            return
+        self.failed.pop(path, None)
+        pixmap = QPixmap.fromImage(image)
+        self.memory[path] = (stamp[0], stamp[1], pixmap)
+        self.memory.move_to_end(path)
+        while len(self.memory) > self.MEMORY_LIMIT:
+            self.memory.popitem(last=False)
+        for label in labels:
+            if not sip.isdeleted(label):
+                label.setPixmap(pixmap)
+
+    def save_index(self):
+        if not self.index_dirty:
+            return
+        try:
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(self.index, f)
+            self.index_dirty = False
+        except Exception as e:
+            print(f"❌ Thumbnail index save error: {e}")
+
 def set_app_icon():
     myappid = 'mycompany.myproduct.subproduct.version'
     ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
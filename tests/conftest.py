@@ -0,0 +1,27 @@
+import importlib.util
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+try:
+    import cv2  # noqa: F401 — модулю приложения нужны все его зависимости
+    import pygame  # noqa: F401
+    from PyQt5.QtCore import QCoreApplication
+except ImportError:
+    collect_ignore_glob = ["test_*.py"]
+else:
+    app = QCoreApplication.instance() or QCoreApplication([])
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def pf(tmp_path, monkeypatch):
+    """Модуль приложения, загруженный во временной папке: он создаёт data/, music/ и прочие папки в текущей."""
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location("project_focus", os.path.join(ROOT, "Project-focus.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,49 @@
+import os
+import shutil
+import time
+
+from PyQt5.QtCore import QCoreApplication
+
+
+def touch(*parts):
+    path = os.path.join(*parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+    return path
+
+
+def scan(library):
+    library.scan()
+    deadline = time.monotonic() + 10
+    while library.scanning and time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+    assert not library.scanning
+
+
+def test_folder_removed_between_sessions_is_pruned(pf):
+    kept = touch("music", "a.ogg")
+    gone = touch("music", "album", "b.ogg")
+    library = pf.MusicLibrary("library.json", ["music"])
+    scan(library)
+    assert kept in library and gone in library
+    library.save()
+
+    shutil.rmtree(os.path.join("music", "album"))
+    library = pf.MusicLibrary("library.json", ["music"])
+    scan(library)
+    assert kept in library
+    assert gone not in library
+
+
+def test_tracks_outside_roots_are_dropped_on_load(pf):
+    kept = touch("music", "a.ogg")
+    other = touch("other", "c.ogg")
+    library = pf.MusicLibrary("library.json", ["music", "other"])
+    scan(library)
+    assert other in library
+    library.save()
+
+    library = pf.MusicLibrary("library.json", ["music"])
+    assert kept in library
+    assert other not in library
@@ -0,0 +1,18 @@
+def test_insert_move_and_remove_keep_order(pf):
+    playlist = pf.Playlist("Main", ["a", "b", "c", "a"])
+    assert list(playlist) == ["a", "b", "c"]
+    playlist.insert("d", 1)
+    playlist.insert("c", 0)
+    playlist.remove("b")
+    assert list(playlist) == ["c", "a", "d"]
+    assert [playlist.position(path) for path in playlist] == [0, 1, 2]
+    assert "b" not in playlist and "d" in playlist
+
+
+def test_repeated_inserts_at_one_spot_rebalance(pf):
+    playlist = pf.Playlist("Main", ["first", "last"])
+    for i in range(200):
+        playlist.insert(f"t{i}", 1)
+    assert list(playlist)[0] == "first" and list(playlist)[-1] == "last"
+    assert list(playlist)[1:-1] == [f"t{i}" for i in reversed(range(200))]
+    assert max(len(rank) for rank, _ in playlist.order) <= pf.RANK_REBALANCE_LENGTH
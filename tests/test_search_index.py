@@ -0,0 +1,32 @@
+def test_prefix_matches_every_word_in_range(pf):
+    index = pf.SearchIndex()
+    for i in range(200):
+        index.update(f"doc{i}", f"re{i:03d}word")
+    index.update("review", "review the plan")
+    index.update("other", "plan only")
+    hits = index.search("re")
+    assert "review" in hits and len(hits) == 201
+    assert set(index.search("rev")) == {"review"}
+
+
+def test_exact_prefix_and_typo_scores(pf):
+    index = pf.SearchIndex()
+    index.update(1, "focus timer")
+    index.update(2, "focused work")
+    assert index.search("focus") == {1: 3, 2: 2}
+    assert index.search("fcous") == {1: 1}
+    assert index.search("fcous xyz") == {}
+    assert set(index.search("timr")) == {1}
+
+
+def test_updates_and_removals_between_searches(pf):
+    index = pf.SearchIndex()
+    index.update(1, "alpha beta")
+    assert set(index.search("al")) == {1}
+    index.update(1, "gamma")
+    index.update(2, "alpine")
+    index.discard(2)
+    index.update(3, "alpha")
+    assert set(index.search("al")) == {3}
+    assert set(index.search("gam")) == {1}
+    assert index.vocab == sorted(set(index.vocab))
@@ -0,0 +1,98 @@
+import json
+import random
+
+
+def test_rank_between_orders_random_inserts(pf):
+    rng = random.Random(1)
+    ranks = []
+    for _ in range(2000):
+        index = rng.randint(0, len(ranks))
+        before = ranks[index - 1] if index > 0 else None
+        after = ranks[index] if index < len(ranks) else None
+        rank = pf.rank_between(before, after)
+        assert pf.rank_valid(rank)
+        assert (before is None or before < rank) and (after is None or rank < after)
+        ranks.insert(index, rank)
+    assert ranks == sorted(ranks)
+
+
+def test_rank_keys_stay_short_at_column_ends(pf):
+    first = last = pf.rank_between()
+    for _ in range(10000):
+        last = pf.rank_between(last, None)
+        first = pf.rank_between(None, first)
+    assert len(last) <= 4 and len(first) <= 4
+
+
+def test_move_changes_only_the_moved_task(pf):
+    store = pf.TaskStore()
+    ids = [store.add(f"task {i}", column="todo") for i in range(5)]
+    ranks = {task_id: store.get(task_id)["rank"] for task_id in ids}
+    store.dirty.clear()
+    store.move(ids[4], "todo", 1)
+    assert [task["id"] for task in store.column_tasks("todo")] == [ids[0], ids[4], ids[1], ids[2], ids[3]]
+    assert store.dirty == {ids[4]}
+    assert all(store.get(task_id)["rank"] == ranks[task_id] for task_id in ids[:4])
+
+
+def snapshot(store):
+    return {column: [task["id"] for task in store.column_tasks(column)] for column in store.columns}, dict(store.tasks)
+
+
+def test_journal_replay_ignores_torn_last_line(pf, tmp_path):
+    tasks_path, journal_path = str(tmp_path / "tasks.json"), str(tmp_path / "tasks.journal")
+    store = pf.TaskStore()
+    ids = [store.add(f"task {i}", column="todo") for i in range(3)]
+    store.snapshot_stale = True
+    store.flush(tasks_path, journal_path)
+    store.move(ids[0], "done")
+    store.set_completed(ids[0], True)
+    store.remove(ids[1])
+    store.add("late", column="todo", index=0)
+    store.flush(tasks_path, journal_path)
+    expected = snapshot(store)
+    # Сбой посреди дозаписи: последняя строка журнала оборвана
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"put": dict(store.get(ids[2]), text="lost")})[:25])
+
+    loaded = pf.TaskStore.load(tasks_path, journal_path)
+    assert snapshot(loaded) == expected
+    assert loaded.get(ids[2])["text"] == "task 2"
+
+
+def test_flush_compacts_journal_into_snapshot(pf, tmp_path):
+    tasks_path, journal_path = str(tmp_path / "tasks.json"), str(tmp_path / "tasks.journal")
+    store = pf.TaskStore()
+    store.flush(tasks_path, journal_path)
+    for i in range(pf.TaskStore.JOURNAL_COMPACT_LINES + 1):
+        store.add(f"task {i}", column="todo")
+        store.flush(tasks_path, journal_path)
+    with open(journal_path, encoding="utf-8") as f:
+        assert len(f.readlines()) < pf.TaskStore.JOURNAL_COMPACT_LINES
+    assert snapshot(pf.TaskStore.load(tasks_path, journal_path)) == snapshot(store)
+
+
+def test_restore_puts_cards_back_in_place(pf):
+    store = pf.TaskStore()
+    ids = [store.add(f"task {i}", column="todo") for i in range(4)]
+    store.undo_record = {}
+    store.move(ids[0], "done")
+    store.remove(ids[2])
+    redo = store.restore(store.take_undo_record())
+    assert [task["id"] for task in store.column_tasks("todo")] == ids
+    store.restore(redo)
+    assert [task["id"] for task in store.column_tasks("todo")] == [ids[1], ids[3]]
+
+
+def test_undo_history_limit_and_redo_reset(pf):
+    history = pf.UndoHistory(limit=3)
+    for i in range(5):
+        history.push({"tasks": {f"t{i}": None}, "columns": None})
+    assert [next(iter(command["tasks"])) for command in history.undo_stack] == ["t2", "t3", "t4"]
+    history.redo_stack.append({"tasks": {}, "columns": None})
+    history.amend({"t4": {"id": "t4"}, "extra": None})
+    assert history.undo_stack[-1]["tasks"] == {"t4": None, "extra": None}
+    history.forget(["t3"])
+    assert history.undo_stack[1]["tasks"] == {}
+    history.push({"tasks": {}, "columns": None})
+    assert history.redo_stack == []
@@ -0,0 +1,30 @@
+import random
+
+
+def test_keys_fire_at_their_second_across_levels(pf):
+    start = 1_000_000
+    wheel = pf.TimerWheel(start)
+    rng = random.Random(2)
+    due = {}
+    for i in range(500):
+        due[i] = start + rng.choice([1, 2, 63, 64, 65, 4095, 4096, 300_000, 20_000_000]) + rng.randint(0, 100)
+        wheel.schedule(i, due[i])
+    wheel.cancel(0)
+    del due[0]
+    fired = {}
+    now = start
+    for step in sorted(set(due.values())):
+        # Тики бывают редкими: проверяем и шаг ровно в срок, и шаг с запасом
+        now = step if step % 2 else step + 5
+        for key in wheel.advance(now):
+            fired[key] = now
+    assert fired.keys() == due.keys()
+    assert all(due[key] <= fired[key] <= due[key] + 5 for key in fired)
+    assert len(wheel) == 0
+
+
+def test_past_due_fires_on_next_tick(pf):
+    wheel = pf.TimerWheel(100)
+    wheel.schedule("late", 50)
+    assert wheel.advance(100) == []
+    assert wheel.advance(101) == ["late"]